@@ -0,0 +1,198 @@
+'''
+Headless benchmark of the deploy pipeline (no kivy, no ros).
+Runs each stage of the pipeline on synthetic strokes for a range of map sizes and writes the
+per-stage timings and peak memory to a JSON file, so runs can be compared across versions:
+    python benchmark_pipeline.py [--maps 50x50 shelby] [--repeat 5] [--out bench_results.json]
+'''
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import cv2
+import scipy
+from scipy.ndimage import gaussian_filter
+
+from swarm_interface.strokes import StrokeStore
+from swarm_interface import distribution
+from swarm_interface.distribution import (rasterize_strokes, draw_distribution, normalize_distribution, overlay_distribution,
+                                          distribution_message, IncrementalDistribution)
+from swarm_interface.encoding import distribution_fields
+from swarm_interface.analytic import analytic_distribution, compare_distributions, LayeredDistribution
+from swarm_interface.fourier import fourier_fields, fourier_error
+
+FOURIER_K = 16 # coefficients per axis of the fourier stages
+
+# name: (background (rows, cols), map grid (width, height))
+MAPS = {
+    '10x10': ((684, 684), (10, 10)),         # ros_game_env_10_by_10.png
+    '50x50': ((845, 842), (50, 50)),         # ros_game_env_50_by_50.png
+    'shelby': ((378, 692), (450, 225)),      # shelby_raw.png
+    'large': ((3000, 4000), (800, 600)),     # a multi-thousand pixel background
+}
+RECT = (10, 10, 585, 579) # the drawing widget in the default 850x668 window
+
+
+def synthetic_strokes(n_strokes=20, n_points=200, seed=0, rect=RECT):
+    """ Random walk strokes, alternating attract and repel, inside rect. """
+    rng = np.random.default_rng(seed)
+    rx, ry, rw, rh = rect
+    store = StrokeStore()
+    for i in range(n_strokes):
+        x, y = rng.uniform(rx, rx + rw), rng.uniform(ry, ry + rh)
+        store.begin(('attract', 'repel')[i % 2], rng.uniform(2, 20), i, x, y)
+        for _ in range(n_points - 1):
+            x = min(max(x + rng.normal(0, 5), rx), rx + rw)
+            y = min(max(y + rng.normal(0, 5), ry), ry + rh)
+            store.append(x, y)
+    return store
+
+
+def measure(fn, repeat):
+    """ Runs fn repeat times and returns (last result, [seconds per run], peak bytes allocated by a run). """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    # memory is measured on a separate run, tracemalloc slows things down
+    # (it sees numpy's allocations, not the ones OpenCV makes internally)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, times, peak
+
+
+def benchmark_map(shape, map_size, store, repeat):
+    """ Per-stage timings of one map size. """
+    h, w = shape
+    background = np.full((h, w, 3), 128, dtype=np.uint8)
+    stages = []
+
+    def stage(name, fn):
+        result, times, peak = measure(fn, repeat)
+        stages.append(dict(
+            stage = name,
+            median_ms = float(np.median(times) * 1e3),
+            min_ms = float(np.min(times) * 1e3),
+            peak_kb = peak / 1024.0
+            ))
+        return result
+
+    # the steps of draw_distribution, one at a time
+    attract, repel = stage('rasterize', lambda: rasterize_strokes(store.strokes(), RECT, shape))
+    update = stage('blend', lambda: cv2.addWeighted(attract, 0.5, repel, 0.5, 0))
+    down = stage('downsample', lambda: cv2.resize(update, (int(w/distribution.DOWN_SAMPLE), int(h/distribution.DOWN_SAMPLE))))
+    smooth = stage('gaussian_filter', lambda: gaussian_filter(down, sigma=distribution.SIGMA))
+    grid = stage('resample', lambda: cv2.resize(smooth, tuple(map_size)))
+    val = stage('normalize', lambda: normalize_distribution(grid))
+    stage('heatmap', lambda: overlay_distribution(background, val))
+    msg, flat = stage('message', lambda: distribution_message(val, 'red'))
+    for encoding in ('json', 'float32', 'uint16'):
+        fields = stage('encode_' + encoding, lambda: distribution_fields(flat, encoding))
+        stage('serialize_' + encoding, lambda: json.dumps(dict(msg, **fields)))
+    grid_shape = (msg['map_width'], msg['map_height']) # how flat was raveled, (rows, cols) of the map grid
+    fields = stage('encode_fourier', lambda: fourier_fields(flat, grid_shape, FOURIER_K))
+    stage('serialize_fourier', lambda: json.dumps(dict(msg, **fields)))
+    fourier = fourier_error(np.reshape(flat, grid_shape), FOURIER_K)
+    fourier.update(message_bytes = len(json.dumps(dict(msg, **fields))))
+
+    # the whole thing, and the incremental path after one more stroke
+    total = stage('draw_distribution', lambda: draw_distribution(store, RECT, shape, map_size))
+    assert np.array_equal(total, grid), 'stages out of step with draw_distribution'
+
+    engine = IncrementalDistribution()
+    stage('incremental_rebuild', lambda: (engine.reset(), engine.update(store, RECT, shape, map_size)))
+
+    extra = synthetic_strokes(1, 50, seed=1)
+    def one_more_stroke():
+        grown = store.snapshot()
+        grown.begin(extra.mode(0), extra.width(0), -1, *extra.points(0)[0])
+        for x, y in extra.points(0)[1:]:
+            grown.append(x, y)
+        engine.reset()
+        engine.update(store, RECT, shape, map_size)
+        start = time.perf_counter()
+        engine.update(grown, RECT, shape, map_size)
+        return time.perf_counter() - start
+    times = [one_more_stroke() for _ in range(repeat)]
+    stages.append(dict(stage = 'incremental_one_stroke', median_ms = float(np.median(times) * 1e3), min_ms = float(np.min(times) * 1e3)))
+
+    # the analytic engine, and how far it is from the rendered pipeline
+    analytic = stage('analytic', lambda: analytic_distribution(store, RECT, shape, map_size))
+    agreement = compare_distributions(analytic, grid)
+
+    # the layered buffer: a rebuild, one more segment, and the same bits either way
+    layers = LayeredDistribution()
+    layered = stage('layered_rebuild', lambda: (layers.reset(), layers.update(store, RECT, shape, map_size))[1])
+    grown = store.snapshot()
+    points = iter(extra.points(0)[:repeat + 1]) # measure() runs it repeat + 1 times
+    def one_more_segment():
+        grown.append(*next(points))
+        return layers.update(grown, RECT, shape, map_size)
+    stage('layered_one_segment', one_more_segment)
+    assert np.array_equal(layers.update(grown, RECT, shape, map_size), LayeredDistribution().update(grown, RECT, shape, map_size)), \
+        'layered updates out of step with a rebuild'
+
+    message = dict(msg, **distribution_fields(flat, 'json'))
+    return dict(stages = stages, message_bytes = len(json.dumps(message)), analytic_agreement = agreement, fourier = fourier)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the deploy pipeline without kivy or ros')
+    parser.add_argument('--maps', nargs='+', choices=sorted(MAPS), default=sorted(MAPS), help='map sizes to run')
+    parser.add_argument('--strokes', type=int, default=20, help='number of synthetic strokes')
+    parser.add_argument('--points', type=int, default=200, help='points per synthetic stroke')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per stage')
+    parser.add_argument('--out', default='bench_results.json', help='where to write the results')
+    args = parser.parse_args(argv)
+
+    store = synthetic_strokes(args.strokes, args.points)
+    results = dict(
+        revision = git_revision(),
+        time = time.strftime('%Y-%m-%dT%H:%M:%S'),
+        python = platform.python_version(),
+        numpy = np.__version__,
+        opencv = cv2.__version__,
+        scipy = scipy.__version__,
+        strokes = args.strokes,
+        points = args.points,
+        repeat = args.repeat,
+        maps = {}
+        )
+    for name in args.maps:
+        shape, map_size = MAPS[name]
+        results['maps'][name] = dict(background = list(shape), map_size = list(map_size))
+        results['maps'][name].update(benchmark_map(shape, map_size, store, args.repeat))
+
+        print('{} (background {}x{}, grid {}x{})'.format(name, shape[1], shape[0], map_size[0], map_size[1]))
+        for row in results['maps'][name]['stages']:
+            print('  {:24s} {:10.3f} ms  {:>10s}'.format(row['stage'], row['median_ms'],
+                  '{:.0f} kB'.format(row['peak_kb']) if 'peak_kb' in row else ''))
+        agreement = results['maps'][name]['analytic_agreement']
+        median = {row['stage']: row['median_ms'] for row in results['maps'][name]['stages']}
+        print('  analytic vs pipeline: {:.1f}x the speed, total variation {total_variation:.4f}, max error {max_error:.3f}, correlation {correlation:.4f}'.format(
+              median['draw_distribution'] / median['analytic'], **agreement))
+        fourier = results['maps'][name]['fourier']
+        print('  fourier K={}: {message_bytes} bytes instead of {}, total variation {total_variation:.4f}, max error {max_error:.3f}'.format(
+              FOURIER_K, results['maps'][name]['message_bytes'], **fourier))
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('results written to {}'.format(args.out))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
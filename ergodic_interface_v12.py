@@ -20,7 +20,9 @@ from kivy.uix.image import Image as kvImage
 from kivy.uix.togglebutton import ToggleButton
 from kivy.uix.popup import Popup
 from kivy.uix.slider import Slider
-from kivy.graphics import Color, Rectangle, Line 
+from kivy.uix.stencilview import StencilView
+from kivy.graphics import Color, Rectangle, Line, Mesh, PushMatrix, PopMatrix, Translate, Scale, InstructionGroup
+from kivy.graphics.texture import Texture
 from kivy.uix.textinput import TextInput
 from kivy.properties import OptionProperty, ListProperty, StringProperty, BooleanProperty
 from kivy.clock import Clock
@@ -28,26 +30,72 @@ from kivy.core.window import Window, WindowBase
 
 # other python imports
 import numpy as np # not currently used anywhere uncommented
-import cv2 # not currently used anywhere uncommented
 # import matplotlib.pyplot as plt # for debugging
-import roslibpy # to interface with ros
-from scipy.ndimage import gaussian_filter # to smooth data
 import sys
+import time
+import socket
+
+# the kivy-free core, cv2/scipy/roslibpy are imported on first use (see swarm_interface/lazy.py)
+from swarm_interface.lazy import cv2, preload_in_background
+from swarm_interface.transport import ros_interface, POLICIES # to interface with ros
+from swarm_interface.distribution import draw_distribution, normalize_distribution, overlay_distribution, distribution_message, IncrementalDistribution # the deploy pipeline
+from swarm_interface.analytic import analytic_distribution, LayeredDistribution # the same, drawn on the down sampled grid (or stacked up in layers)
+from swarm_interface.strokes import StrokeRecorder, Simplifier, SIMPLIFY, ERASE # every stroke drawn, one source of truth for publishing and logging
+from swarm_interface.encoding import ENCODINGS # compact /tablet_comm payloads
+from swarm_interface.fourier import fourier_error # --fourier: how much the coefficients lose
+from swarm_interface.worker import LatestWorker, Throttle # runs the deploy pipeline off the main thread
+from swarm_interface.coord_log import CoordLog, coord_text # append-only log of the drawn coordinates
+from swarm_interface import journal # timestamped journal of touches and deploys, for replay and benchmarks
+from swarm_interface.assets import MapCache, texture_buffer # decoded map images (or memory-mapped pyramids), kept between deploys and map switches
+from swarm_interface.view import Viewport, Gesture # zoom and pan, strokes are kept in map coordinates
+from swarm_interface.mesh import MeshChunks, instance_triangles # finished strokes as a few triangle meshes per mode, agents as one
+from swarm_interface.feedback import AgentFeedback # --agents: both teams' poses and coverage, subscribed from ros
+from swarm_interface import metrics # opt-in timing histograms
+from contextlib import nullcontext
 
 # Arg parsing
 import argparse
 TEAM = 'None'                      # what team are you controlling?
 HOST = 'None'                      # are you hosting the testbed server/game?
 ADDRESS = 'None'                   # if HOST=no, what ip address will you be connecting to?
+TABLET_ID = ''                     # which tablet this is, when several play on one team (--tablet)
+TABLET_WEIGHT = 1                  # how much this tablet counts when a hub merges the team's tablets (--weight)
+TOPIC = '/tablet_comm'             # where the distribution is published (/tablet_comm_raw when a hub merges them)
 
 #config
 DRAWING_MODE = False
 #DEBUG_MODE = False
 DEBUG_MODE = 'None'  # set to true to run without ROS (include the --debug argument when running this script from the command line)
+VERBOSE_MODE = False # print a line for every message sent to ROS (--verbose)
+INCREMENTAL_MODE = False # only recompute the parts of the distribution touched by new strokes (--incremental)
+ANALYTIC_MODE = False # draw the strokes on the down sampled grid instead of rendering them at the background's size (--analytic)
+LAYERED_MODE = False # add strokes up as signed layers (overlapping attract pulls harder) instead of painting over (--layered)
+SMOOTH_SIGMA = None # blur of ANALYTIC_MODE in background pixels (None: same as the rendered pipeline)
+EXPORT_OVERLAY = False # also write the distribution overlay to dist.png on every deploy (--export-overlay)
+LIVE_OVERLAY = False # keep the "Distribution Overlay" popup up to date while it is open (--live-overlay)
+OVERLAY_SIZE = 1024 # longest side of the overlay shown in the popup, in pixels
+ENCODING = 'json' # how the distribution is packed into the message: json (plain float list), float32 or uint16 (base64 payload)
+COMPRESS = False # zlib compress the packed payload
+FOURIER_K = 0 # send the first K x K ergodic Fourier coefficients instead of the grid, and report their error (--fourier K)
+DELTA_MODE = False # send only the cells that changed since the last message, with a full keyframe every KEYFRAME_EVERY messages
+KEYFRAME_EVERY = 20
+STREAM_MODE = False # republish while drawing (uses the incremental pipeline), at most STREAM_RATE times a second
+STREAM_RATE = 5.0
+METRICS_MODE = False # time the hot paths into histograms, shown on screen (--metrics)
+METRICS_PORT = None # also serve them as prometheus text on http://localhost:METRICS_PORT/metrics
+METRICS_LOG = None # also append them to this (rotating) json log every METRICS_PERIOD seconds
+METRICS_PERIOD = 1.0
+SEND_QUEUE = 8 # messages waiting for the connection to ros before the oldest are dropped
+DROP_POLICY = 'coalesce' # what to drop when the send queue is full (see swarm_interface/transport.py)
+JOURNAL_PATH = None # record every touch event and deploy to this file (--journal), replay it with python -m swarm_interface.journal
+AGENT_OVERLAY = False # draw both teams' agents on the map and show their ergodic metric (--agents)
+AGENT_FPS = 30.0 # agent overlay redraws per second (at most, and only when something new came in)
 
 background_map_name = "ros_game_env_50_by_50.png"
 background_map_width = 50
 background_map_height = 50
+MAP_FILES = ( "game_env.png" , "shelby_raw.png" , "ros_game_env_10_by_10.png" , "ros_game_env_50_by_50.png" ) # decoded in the background at startup
+PREFETCH_DELAY = 1.0 # seconds the widget has to keep its size before the maps are prepared for it again
 
 #setup (note: you may want to comment out "fullscreen lines below if using an external monitor")
 cwd = os.path.dirname(os.path.realpath(__file__))
@@ -57,54 +105,17 @@ cwd = os.path.dirname(os.path.realpath(__file__))
 # Config.set('graphics', 'fullscreen', 'auto') # this might work depending on your system
 Window.size = (850, 668)
 max_height = Window.height*0.88
+LINE_CHUNK = 256 # points per kivy Line, longer strokes continue in a new Line so each update stays cheap
+STROKE_COLORS = { 'attract' : ( 0.0 , 0.0 , 1.0 ) , 'repel' : ( 0.0 , 1.0 , 0.0 ) } # repel is currently green, maybe change to red?
+ZOOM_STEP = 1.2 # zoom per mouse wheel click
+ERASER_RADIUS = 20 # radius of the eraser brush, in screen pixels (strokes it touches are erased whole)
+TEAM_COLORS = { 'red' : ( 230 , 40 , 40 ) , 'blue' : ( 40 , 120 , 255 ) } # agent markers, one pixel each of a texture strip
+AGENT_SIZE = 8 # agent marker radius, in screen pixels
+SIMPLIFY_MODE = 'none' # drop redundant touch samples as they come in: none, distance or dp (--simplify)
+SIMPLIFY_TOLERANCE = 0.1 # how far (in map cells) a dropped sample may be from the stroke that is kept
+COORD_FLUSH_PERIOD = 1.0 # seconds between flushes of the coordinate log (it is also flushed at the end of each stroke)
 
 
-class ros_interface(object):
-    """ Sets up the ros interface. """
-    def __init__(self): 
-        # self.client = roslibpy.Ros(host='192.168.1.217',port=9090) # manually change this if you have a different setup (wifi)
-        # self.client = roslibpy.Ros(host='192.168.137.2',port=9090) # manually change this if you have a different setup (hardwired)
-        # self.client = roslibpy.Ros(host='10.0.1.84',port=9090) # manually change this if you have a different setup (rover)
-
-        if (HOST == 'yes' or not HOST): #(not HOST means if the HOST variable has not been set from the command line)
-            self.client = roslibpy.Ros(host='localhost', port=9090)
-        elif (HOST == 'no'):
-            if (not ADDRESS): #we may not need to enter an ADDRESS if both the red and blue player are on the same network
-                sys.exit("Address should not be set to None if you are not host=no (you are not hosting the game, and therefore need to specify an ip address to connect to")
-            else:
-                self.client = roslibpy.Ros(host=ADDRESS, port=9090)
-        else:
-            print('HOST value is not valid, did you enter yes/no for HOST?')
-
-        self.publisher = roslibpy.Topic(self.client,'/tablet_comm','ergodic_humanswarmcollab_sim/tablet')
-        
-        self.client.run()
-
-        # initiate the connection service (will be different for red/blue players)
-        if (TEAM == 'red'):
-            self.connection_service_pub = roslibpy.Topic(self.client, 'red_connection_service', 'std_msgs/Empty')
-        elif (TEAM == 'blue'):
-            self.connection_service_pub = roslibpy.Topic(self.client, 'blue_connection_service', 'std_msgs/Empty')
-        else:
-            print('TEAM value not valid, did you enter red/blue?')
-            sys.exit("TEAM needs to be red/blue")
-        self.request = roslibpy.ServiceRequest()
-
-    # call the connection service
-    def call_connection_service(self):
-        print('Publishing an empty message to the connection service for your team ... ')
-        self.connection_service_pub.publish(roslibpy.Message())
-
-    def publish(self,msg):
-        if self.client.is_connected:
-            print('Publishing data')
-            self.publisher.publish(msg)
-            
-    
-    def __del__(self):
-        self.client.terminate()
-        
-
 # Main GUI interface
 class MainLayout ( BoxLayout ) :
         
@@ -122,14 +133,6 @@ class MainLayout ( BoxLayout ) :
     coordsAttract = ListProperty ( [] ) 
     coordsAttract = [ 'x.y' ] 
 
-    outputX = ListProperty ( [] ) 
-    outputX = []
-    outputY = ListProperty ( [] ) 
-    outputY = []
-    
-    coordsRepel = ListProperty ( [] ) 
-    coordsRepel = [ 'x.y' ] 
-
     coordsRestricted = ListProperty ( [] ) 
     coordsRestricted = [ 'x.y' ] 
     
@@ -238,6 +241,19 @@ class MainLayout ( BoxLayout ) :
 
         self.middleSideLayout.add_widget ( self.attractRow2 )  # FROM ABOVE
 
+        # erase single strokes, undo/redo strokes and erases
+        self.editRow = BoxLayout ( orientation = 'horizontal' , padding = 10 , size_hint_y = 0.75 )
+        self.erasetoggle = ToggleButton ( text = "Erase" , font_size = 25 , halign = 'center' , group = 'mode_selection' )
+        self.erasetoggle.bind ( on_press = self.toggleDrawState )
+        self.editRow.add_widget ( self.erasetoggle )
+        self.btnUndo = Button ( text = "Undo" , font_size = 25 )
+        self.btnUndo.bind ( on_press = self.callbackUndo )
+        self.editRow.add_widget ( self.btnUndo )
+        self.btnRedo = Button ( text = "Redo" , font_size = 25 )
+        self.btnRedo.bind ( on_press = self.callbackRedo )
+        self.editRow.add_widget ( self.btnRedo )
+        self.middleSideLayout.add_widget ( self.editRow )
+
         # self.restrictedButtonContainer = BoxLayout ( orientation = 'vertical' , padding = 10 ) 
         # self.middleSideLayout.add_widget ( self.restrictedButtonContainer  ) 
         # self.restrictedtoggle = ToggleButton ( text = "DRAW RESTRICTED AREA" , font_size = 25  , halign = 'center' , group = 'mode_selection' ) 
@@ -320,6 +336,7 @@ class MainLayout ( BoxLayout ) :
         self.mapConfigPopup.size_hint = ( 0.4 , 0.3 ) 
         self.btnLoadMap.bind ( on_press = self.callbackMap) 
             
+        self._printedLayout = None
         Clock.schedule_interval(self.updateDisplay, 0.1)
         
         
@@ -335,6 +352,8 @@ class MainLayout ( BoxLayout ) :
             self.infoPanel.text = "DRAWING AERIAL"
         elif self.repeltoggle.state == 'down' : 
             CURRENT_DRAW = 'repel'
+        elif self.erasetoggle.state == 'down' :
+            CURRENT_DRAW = ERASE
         # elif self.restrictedtoggle.state == 'down' :
         #     CURRENT_DRAW = 'restricted'
         else :
@@ -356,6 +375,7 @@ class MainLayout ( BoxLayout ) :
     #         CURRENT_DRAW = 'none'
     
     def updateDisplay ( self , event ) :
+        start = time.perf_counter ( )
         self.infoPanel.text = self.infoText 
         MainLayout.mapProperties["kivy_x_offset"] = int ( self.mainScreen.x ) 
         MainLayout.mapProperties["kivy_y_offset"] = int ( self.mainScreen.y ) 
@@ -363,11 +383,15 @@ class MainLayout ( BoxLayout ) :
         MainLayout.mapProperties["kivy_map_height"] = int ( self.mainScreen.height ) 
         MainLayout.mapProperties["map_width"] = int ( self.mainScreen.width - self.mainScreen.x )
         MainLayout.mapProperties["map_height"] = int ( self.mainScreen.height - self.mainScreen.y )
-        if DEBUG_MODE:
+        # only print when something moved, not ten times a second
+        if DEBUG_MODE and self._printedLayout != ( dict ( MainLayout.mapProperties ) , tuple ( Window.size ) ) :
+            self._printedLayout = ( dict ( MainLayout.mapProperties ) , tuple ( Window.size ) )
             print ( "x: " , MainLayout.mapProperties["kivy_x_offset"]  , ", y: " , MainLayout.mapProperties["kivy_y_offset"]  )
             print ( "kw: " , MainLayout.mapProperties["kivy_map_width"]  , ", kh: " , MainLayout.mapProperties["kivy_map_height"]  )
             print ( "mw: " , MainLayout.mapProperties["map_width"]  , ", mh: " , MainLayout.mapProperties["map_height"]  )
             print(Window.size)
+        if self.mainScreen.metrics :
+            self.mainScreen.metrics.since ( 'display_tick_seconds' , start )
         
                 
     # Method to export display as image 
@@ -387,26 +411,42 @@ class MainLayout ( BoxLayout ) :
         background_map_name = self.mapName.text
         background_map_width = int(self.mapWidth.text)
         background_map_height = int(self.mapHeight.text)
-        self.mainScreen.background.source = background_map_name
+        self.mainScreen.showMap ( background_map_name )
+        self.mainScreen.prefetchMaps ( ) # the others, for the grid size just chosen
         self.mainScreen.attemptPublish() # make sure params are correct (rviz/ccast should through an error if not?)
         return True
 
     def callbackRosConfig ( self, event ) :
-        self.distPlaceholder.source = 'dist.png'
-        self.distPlaceholder.reload()
+        self.showOverlay ( )
+        if LIVE_OVERLAY :
+            self.mainScreen.onDistribution = self.showOverlay
         self.rosConfigPopup.open() 
         return True
     
     def callbackRosConfigClose ( self, event ) :
+        self.mainScreen.onDistribution = None
         self.rosConfigPopup.dismiss() 
         return True
 
+    # put the overlay of the last deploy in the popup (the texture is reused, only its pixels change)
+    def showOverlay ( self ) :
+        texture = self.mainScreen.refreshOverlay ( )
+        if texture is not None :
+            self.distPlaceholder.texture = texture
+            self.distPlaceholder.canvas.ask_update ( )
+
     # Callback functions for attract buttons
     def callbackPublish( self , event ) : 
         self.mainScreen.attemptPublish()
 
     def callbackClear( self , event ) : 
         self.mainScreen.attemptClear()
+
+    def callbackUndo ( self , event ) :
+        self.mainScreen.attemptUndo ( )
+
+    def callbackRedo ( self , event ) :
+        self.mainScreen.attemptRedo ( )
     
     def callbackSlider_attract( self , event, location ) :
         MainLayout.draw_weight_attract = int(self.attractWeight.value)
@@ -423,21 +463,158 @@ class MainLayout ( BoxLayout ) :
     
     
 
-class DrawingWidget ( Widget ) :
+# histogram of each touch handler's time (METRICS_MODE)
+TOUCH_METRICS = { journal.DOWN : 'touch_down_seconds' , journal.MOVE : 'touch_move_seconds' , journal.UP : 'touch_up_seconds' }
+
+class DrawingWidget ( StencilView ) : # strokes and the zoomed map stay inside the widget
     
     
     def __init__ ( self , **kwargs ) :
         
         super ( DrawingWidget , self ).__init__ ()
+        self.metrics = metrics.Metrics ( ) if METRICS_MODE else None
         if DEBUG_MODE == False: 
-            self.ros = ros_interface()
-
+            self.ros = ros_interface ( TEAM , HOST , ADDRESS , delta = DELTA_MODE , keyframe_every = KEYFRAME_EVERY , encoding = ENCODING , compress = COMPRESS ,
+                                       queue_size = SEND_QUEUE , policy = DROP_POLICY , metrics = self.metrics , topic = TOPIC , fourier = FOURIER_K ,
+                                       verbose = VERBOSE_MODE )
+
+        self.recorder = StrokeRecorder( simplifier = Simplifier ( SIMPLIFY_MODE ) ) # touch -> stroke logic, in map coordinates
+        self.store = self.recorder.store
+        # strokes in progress are kivy Lines kept in their touch's ud (any number of fingers draw at once), finished ones
+        # go into one set of Meshes per mode. Touch handlers only note what changed, the canvas follows once a frame
+        self.liveTouches = { } # touch uid -> touch, for the strokes in progress
+        self.finishedTouches = [ ] # touches whose strokes ended since the last flush
+        self.dirtyModes = set ( ) # modes whose meshes are rebuilt at the next flush (strokes erased, undone or redone)
+        self.meshChunks = { mode : MeshChunks ( ) for mode in STROKE_COLORS } # triangles of the finished strokes
+        self.meshes = { mode : [ ] for mode in STROKE_COLORS } # and their Mesh instructions
+        self.canvasTrigger = Clock.create_trigger ( lambda dt : self.flushCanvas ( ) ) # at most once a frame
+
+        # the map and the strokes are drawn in map coordinates, zoom and pan only change viewTranslate/viewScale
+        self.view = Viewport ( ( 1 , 1 ) , ( self.x , self.y , self.width , self.height ) )
+        self.gesture = Gesture ( self.view ) # one finger pans, two pinch zoom (when not drawing)
+        self.viewTexture = None # the visible part of the map, only that is uploaded
+        self.refreshViewTrigger = Clock.create_trigger ( lambda dt : self.refreshView ( ) ) # at most once a frame
         with self.canvas:
-            self.background = Rectangle ( source = background_map_name, size = (max_height,max_height), pos = (10,10) ) #size = self.size, pos = self.pos
-        
-        # self.bind ( pos = self.updateBackground , size = self.updateBackground )         
-
-        self.objects = []
+            PushMatrix ( )
+            self.viewTranslate = Translate ( 0 , 0 )
+            self.viewScale = Scale ( 1 , 1 , 1 )
+            self.background = Rectangle ( )
+            self.strokeGroup = InstructionGroup ( ) # the strokes: a Color and Meshes per mode, then the live Lines
+            self.agentGroup = InstructionGroup ( ) # AGENT_OVERLAY's markers
+            PopMatrix ( )
+        self.meshGroups = { }
+        for mode , color in STROKE_COLORS.items ( ) :
+            self.meshGroups [ mode ] = InstructionGroup ( )
+            self.meshGroups [ mode ].add ( Color ( *color ) )
+            self.strokeGroup.add ( self.meshGroups [ mode ] )
+        self.liveGroup = InstructionGroup ( )
+        self.strokeGroup.add ( self.liveGroup )
+
+        # AGENT_OVERLAY: poses come in and are decimated on AgentFeedback's thread, all agents are one Mesh
+        # (its texture is a strip of the team colors) redrawn at most AGENT_FPS times a second
+        self.feedback = None
+        if AGENT_OVERLAY and DEBUG_MODE == False :
+            self.feedback = AgentFeedback ( self.ros.client , ( background_map_height , background_map_width ) , metrics = self.metrics )
+            teamColors = Texture.create ( size = ( len ( self.feedback.teams ) , 1 ) , colorfmt = 'rgb' )
+            teamColors.blit_buffer ( bytes ( bytearray ( c for team in self.feedback.teams for c in TEAM_COLORS [ team ] ) ) , colorfmt = 'rgb' , bufferfmt = 'ubyte' )
+            teamColors.mag_filter = teamColors.min_filter = 'nearest'
+            self.agentMesh = Mesh ( mode = 'triangles' , texture = teamColors )
+            self.agentGroup.add ( Color ( 1 , 1 , 1 ) )
+            self.agentGroup.add ( self.agentMesh )
+            self.agentKey = None
+            self.agentLabel = Label ( text = '' , font_size = 13 , color = ( 1 , 1 , 1 , 1 ) , halign = 'right' , valign = 'bottom' )
+            self.add_widget ( self.agentLabel )
+            Clock.schedule_interval ( lambda dt : self.updateAgents ( ) , 1.0 / AGENT_FPS )
+
+        # decoded maps (or memory-mapped pyramids), shared by the display and the publish worker
+        self.maps = MapCache ( )
+        self.mapAsset = None
+        self.journal = None # opened further down
+        self.showMap ( background_map_name )
+        self.prefetchMaps ( )
+        self.prefetchTrigger = Clock.create_trigger ( lambda dt : self.prefetchMaps ( ) , PREFETCH_DELAY ) # again once the window has settled on a size
+        self.bind ( pos = self.updateBackground , size = self.updateBackground )
+
+        # the last deployed distribution, drawn over its map only when someone looks at it
+        self.latestDistribution = None # (map name, normalized grid)
+        self.distributionVersion = 0
+        self.overlayVersion = 0
+        self.overlayTexture = None
+        self.onDistribution = None # called after every deploy (the popup's live refresh)
+        self.incremental = IncrementalDistribution() # cached grids for INCREMENTAL_MODE (only used on the publish worker)
+        self.layered = LayeredDistribution() # accumulation buffer for LAYERED_MODE (the same)
+        self.fourierReported = set() # grid sizes whose --fourier error was printed
+
+        # deploys run on this thread, tapping Deploy again while one runs replaces the waiting one
+        self.publishWorker = LatestWorker ( post = lambda callback , result : Clock.schedule_once ( lambda dt : callback ( result ) ) , name = 'publish' )
+        preload_in_background ( ) # import cv2/scipy now, off the main thread, so the first deploy doesn't pay for it (not on publishWorker, where a deploy would replace it)
+
+        # drawn coordinates are appended to coord_output.bin, coord_output.txt is rebuilt from it on exit
+        self.coordLog = CoordLog ( cwd+'/coord_output.bin' )
+        self.journal = journal.Journal ( JOURNAL_PATH ) if JOURNAL_PATH else None
+        self.journalConfig ( )
+        Clock.schedule_interval ( lambda dt : self.flushLogs ( ) , COORD_FLUSH_PERIOD )
+
+        # in STREAM_MODE strokes are published as they are drawn, updates in between are coalesced
+        self.streamPublish = Throttle ( self.attemptPublish , STREAM_RATE , lambda callback , delay : Clock.schedule_once ( lambda dt : callback ( ) , delay ) )
+
+        # METRICS_MODE: histograms of the hot paths, summarized over the drawing
+        self.metricsServer = self.metricsLog = None
+        if self.metrics :
+            if METRICS_PORT :
+                self.metricsServer = metrics.serve ( self.metrics , METRICS_PORT )
+            if METRICS_LOG :
+                self.metricsLog = metrics.JsonLog ( self.metrics , METRICS_LOG )
+            self.metricsLabel = Label ( text = '' , font_size = 13 , color = ( 1 , 1 , 0 , 1 ) , halign = 'left' , valign = 'top' )
+            self.add_widget ( self.metricsLabel )
+            Clock.schedule_interval ( lambda dt : self.metrics.observe ( 'frame_seconds' , dt ) , 0 ) # every frame
+            Clock.schedule_interval ( lambda dt : self.showMetrics ( ) , METRICS_PERIOD )
+
+    # show a map (from the cache if it was opened before), zoomed out to fit
+    def showMap ( self , map_name ) :
+        try :
+            asset = self.maps.get ( map_name )
+        except IOError as e :
+            print ( e )
+            return
+        self.mapAsset = asset
+        self.view.set_extent ( asset.extent )
+        self.recorder.rect = ( 0 , 0 ) + tuple ( asset.extent ) # strokes are kept in map pixels
+        self.recorder.simplifier.tolerance = SIMPLIFY_TOLERANCE * asset.extent [ 0 ] / float ( background_map_width ) # map cells -> map pixels
+        self.applyView ( )
+        self.refreshView ( )
+        self.journalConfig ( ) # a new map (or grid size) from here on
+
+    # decode the other maps in the background, with the resample matrices of the current grid size and
+    # the picture each one shows when it is switched to (fitted to the widget), so a switch finds them ready
+    def prefetchMaps ( self ) :
+        self.maps.prefetch ( [ name for name in MAP_FILES if name != background_map_name ] ,
+                             map_size = ( background_map_width , background_map_height ) ,
+                             display_size = lambda asset : Viewport ( asset.extent , self.view.rect ).pixels ( ) )
+
+    # move the map and the strokes to where the viewport says (cheap, no pixels change)
+    def applyView ( self ) :
+        s = self.view.scale
+        self.viewTranslate.xy = self.view.offset
+        self.viewScale.xyz = ( s , s , 1 )
+
+    # upload the visible part of the map at screen resolution (into one texture the size of the widget)
+    def refreshView ( self ) :
+        if self.mapAsset is None :
+            return
+        with self.timer ( 'view_refresh_seconds' ) :
+            x0 , y0 , x1 , y1 = region = self.view.visible ( )
+            size = ( max ( 1 , int ( self.width ) ) , max ( 1 , int ( self.height ) ) )
+            pixels = self.view.pixels ( )
+            if self.viewTexture is None or tuple ( self.viewTexture.size ) != size :
+                self.viewTexture = Texture.create ( size = size , colorfmt = 'rgb' )
+            buf = texture_buffer ( self.mapAsset.view ( region , pixels ) )
+            self.viewTexture.blit_buffer ( buf.tobytes ( ) , size = pixels , colorfmt = 'rgb' , bufferfmt = 'ubyte' )
+            u , v = pixels [ 0 ] / float ( size [ 0 ] ) , pixels [ 1 ] / float ( size [ 1 ] )
+            self.background.texture = self.viewTexture
+            self.background.tex_coords = ( 0 , 0 , u , 0 , u , v , 0 , v )
+            self.background.pos = ( x0 , y0 )
+            self.background.size = ( x1 - x0 , y1 - y0 )
 
     def attemptPlayerConnect(self):
         self.ros.call_connection_service()
@@ -460,158 +637,405 @@ class DrawingWidget ( Widget ) :
         # cv2.imwrite ( "rgb_output.png" , result)
         
     def attemptPublish ( self ) :
-        # remove background to save drawing then redraw
-        self.background.source = ""
-        self.export_to_png( "drawing.png" )
-        self.background.source = background_map_name
-
-        # load figures
-        background = cv2.imread( background_map_name , 1) # 1 = color, 0 = grayscale
-        draw = cv2.imread("drawing.png",1) # color order BGR
-        attract = draw[:,:,0] # blue
-        repel = cv2.bitwise_not(draw[:,:,1]) # green, invert image (hvt/ee instead of ied/dd)
-        total = cv2.addWeighted(attract,0.5,repel,0.5,0) # sum again
-
-        # resize figures to match
+        start = time.perf_counter ( )
+        if self.journal :
+            self.journalConfig ( )
+            self.journal.record ( journal.DEPLOY , start )
+        # copy what the worker needs now, the drawing keeps changing while it runs
+        job = ( self.store.snapshot() , self.recorder.rect ,
+                background_map_name , ( background_map_width , background_map_height ) , start )
+        self.publishWorker.submit ( self.computePublish , job , on_done = self.publishDone )
+        if self.metrics :
+            self.metrics.since ( 'deploy_request_seconds' , start )
+
+    # a timer for one stage of the hot path (does nothing unless METRICS_MODE)
+    def timer ( self , name ) :
+        return self.metrics.timer ( name ) if self.metrics else nullcontext ( )
+
+    # runs on the publish worker thread, so no kivy calls in here
+    def computePublish ( self , job ) :
+        store, rect, map_name, map_size, requested = job
+
+        # load figures (decoded once per map, not on every deploy)
+        with self.timer('deploy_load_seconds'):
+            background = self.maps.get ( map_name ).image
         h,w,_ = background.shape 
-        update = cv2.resize(total,(w,h))
 
-        # smooth out
-        down_sample = cv2.resize(update,(int(w/5),int(h/5)))
-        smooth = gaussian_filter(down_sample,sigma=2)
-        up_sample = cv2.resize(smooth,(background_map_width,background_map_height)) # manually updated to match shelby map
+        with self.timer('deploy_distribution_seconds'):
+            if LAYERED_MODE:
+                # strokes add up in a float buffer on the blur grid, only new segments are added
+                up_sample = self.layered.update(store, rect, (h, w), map_size)
+            elif ANALYTIC_MODE:
+                # no screen sized images at all, cost follows the map grid and the strokes
+                up_sample = analytic_distribution(store, rect, (h, w), map_size, SMOOTH_SIGMA)
+            elif INCREMENTAL_MODE or STREAM_MODE:
+                # only re-blur the tiles touched since the last deploy
+                up_sample = self.incremental.update(store, rect, (h, w), map_size)
+            else:
+                up_sample = draw_distribution(store, rect, (h, w), map_size)
 
         # normalize to send to ros
-        val = np.array(up_sample.copy(),dtype = np.float32)
-        if np.sum(val) > 0: # error handling for empty page
-            val /= np.sum(val)
-
-        # scale back up for cv2 
-        target_dist = val.copy()
-        target_dist -= np.min(target_dist) # shift min to 0
-        if np.max(target_dist) > 0: # error handling for empty map
-            target_dist /= np.max(target_dist) # normalize max to 1
-        target_dist *= 255 # rescale to 255 (RGB range)
-        target_dist = np.array(target_dist,dtype=np.uint8) 
-
-        # colormap
-        up_sample_vis = cv2.resize(target_dist,(w,h))
-        heatmap = cv2.applyColorMap(up_sample_vis,9) # heatmaps are 0-12
-
-        # overlap and save
-        out = cv2.addWeighted(background,0.5,heatmap,0.8,0)
-        cv2.imwrite('dist.png',out)
+        with self.timer('deploy_normalize_seconds'):
+            val = normalize_distribution(up_sample)
+
+        # overlap and save (the popup draws its own overlay from the grid, see refreshOverlay)
+        if EXPORT_OVERLAY:
+            with self.timer('deploy_export_seconds'):
+                out = overlay_distribution(background, val)
+                cv2.imwrite('dist.png',out)
+        dist = (map_name, val)
 
         # save message
-        val = np.flipud(val)
-        width,height = val.shape
-        val = val.ravel()
-
-        #val = val * 1000 #trying to make sure all info values are > 10^4 (does not work otherwise)
-        #val = val*100000  #val needs to be this big for the gridmap msg to visually appear in rviz
-        val = val*10
-        
-        msg = dict(
-            name = 'attract data',
-            team = TEAM,
-            data = val.tolist(),
-            map_width = width, 
-            map_height = height
-            )
-        if DEBUG_MODE == False:
-            self.ros.publish(msg)
-        else:
+        with self.timer('deploy_message_seconds'):
+            msg, val = distribution_message(val, TEAM)
+            msg.update(tablet = TABLET_ID, weight = TABLET_WEIGHT) # for swarm_interface.hub when several tablets share a team
+            if DEBUG_MODE == False:
+                self.ros.publish_distribution(msg, val) # fills in data (or the packed/delta/fourier fields)
+        # what the coefficients lose: every deploy into the metrics, otherwise printed once per grid size (of a drawing, not the blank map)
+        grid_size = (msg['map_width'], msg['map_height'])
+        if FOURIER_K and len(store) and (self.metrics or grid_size not in self.fourierReported):
+            with self.timer('deploy_fourier_report_seconds'):
+                report = fourier_error(np.reshape(val, grid_size), FOURIER_K)
+            if self.metrics:
+                self.metrics.observe('fourier_total_variation', report['total_variation'])
+                self.metrics.observe('fourier_max_error', report['max_error'])
+            else:
+                self.fourierReported.add(grid_size)
+                print('fourier K={}: {numbers} numbers instead of {cells}, total variation {total_variation:.4f}, max error {max_error:.3f}'.format(FOURIER_K, **report))
+        if self.journal:
+            self.journal.record(journal.PUBLISHED, time.perf_counter())
+        if self.metrics:
+            self.metrics.since('deploy_seconds', requested) # from Deploy (or a stream update) to the message being queued
+        return msg, dist
+
+    # back on the main thread once a deploy went through
+    def publishDone ( self , result ) :
+        msg , self.latestDistribution = result
+        self.distributionVersion += 1
+        if self.feedback :
+            self.feedback.set_target ( np.flipud ( self.latestDistribution [ 1 ] ) ) # the agents' grid has row 0 at the bottom
+        if self.onDistribution :
+            self.onDistribution ( )
+        if DEBUG_MODE != False:
             MainLayout.infoText = str ('NOTE: Not publishing to ros because DEBUG_MODE is enabled') 
+
+    # texture with the last deployed distribution over its map (None before the first deploy)
+    def refreshOverlay ( self ) :
+        if self.latestDistribution is None :
+            return None
+        if self.overlayVersion != self.distributionVersion :
+            map_name , val = self.latestDistribution
+            asset = self.maps.get ( map_name )
+            rows , cols = asset.shape
+            fit = min ( 1.0 , OVERLAY_SIZE / float ( max ( rows , cols ) ) ) # the popup doesn't need more pixels than this
+            size = ( max ( 1 , int ( cols * fit ) ) , max ( 1 , int ( rows * fit ) ) )
+            buf = texture_buffer ( overlay_distribution ( asset.scaled ( size ) , val ) )
+            if self.overlayTexture is None or tuple ( self.overlayTexture.size ) != size :
+                self.overlayTexture = Texture.create ( size = size , colorfmt = 'rgb' )
+            self.overlayTexture.blit_buffer ( buf.tobytes ( ) , colorfmt = 'rgb' , bufferfmt = 'ubyte' )
+            self.overlayVersion = self.distributionVersion
+        return self.overlayTexture
             
 
+    # redraw the agent markers when a new snapshot came in, or the zoom changed (they keep their size on screen)
+    def updateAgents ( self ) :
+        snapshot = self.feedback.latest ( )
+        key = ( snapshot.version , self.view.scale , self.view.extent , tuple ( self.size ) )
+        if key == self.agentKey :
+            return
+        self.agentKey = key
+        with self.timer ( 'agents_draw_seconds' ) :
+            rows , cols = self.feedback.shape
+            cell = np.array ( [ self.view.extent [ 0 ] / float ( cols ) , self.view.extent [ 1 ] / float ( rows ) ] ) # map cells -> map pixels
+            teams = self.feedback.teams
+            vertices = np.concatenate ( [ instance_triangles ( snapshot.agents [ team ] [ : , : 2 ] * cell , snapshot.agents [ team ] [ : , 2 ] ,
+                                                               AGENT_SIZE / self.view.scale , ( k + 0.5 ) / len ( teams ) ) for k , team in enumerate ( teams ) ] )
+            self.agentMesh.vertices = vertices.ravel ( ).tolist ( )
+            self.agentMesh.indices = list ( range ( len ( vertices ) ) )
+            self.agentLabel.pos = self.pos
+            self.agentLabel.size = self.size
+            self.agentLabel.text_size = self.size
+            self.agentLabel.text = '   '.join ( '{} {}: {}'.format ( team , len ( snapshot.agents [ team ] ) ,
+                                                 'ergodic metric {:.4f}'.format ( snapshot.metrics [ team ] ) if snapshot.metrics [ team ] is not None else 'no metric yet' ) for team in teams )
+
     def attemptClear ( self ) :
-        MainLayout.outputX = []
-        MainLayout.outputY = []
-        while len(self.objects) > 0: 
-            item = self.objects.pop(-1)
-            self.canvas.remove(item)
+        self.recorder.clear()
+        self.clearStrokes ( )
+        self.coordLog.clear()
+        if self.journal :
+            self.journal.record ( journal.CLEAR , time.perf_counter ( ) )
         if DEBUG_MODE: 
             MainLayout.infoText = str ('Screen successfully cleared') 
 
+    def attemptUndo ( self ) :
+        changed = self.recorder.undo ( )
+        if changed :
+            if self.journal :
+                self.journal.record ( journal.UNDO , time.perf_counter ( ) )
+            self.strokesChanged ( *changed )
+
+    def attemptRedo ( self ) :
+        changed = self.recorder.redo ( )
+        if changed :
+            if self.journal :
+                self.journal.record ( journal.REDO , time.perf_counter ( ) )
+            self.strokesChanged ( *changed )
+
+    # strokes were erased, undone or redone: the meshes of their modes are rebuilt at the next flush
+    def strokesChanged ( self , strokes , visible ) :
+        if not strokes :
+            return
+        self.dirtyModes.update ( self.store.mode ( i ) for i in strokes )
+        self.canvasTrigger ( )
+        if STREAM_MODE :
+            self.streamPublish ( )
+
+    def clearStrokes ( self ) :
+        self.liveGroup.clear ( )
+        self.liveTouches = { }
+        self.finishedTouches = [ ]
+        self.dirtyModes = set ( )
+        for mode in STROKE_COLORS :
+            self.meshChunks [ mode ].clear ( )
+            self.uploadMeshes ( mode , [ ] )
+
+    # once a frame: bring the live Lines up to date, and move finished strokes into the meshes (rebuilding the dirty ones)
+    def flushCanvas ( self ) :
+        with self.timer ( 'canvas_flush_seconds' ) :
+            for touch in self.liveTouches.values ( ) :
+                self.updateLiveLine ( touch )
+            changed = { mode : set ( ) for mode in STROKE_COLORS }
+            live = set ( touch.ud [ 'stroke' ] for touch in self.liveTouches.values ( ) )
+            for mode in self.dirtyModes :
+                chunks = self.meshChunks [ mode ]
+                chunks.clear ( )
+                for i in np.flatnonzero ( self.store.visibility ( ) ) :
+                    if self.store.mode ( i ) == mode and i not in live :
+                        chunks.add ( self.store.points ( i ) , self.store.width ( i ) )
+                changed [ mode ] = set ( range ( len ( chunks.chunks ) ) )
+            for touch in self.finishedTouches :
+                if touch.ud [ 'shown' ] :
+                    self.liveGroup.remove ( touch.ud [ 'group' ] )
+                i , mode = touch.ud [ 'stroke' ] , touch.ud [ 'mode' ]
+                if mode not in self.dirtyModes and self.store.visible ( i ) :
+                    changed [ mode ].update ( self.meshChunks [ mode ].add ( self.store.points ( i ) , self.store.width ( i ) ) )
+            self.finishedTouches = [ ]
+            self.dirtyModes = set ( )
+            for mode , chunks in changed.items ( ) :
+                if chunks or len ( self.meshes [ mode ] ) > len ( self.meshChunks [ mode ].chunks ) : # the latter when a mode's last strokes went
+                    self.uploadMeshes ( mode , chunks )
+
+    # hand the changed chunks of a mode's triangles to its Meshes (adding or dropping Meshes to match)
+    def uploadMeshes ( self , mode , chunks ) :
+        meshes = self.meshes [ mode ]
+        triangles = self.meshChunks [ mode ].chunks
+        while len ( meshes ) > len ( triangles ) :
+            self.meshGroups [ mode ].remove ( meshes.pop ( ) )
+        for k in sorted ( chunks ) :
+            if k == len ( meshes ) :
+                meshes.append ( Mesh ( mode = 'triangles' ) )
+                self.meshGroups [ mode ].add ( meshes [ k ] )
+            vertices , indices = triangles [ k ]
+            meshes [ k ].vertices = vertices.ravel ( ).tolist ( )
+            meshes [ k ].indices = indices.tolist ( )
+
+    # add the points the simplifier kept to the touch's Line, and draw on to the sample it holds back (tip)
+    def updateLiveLine ( self , touch ) :
+        ud = touch.ud
+        shown = self.store.visible ( ud [ 'stroke' ] )
+        if shown != ud [ 'shown' ] : # erased (or put back) while it is being drawn
+            if shown :
+                self.liveGroup.add ( ud [ 'group' ] )
+            else :
+                self.liveGroup.remove ( ud [ 'group' ] )
+            ud [ 'shown' ] = shown
+        for x , y in ud [ 'pending' ] :
+            if len ( ud [ 'points' ] ) >= 2*LINE_CHUNK :
+                # carry on in a fresh Line (same color) so we never copy the whole stroke
+                ud [ 'points' ] = ud [ 'points' ] [ -2: ]
+                ud [ 'line' ] = Line ( points = ud [ 'points' ] , width = ud [ 'width' ] )
+                ud [ 'group' ].add ( ud [ 'line' ] )
+            ud [ 'points' ].extend ( ( x , y ) )
+        ud [ 'pending' ] = [ ]
+        ud [ 'line' ].points = ud [ 'points' ] + list ( ud [ 'tip' ] ) if ud [ 'tip' ] else ud [ 'points' ]
+
     def updateBackground ( self , instance , value ) :
-        self.background.pos = self.pos
-        self.background.size = self.size
-        # self.MainLayout.infoPanel.text = "Update Background" 
+        self.view.set_rect ( ( self.x , self.y , self.width , self.height ) )
+        self.applyView ( )
+        self.refreshViewTrigger ( )
+        self.prefetchTrigger ( )
 
     def on_touch_down ( self , touch ) :
-        
+        start = time.perf_counter ( )
 
         super ( DrawingWidget , self ).on_touch_down( touch ) 
-              
+        if not self.collide_point ( *touch.pos ) : # only what lands on the map (zoomed in, the map goes on under the side panel)
+            return
+
+        if touch.is_mouse_scrolling : # mouse wheel zooms where the pointer is
+            self.view.zoom_at ( ZOOM_STEP if touch.button == 'scrolldown' else 1.0 / ZOOM_STEP , touch.pos [ 0 ] , touch.pos [ 1 ] )
+            self.viewChanged ( )
+            return
+
+        # every touch keeps the mode (and width) it went down with, whatever is selected while it moves
+        # (whoever dispatches the touch may set its own in touch.ud, e.g. one per operator on a shared table)
+        global CURRENT_DRAW 
+        mode = touch.ud.setdefault ( 'mode' , CURRENT_DRAW )
+        if mode not in ( 'attract' , 'repel' , ERASE ) : # not drawing: pan and pinch zoom, double tap to see the whole map
+            if touch.is_double_tap :
+                self.view.fit ( )
+                self.viewChanged ( )
+            self.gesture.down ( touch.uid , touch.pos [ 0 ] , touch.pos [ 1 ] )
+            return
+
+        # strokes are recorded in map pixels, the width too (so it is the slider's width on screen at any zoom)
+        x , y = self.view.to_map ( touch.pos [ 0 ] , touch.pos [ 1 ] )
+        if mode == ERASE :
+            width = touch.ud.setdefault ( 'width' , ERASER_RADIUS / self.view.scale )
+        else :
+            width = touch.ud.setdefault ( 'width' , ( MainLayout.draw_weight_repel if mode == 'repel' else MainLayout.draw_weight_attract ) / self.view.scale )
 
-        if self.collide_point ( touch.pos[0] , touch.pos[1] ) :
+        if mode == ERASE :
+            if self.recorder.down ( touch.uid , x , y , ERASE , width ) :
+                self.strokesChanged ( self.recorder.erased , False )
+        elif self.recorder.down ( touch.uid , x , y , mode , width ) :
             
             global DRAWING_MODE 
             DRAWING_MODE = True 
-            
-            global CURRENT_DRAW 
                 
-            with self.canvas :
-                # print (  ) 
-                if CURRENT_DRAW == 'none' :
-                    pass
-                elif CURRENT_DRAW == 'repel':
-                    Color ( 0.0 , 1.0 , 0.0 ) #currently green, maybe change to red?
-                    self.line = Line ( points = [ touch.pos [0] , touch.pos [ 1 ] ] , width = MainLayout.draw_weight_repel )
-                    self.objects.append(self.line)
-                    MainLayout.infoText = str ( 'Repel: x = ' ) + str ( int ( touch.pos [ 0 ] )  ) + str ( ', y = ' ) + str ( int ( touch.pos [ 1 ] ) ) 
-                elif CURRENT_DRAW == 'attract':
-                    Color ( 0.0 , 0.0 , 1.0 )
-                    self.line = Line ( points = [ touch.pos [0] , touch.pos [ 1 ] ] , width = MainLayout.draw_weight_attract )
-                    self.objects.append(self.line)
-                    MainLayout.infoText = str ( 'Attract: x = ' ) + str ( int ( touch.pos [ 0 ] )  ) + str ( ', y = ' ) + str ( int ( touch.pos [ 1 ] ) ) 
-                # if CURRENT_DRAW == 'restricted':
-                #     Color ( 1.0 , 0.0 , 0.0 )
-                #     self.line = Line ( points = [ touch.pos [0] , touch.pos [ 1 ] ] , width = 2 )
-                #     self.objects.append(self.line)
-                #     MainLayout.infoText = str ( 'Restricted: x = ' ) + str ( int ( touch.pos [ 0 ] )  ) + str ( ', y = ' ) + str ( int ( touch.pos [ 1 ] ) ) 
+            MainLayout.infoText = mode.capitalize ( ) + str ( ': x = ' ) + str ( int ( x )  ) + str ( ', y = ' ) + str ( int ( y ) ) 
+            group = InstructionGroup ( ) # this touch's Color and Lines, until the stroke goes into the meshes
+            group.add ( Color ( *STROKE_COLORS [ mode ] ) )
+            line = Line ( points = [ x , y ] , width = width )
+            group.add ( line )
+            self.liveGroup.add ( group )
+            touch.ud.update ( stroke = self.recorder.stroke , group = group , line = line , points = [ x , y ] , pending = [ ] , tip = None , shown = True )
+            self.liveTouches [ touch.uid ] = touch
+            # if CURRENT_DRAW == 'restricted':
+            #     Color ( 1.0 , 0.0 , 0.0 )
+            #     self.line = Line ( points = [ touch.pos [0] , touch.pos [ 1 ] ] , width = 2 )
+            #     self.objects.append(self.line)
+            #     MainLayout.infoText = str ( 'Restricted: x = ' ) + str ( int ( touch.pos [ 0 ] )  ) + str ( ', y = ' ) + str ( int ( touch.pos [ 1 ] ) ) 
+
+        self.recordTouch ( journal.DOWN , touch , start , x , y , width )
                     
-
-                
     def on_touch_move ( self , touch ) :
-        global CURRENT_DRAW
+        start = time.perf_counter ( )
+
+        if self.gesture.move ( touch.uid , touch.pos [ 0 ] , touch.pos [ 1 ] ) :
+            self.viewChanged ( )
+            return
+        if not self.collide_point ( *touch.pos ) :
+            return
         
-        if CURRENT_DRAW == 'none' :
-            pass
-        elif CURRENT_DRAW == 'attract' :
-            if self.collide_point ( touch.pos [ 0 ] , touch.pos [ 1 ] ) :
-                self.line.points = self.line.points + [ touch.pos [ 0 ] , touch.pos [ 1 ] ] 
-                MainLayout.infoText = str ( 'x = ' ) + str ( int ( touch.pos [ 0 ] )  ) + str ( ', y = ' ) + str ( int ( touch.pos [ 1 ] ) ) 
-                MainLayout.outputX.append( int ( touch.pos[0] - MainLayout.mapProperties["kivy_x_offset"] ) )
-                MainLayout.outputY.append( int ( touch.pos[1] - MainLayout.mapProperties["kivy_y_offset"] )  )              
-                #  MainLayout.coordsAttract.append (  ( int ( touch.pos [ 0 ] )  )  + (  (  ( touch.pos [ 1 ] / 1000 ) ) )  )   
-        elif CURRENT_DRAW == 'repel' :
-            if self.collide_point ( touch.pos [ 0 ] , touch.pos [ 1 ] ) :
-                self.line.points = self.line.points + [ touch.pos [ 0 ] , touch.pos [ 1 ] ] 
-                MainLayout.infoText = str ( 'x = ' ) + str ( int ( touch.pos [ 0 ] )  ) + str ( ', y = ' ) + str ( int ( touch.pos [ 1 ] ) ) 
-                MainLayout.coordsRepel.append (  ( int ( touch.pos [ 0 ] )  )  + (  (  ( touch.pos [ 1 ] / 1000 ) ) )  )
+        x , y = self.view.to_map ( touch.pos [ 0 ] , touch.pos [ 1 ] )
+        mode = self.recorder.mode_of ( touch.uid )
+        if mode == ERASE :
+            self.recorder.move ( touch.uid , x , y )
+            self.strokesChanged ( self.recorder.erased , False )
+        elif self.recorder.move ( touch.uid , x , y ) :
+            touch.ud [ 'pending' ].extend ( self.recorder.committed )
+            touch.ud [ 'tip' ] = self.recorder.tip
+            self.canvasTrigger ( )
+            MainLayout.infoText = str ( 'x = ' ) + str ( int ( x )  ) + str ( ', y = ' ) + str ( int ( y ) ) 
+            self.logPoints ( self.recorder.committed , mode )
+            if STREAM_MODE and self.recorder.committed :
+                self.streamPublish ( )
         # elif CURRENT_DRAW == 'restricted' :
         #     if self.collide_point ( touch.pos [ 0 ] , touch.pos [ 1 ] ) :
         #         self.line.points = self.line.points + [ touch.pos [ 0 ] , touch.pos [ 1 ] ] 
         #         MainLayout.infoText = str ( 'x = ' ) + str ( int ( touch.pos [ 0 ] )  ) + str ( ', y = ' ) + str ( int ( touch.pos [ 1 ] ) ) 
         #         MainLayout.coordsRestricted.append (  ( int ( touch.pos [ 0 ] )  )  + (  (  ( touch.pos [ 1 ] / 1000 ) ) )  )
-                
+
+        self.recordTouch ( journal.MOVE , touch , start , x , y )
+
+    # zoom/pan moved the map: the transform follows now, the texture at most once a frame
+    def viewChanged ( self ) :
+        self.applyView ( )
+        self.refreshViewTrigger ( )
+
+    # drawn (attract) coordinates go to the coordinate log, as kept by the simplifier
+    def logPoints ( self , points , mode ) :
+        if points and mode == 'attract' :
+            for x , y in points :
+                self.coordLog.add_point ( x , y )
                 
     def on_touch_up ( self , touch ) :
-        
+        start = time.perf_counter ( )
+
+        if self.gesture.up ( touch.uid ) :
+            return
+        mode = self.recorder.mode_of ( touch.uid )
+        ended = self.recorder.up ( touch.uid ) # False for touches that started no stroke (e.g. a button press)
+        if ended and mode != ERASE : # the eraser already did its work as it moved
+            self.logPoints ( self.recorder.committed , mode ) # the last sample is always kept
+            self.liveTouches.pop ( touch.uid , None )
+            self.finishedTouches.append ( touch ) # its Line makes way for the mesh at the next flush
+            self.canvasTrigger ( )
+            if STREAM_MODE :
+                self.streamPublish ( ) # make sure the end of the stroke goes out
+
+            self.coordLog.set_map_size ( *self.recorder.rect [ 2: ] )
+            self.flushLogs ( )
+
+        # only the end of what a journaled DOWN started, replay has nothing to end otherwise
+        self.recordTouch ( journal.UP , touch , start , journaled = ended and touch.ud.get ( 'journaled' , False ) )
+
+    # handler bookkeeping: time it (METRICS_MODE) and add it (with the settings needed to replay it) to the journal
+    # x, y and width are in map pixels, like the strokes
+    def recordTouch ( self , event , touch , start , x = 0.0 , y = 0.0 , width = 0.0 , journaled = True ) :
+        if self.metrics :
+            self.metrics.since ( TOUCH_METRICS [ event ] , start )
+        if not self.journal or not journaled :
+            return
+        if event == journal.DOWN :
+            self.journalConfig ( )
+            touch.ud [ 'journaled' ] = True
+        self.journal.record ( event , start , touch.uid , x , y , touch.ud.get ( 'mode' , CURRENT_DRAW ) , width , time.perf_counter ( ) - start )
+
+    # the settings replay needs (map, grid size, team, engine and blur), the journal only writes them when they changed
+    def journalConfig ( self ) :
+        if not self.journal or self.mapAsset is None :
+            return
+        self.journal.config ( rect = list ( self.recorder.rect ) , map_name = background_map_name ,
+                              map_size = [ background_map_width , background_map_height ] ,
+                              background_shape = list ( self.mapAsset.shape ) , team = TEAM ,
+                              incremental = bool ( INCREMENTAL_MODE or STREAM_MODE ) ,
+                              analytic = ANALYTIC_MODE , sigma = SMOOTH_SIGMA , layered = LAYERED_MODE ,
+                              simplify = SIMPLIFY_MODE , tolerance = self.recorder.simplifier.tolerance )
+
+    # summary of the metrics over the top left of the drawing, and a line in the json log
+    def showMetrics ( self ) :
+        self.metricsLabel.pos = self.pos
+        self.metricsLabel.size = self.size
+        self.metricsLabel.text_size = self.size
+        self.metricsLabel.text = self.metrics.summary ( ) + '\n' + self.simplifySummary ( )
+        if self.metricsLog :
+            self.metricsLog.write ( )
+
+    # how much the simplifier shrank the touch input
+    def simplifySummary ( self ) :
+        return 'strokes: kept {} of {} touch samples ({:.0%} fewer, --simplify {})'.format (
+            self.recorder.kept , self.recorder.samples , self.recorder.reduction ( ) , SIMPLIFY_MODE )
+
+    def flushLogs ( self ) :
+        self.coordLog.flush ( )
+        if self.journal :
+            self.journal.flush ( )
+
+    # close the logs and write coord_output.txt in the old text format
+    def closeLogs ( self ) :
+        self.coordLog.close ( )
+        if self.journal :
+            self.journal.close ( )
+        if self.metricsLog :
+            self.metricsLog.write ( )
+            self.metricsLog.close ( )
+        if self.metricsServer :
+            self.metricsServer.shutdown ( )
         file = open ( cwd+'/coord_output.txt' , 'w' ) 
-        file.write ( str ( MainLayout.mapProperties["map_width"] ) )  
-        file.write ( str ( "\n" ) ) 
-        file.write ( str ( MainLayout.mapProperties["map_height"] ) ) 
-        file.write ( str ( "\n" ) ) 
-        file.write ( str ( MainLayout.outputX ) ) 
-        file.write ( str ( "\n" ) ) 
-        file.write ( str ( MainLayout.outputY ) ) 
-        
-        
+        file.write ( coord_text ( self.coordLog.path ) )
         file.close()
-        
-        # print ( MainLayout.coordsAttract ) 
 
          
 
@@ -622,6 +1046,14 @@ class Interface ( App ) :
         return MainLayout () 
 
     def on_stop( self ):
+        self.root.mainScreen.closeLogs()
+        print(self.root.mainScreen.simplifySummary())
+        if self.root.mainScreen.feedback:
+            self.root.mainScreen.feedback.close()
+        if DEBUG_MODE == False:
+            ros = self.root.mainScreen.ros
+            print('ros messages: {}'.format(ros.stats()))
+            ros.close()
         return True
     
 if __name__ == '__main__' :
@@ -629,8 +1061,37 @@ if __name__ == '__main__' :
     parser.add_argument('--team', help='input the team you are controlling (blue or red)', type=str)
     parser.add_argument('--host', help='Needed for 2-player games: are you hosting the game? (yes/no)', type=str)
     parser.add_argument('--address', help='Needed for 2-player games:  if you are not hosting the game, enter the ip address of the host', type=str)
+    parser.add_argument('--tablet', help='name of this tablet, when several tablets play on one team (default: the host name)', type=str)
+    parser.add_argument('--weight', help='how much this tablet counts when swarm_interface.hub merges the team', type=int, default=TABLET_WEIGHT)
+    parser.add_argument('--topic', help='topic to publish the distribution on (/tablet_comm_raw when swarm_interface.hub merges the team)', type=str, default=TOPIC)
     parser.add_argument('--debug', help='Are we in debug mode (enter --debug for True; if True, the touchscreen will not connect to ROS)', action='store_true')
+    parser.add_argument('--verbose', help='print a line for every message sent to ROS', action='store_true')
+    parser.add_argument('--incremental', help='only recompute the parts of the distribution touched by strokes drawn since the last deploy', action='store_true')
+    parser.add_argument('--analytic', help='draw the strokes straight on the down sampled grid instead of rendering them at screen size (faster on big maps)', action='store_true')
+    parser.add_argument('--layered', help='stack strokes in a float accumulation buffer: overlapping attract strokes pull harder, repel drawn over attract cancels it (instead of the top stroke winning)', action='store_true')
+    parser.add_argument('--sigma', help='blur of --analytic in background pixels (default: match the rendered pipeline)', type=float)
+    parser.add_argument('--export-overlay', help='write the distribution overlay to dist.png on every deploy', action='store_true')
+    parser.add_argument('--live-overlay', help='update the Distribution Overlay popup on every deploy while it is open', action='store_true')
+    parser.add_argument('--simplify', help='drop redundant touch samples as they come in: distance keeps a sample once it is --simplify-tolerance from the last one kept, dp (streaming Douglas-Peucker) keeps the fewest that stay within --simplify-tolerance of every sample', choices=SIMPLIFY, default=SIMPLIFY_MODE)
+    parser.add_argument('--simplify-tolerance', help='how far a dropped sample may be from the kept stroke, in map cells', type=float, default=SIMPLIFY_TOLERANCE)
+    parser.add_argument('--encoding', help='how to pack the distribution into the message (json sends a plain list of floats)', choices=ENCODINGS, default='json')
+    parser.add_argument('--compress', help='zlib compress the packed distribution (only with --encoding float32/uint16)', action='store_true')
+    parser.add_argument('--fourier', help='send the first K x K ergodic Fourier coefficients instead of the dense grid (prints their error against it once per grid size, or adds it to --metrics)', type=int, default=FOURIER_K, metavar='K')
+    parser.add_argument('--delta', help='only send the cells that changed since the last message (with a full keyframe every --keyframe-every messages and after a reconnect)', action='store_true')
+    parser.add_argument('--keyframe-every', help='how often --delta sends the whole distribution', type=int, default=KEYFRAME_EVERY)
+    parser.add_argument('--stream', help='publish the distribution while you draw instead of only on Deploy', action='store_true')
+    parser.add_argument('--stream-rate', help='max publishes per second with --stream (0: no limit)', type=float, default=STREAM_RATE)
+    parser.add_argument('--metrics', help='time the touch handlers, deploy stages, frames and message sizes, and show a summary over the drawing', action='store_true')
+    parser.add_argument('--metrics-port', help='serve the metrics as prometheus text on http://localhost:<port>/metrics (implies --metrics)', type=int)
+    parser.add_argument('--metrics-log', help='append the metrics to this rotating json log every second (implies --metrics)', type=str)
+    parser.add_argument('--send-queue', help='messages that can wait for the ros connection (when the host drops out) before some are dropped', type=int, default=SEND_QUEUE)
+    parser.add_argument('--drop-policy', help='what to drop when the send queue is full: coalesce (an older distribution makes way for a newer one), drop-oldest or drop-newest', choices=POLICIES, default=DROP_POLICY)
+    parser.add_argument('--agents', help='subscribe to both teams\' agent poses and draw them on the map, with each team\'s ergodic metric against the last deploy (needs ROS, not with --debug)', action='store_true')
+    parser.add_argument('--agent-fps', help='max redraws per second of the --agents overlay', type=float, default=AGENT_FPS)
+    parser.add_argument('--journal', help='record every touch event and deploy to this file (replay it with python -m swarm_interface.journal)', type=str)
     args = parser.parse_args()
+    if not args.stream_rate >= 0:
+        parser.error('--stream-rate must be 0 (no limit) or more')
     
     TEAM = args.team
     print('Your team is: {}'.format(TEAM))
@@ -639,7 +1100,45 @@ if __name__ == '__main__' :
 
     ADDRESS = args.address
 
+    TABLET_ID = args.tablet or socket.gethostname()
+    TABLET_WEIGHT = args.weight
+    TOPIC = args.topic
+
     DEBUG_MODE = args.debug
+    VERBOSE_MODE = args.verbose
+
+    INCREMENTAL_MODE = args.incremental
+    ANALYTIC_MODE = args.analytic
+    LAYERED_MODE = args.layered
+    SMOOTH_SIGMA = args.sigma
+
+    SIMPLIFY_MODE = args.simplify
+    SIMPLIFY_TOLERANCE = args.simplify_tolerance
+
+    EXPORT_OVERLAY = args.export_overlay
+    LIVE_OVERLAY = args.live_overlay
+
+    ENCODING = args.encoding
+    COMPRESS = args.compress
+
+    FOURIER_K = args.fourier
+    DELTA_MODE = args.delta
+    KEYFRAME_EVERY = args.keyframe_every
+
+    STREAM_MODE = args.stream
+    STREAM_RATE = args.stream_rate
+
+    METRICS_PORT = args.metrics_port
+    METRICS_LOG = args.metrics_log
+    METRICS_MODE = bool(args.metrics or METRICS_PORT or METRICS_LOG)
+
+    SEND_QUEUE = args.send_queue
+    DROP_POLICY = args.drop_policy
+
+    JOURNAL_PATH = args.journal
+
+    AGENT_OVERLAY = args.agents
+    AGENT_FPS = args.agent_fps
 
     print('Inputted arguments: {}'.format(vars(args)))
     
@@ -0,0 +1,72 @@
+'''
+The touchscreen interface's core, without any kivy: strokes, the distribution math,
+message encodings, logs and the ros transport.
+Importing this is cheap: the submodules are imported when one of their names is first used,
+and cv2, scipy and roslibpy only when they are first needed (see lazy.py).
+'''
+import importlib
+
+# public name: submodule it lives in
+_EXPORTS = {
+    'StrokeStore': 'strokes',
+    'StrokeRecorder': 'strokes',
+    'Simplifier': 'strokes',
+    'SegmentGrid': 'strokes',
+    'MeshChunks': 'mesh',
+    'instance_triangles': 'mesh',
+    'AgentFeedback': 'feedback',
+    'BatchReader': 'batch',
+    'rasterize_strokes': 'distribution',
+    'draw_distribution': 'distribution',
+    'image_distribution': 'distribution',
+    'normalize_distribution': 'distribution',
+    'overlay_distribution': 'distribution',
+    'distribution_message': 'distribution',
+    'IncrementalDistribution': 'distribution',
+    'ENCODINGS': 'encoding',
+    'encode_distribution': 'encoding',
+    'decode_distribution': 'encoding',
+    'distribution_fields': 'encoding',
+    'DeltaEncoder': 'encoding',
+    'DeltaDecoder': 'encoding',
+    'LatestWorker': 'worker',
+    'Throttle': 'worker',
+    'CoordLog': 'coord_log',
+    'read_coord_log': 'coord_log',
+    'coord_text': 'coord_log',
+    'Journal': 'journal',
+    'read_journal': 'journal',
+    'replay': 'journal',
+    'ros_interface': 'transport',
+    'SendQueue': 'transport',
+    'StubRosbridge': 'rosbridge_stub',
+    'analytic_distribution': 'analytic',
+    'compare_distributions': 'analytic',
+    'LayeredDistribution': 'analytic',
+    'Metrics': 'metrics',
+    'TeamAggregator': 'hub',
+    'MapCache': 'assets',
+    'MapAsset': 'assets',
+    'open_map': 'assets',
+    'TiledMap': 'tiles',
+    'build_pyramid': 'tiles',
+    'Viewport': 'view',
+    'fourier_coefficients': 'fourier',
+    'reconstruct': 'fourier',
+    'fourier_error': 'fourier',
+    'ergodic_metric': 'fourier',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,222 @@
+'''
+Two alternatives to the deploy pipeline that never make an image of the background's size.
+
+analytic_distribution draws the strokes straight on the pipeline's down sampled grid (SUPERSAMPLE
+times finer, then area averaged) and blurs them there, so its cost follows that grid and the strokes
+instead of the screen. It paints like the pipeline, later strokes over earlier ones.
+
+LayeredDistribution treats every stroke as a capsule (its polyline, thickened by the line width),
+measured against the cell centres of the down sampled grid, and adds the capsules up as signed
+layers in a float32 buffer instead of painting them over each other.
+'''
+import numpy as np
+
+from .lazy import cv2, ndimage
+from .distribution import KIVY_LINE_THICKNESS, DOWN_SAMPLE, SIGMA, SHIFT, TRUNCATE, resample_matrices
+
+SUPERSAMPLE = 2 # analytic_distribution draws the strokes this many times finer than the down sampled grid
+
+
+def analytic_distribution(store, rect, shape, map_size, sigma=None):
+    """ Unnormalized (map_height, map_width) grid, the counterpart of draw_distribution on the down sampled grid.
+
+    store, rect, shape and map_size are as for draw_distribution. sigma is the
+    blur in background pixels (default: the pipeline's SIGMA, scaled up by
+    DOWN_SAMPLE). The strokes are drawn SUPERSAMPLE times finer than the down
+    sampled grid, with their line width scaled along, area averaged onto it
+    and blurred there, so no image of the background's size is made; later
+    strokes still paint over earlier ones.
+    """
+    rows, cols = shape
+    rx, ry, rw, rh = rect
+    sx = cols / float(rw)
+    sy = rows / float(rh)
+    scale = np.sqrt(sx * sy)
+    down_rows, down_cols = int(rows/DOWN_SAMPLE), int(cols/DOWN_SAMPLE)
+    # window coordinates -> supersampled cells (cell j/SUPERSAMPLE is centred on what cv2.resize samples for cell j)
+    fx = down_cols * SUPERSAMPLE / float(cols)
+    fy = down_rows * SUPERSAMPLE / float(rows)
+
+    blue = np.zeros((down_rows * SUPERSAMPLE, down_cols * SUPERSAMPLE), dtype=np.uint8)
+    green = np.zeros_like(blue)
+    for mode, width, points in store.strokes():
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(pts) < 2: # a single point draws nothing
+            continue
+        if mode == 'attract':
+            paint, wipe = blue, green
+        elif mode == 'repel':
+            paint, wipe = green, blue
+        else:
+            continue
+        px = ((pts[:, 0] - rx) * sx + 0.5) * fx - 0.5
+        py = ((ry + rh - pts[:, 1]) * sy + 0.5) * fy - 0.5
+        pts = np.round(np.stack((px, py), axis=1) * (1 << SHIFT)).astype(np.int32)
+        thickness = max(1, int(round(KIVY_LINE_THICKNESS * width * scale)))
+        thickness = max(1, int(round(thickness * np.sqrt(fx * fy))))
+        cv2.polylines(paint, [pts], False, 255, thickness, cv2.LINE_8, SHIFT)
+        cv2.polylines(wipe, [pts], False, 0, thickness, cv2.LINE_8, SHIFT)
+
+    update = cv2.addWeighted(blue, 0.5, cv2.bitwise_not(green), 0.5, 0)
+    if SUPERSAMPLE > 1:
+        update = cv2.resize(update, (down_cols, down_rows), interpolation=cv2.INTER_AREA)
+    blur = SIGMA if sigma is None else sigma * down_cols / float(cols)
+    smooth = ndimage.gaussian_filter(update, sigma=blur)
+    return cv2.resize(smooth, tuple(map_size)).astype(np.float32)
+
+
+# LayeredDistribution's capsules
+SEGMENT_CHUNK = 16 # segments measured against the grid at a time
+LAYER_LEVELS = 255 # LayeredDistribution counts coverage in 1/255ths, so its buffer holds whole numbers
+BASELINE = 1.0 # level of the blank canvas, in layers (one attract stroke is a layer above it, like 255 over 127.5)
+GROWING = 8 # LayeredDistribution keeps the coverage of at most this many strokes that may still grow (one per finger)
+
+
+def _window(centers, lo, hi):
+    """ Index range of the (sorted) centers in [lo, hi]. """
+    return int(np.searchsorted(centers, lo, 'left')), int(np.searchsorted(centers, hi, 'right'))
+
+
+def _distance(gx, gy, start, delta, box):
+    """ Squared distance from every cell centre in box to the nearest of the segments start -> start + delta. """
+    r0, r1, c0, c1 = box
+    x = gx[None, c0:c1, None] - start[:, 0] # (1, cols, segments)
+    y = gy[r0:r1, None, None] - start[:, 1] # (rows, 1, segments)
+    length2 = np.maximum((delta * delta).sum(1), 1e-12)
+    t = np.clip((x * delta[:, 0] + y * delta[:, 1]) / length2, 0, 1)
+    dx = x - t * delta[:, 0]
+    dy = y - t * delta[:, 1]
+    return (dx * dx + dy * dy).min(axis=2)
+
+
+class LayeredDistribution(object):
+    """ Signed float32 accumulation of the strokes on the pipeline's down sampled grid.
+
+    Each stroke adds its coverage (1 inside the capsule of its line width,
+    antialiased over the cell at the edge) to the buffer, attract with a plus
+    and repel with a minus. Overlapping strokes stack: two attract layers pull
+    twice as hard instead of saturating, and repel drawn over attract cancels
+    it. Only the segments drawn since the last update are added, and a stroke
+    that was hidden (or shown again) has its whole coverage taken out (or put
+    back). Coverage is counted in 1/LAYER_LEVELS steps, so the buffer holds
+    whole numbers and sums exactly: updating after every segment or erase
+    gives the same bits as one rebuild.
+
+    The map grid is the buffer blurred like the pipeline, resampled to the map
+    grid and lifted by baseline layers (clipped at 0). It is unnormalized.
+    """
+    def __init__(self, baseline=BASELINE):
+        self.baseline = baseline
+        self._key = None
+
+    def reset(self):
+        """ Forget the buffer, the next update adds every stroke again. """
+        self._key = None
+
+    def _rebuild(self, store, rect, shape, map_size):
+        rows, cols = shape
+        _, _, (self._map_y, _, _), (self._map_x, _, _) = resample_matrices(shape, map_size)
+        down_rows, down_cols = int(rows/DOWN_SAMPLE), int(cols/DOWN_SAMPLE)
+        self.buffer = np.zeros((down_rows, down_cols), dtype=np.float32)
+        self._growing = {} # stroke -> its coverage, for the strokes that changed at the last update (they may grow on)
+        self._gx = np.arange(down_cols, dtype=np.float64)
+        self._gy = np.arange(down_rows, dtype=np.float64)
+        # window coordinates -> down sampled cells (cell j is centred on what cv2.resize samples for it)
+        rx, ry, rw, rh = rect
+        sx, sy = cols / float(rw), rows / float(rh)
+        self._fx, self._fy = down_cols / float(cols), down_rows / float(rows)
+        self._to_cells = lambda pts: np.stack((((pts[:, 0] - rx) * sx + 0.5) * self._fx - 0.5,
+                                               ((ry + rh - pts[:, 1]) * sy + 0.5) * self._fy - 0.5), axis=1)
+        self._scale = np.sqrt(sx * sy)
+        self._key = (store.generation, tuple(rect), tuple(shape), tuple(map_size))
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._visible = np.zeros(0, dtype=bool)
+
+    def update(self, store, rect, shape, map_size):
+        """ Adds what was drawn since the last update and returns the map grid (same arguments as draw_distribution). """
+        key = (store.generation, tuple(rect), tuple(shape), tuple(map_size))
+        counts = store.counts()
+        seen = len(self._counts) if key == self._key else 0
+        # strokes only grow (several at once, with multi-touch) or get hidden and shown, anything else starts over
+        if key != self._key or len(store) < seen or np.any(counts[:seen] < self._counts[:seen]):
+            self._rebuild(store, rect, shape, map_size)
+            seen = 0
+        visible = store.visibility()
+        done = np.zeros(len(store), dtype=np.int64) # points of each stroke in the buffer
+        done[:seen] = self._counts
+        was = np.zeros(len(store), dtype=bool)
+        was[:seen] = self._visible
+        changed = np.flatnonzero((counts != done) | (visible != was))
+        keep = set(changed[-GROWING:].tolist()) # the newest may still grow, others are found again if they do
+        growing = {}
+        for i in changed:
+            mode, width, points = store.mode(i), store.width(i), store.points(i)
+            if was[i] and not visible[i]: # erased or undone: its whole coverage comes out
+                self._add(mode, width, points[:done[i]], np.zeros_like(self.buffer), -1.0)
+            elif visible[i] and was[i]: # it grew, only the new segments go in
+                coverage = self._growing.get(i)
+                if coverage is None: # it paused for an update, find what it covers already
+                    coverage = np.zeros_like(self.buffer)
+                    self._add(mode, width, points[:done[i]], coverage, 0.0)
+                self._add(mode, width, points[max(done[i] - 1, 0):], coverage)
+            elif visible[i]: # new, or shown again
+                coverage = np.zeros_like(self.buffer)
+                self._add(mode, width, points, coverage)
+            if visible[i] and i in keep:
+                growing[i] = coverage
+        self._growing = growing
+        self._counts = counts.copy()
+        self._visible = visible.copy()
+
+        smooth = ndimage.gaussian_filter(self.buffer * (1.0 / LAYER_LEVELS), sigma=SIGMA, truncate=TRUNCATE)
+        grid = self._map_y @ smooth @ self._map_x.T
+        return np.maximum(grid + self.baseline, 0).astype(np.float32)
+
+    def _add(self, mode, width, points, stroke, sign=1.0):
+        """ Adds the segments of points (one stroke) to the buffer, where they widen the stroke's coverage.
+
+        stroke is the stroke's coverage so far (updated), sign -1 takes the
+        widening out of the buffer instead and 0 only updates stroke.
+        """
+        if mode not in ('attract', 'repel'):
+            return
+        sign = sign if mode == 'attract' else -sign
+        pts = self._to_cells(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+        thickness = max(1, int(round(KIVY_LINE_THICKNESS * width * self._scale)))
+        half = thickness / 2.0 * np.sqrt(self._fx * self._fy)
+        reach = half + 1
+        start, delta = pts[:-1], np.diff(pts, axis=0)
+        for i in range(0, len(start), SEGMENT_CHUNK):
+            s, d = start[i:i + SEGMENT_CHUNK], delta[i:i + SEGMENT_CHUNK]
+            ends = np.concatenate((s, s + d))
+            c0, c1 = _window(self._gx, ends[:, 0].min() - reach, ends[:, 0].max() + reach)
+            r0, r1 = _window(self._gy, ends[:, 1].min() - reach, ends[:, 1].max() + reach)
+            if c0 >= c1 or r0 >= r1:
+                continue
+            dist = np.sqrt(_distance(self._gx, self._gy, s, d, (r0, r1, c0, c1)))
+            coverage = np.round(np.clip(half + 0.5 - dist, 0, 1) * LAYER_LEVELS).astype(np.float32)
+            old = stroke[r0:r1, c0:c1]
+            new = np.maximum(old, coverage)
+            self.buffer[r0:r1, c0:c1] += sign * (new - old)
+            stroke[r0:r1, c0:c1] = new
+
+
+def compare_distributions(a, b):
+    """ How far apart two distributions are, once both are normalized.
+
+    Returns a dict with 'total_variation' (half the L1 distance, 0 to 1),
+    'max_error' (the largest cell difference, relative to b's largest cell)
+    and 'correlation'.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    a = a / a.sum() if a.sum() > 0 else a
+    b = b / b.sum() if b.sum() > 0 else b
+    diff = np.abs(a - b)
+    flat_a, flat_b = a.ravel(), b.ravel()
+    correlation = np.corrcoef(flat_a, flat_b)[0, 1] if flat_a.std() > 0 and flat_b.std() > 0 else float(np.array_equal(a, b))
+    return dict(
+        total_variation = float(0.5 * diff.sum()),
+        max_error = float(diff.max() / b.max()) if b.max() > 0 else float(diff.max()),
+        correlation = float(correlation)
+        )
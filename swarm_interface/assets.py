@@ -0,0 +1,210 @@
+'''
+Cache of decoded map images, so deploys and map switches don't decode the png again.
+Entries are keyed by file name and modification time (editing a map reloads it) and the least
+recently used map is dropped once more than `capacity` are loaded.
+A map can also be a tiled pyramid directory (see tiles.py), which is memory-mapped instead of decoded.
+'''
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .lazy import cv2
+from .distribution import resample_matrices
+
+MIN_LEVEL = 64 # the pyramid stops once a level would be smaller than this (pixels, shortest side)
+
+
+def texture_buffer(image):
+    """ A BGR image (rows top down, as cv2 has them) as bottom-up RGB rows, ready to blit into a kivy texture. """
+    return np.ascontiguousarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)[::-1])
+
+
+def pick_level(resolutions, needed):
+    """ Index of the coarsest pyramid level with at least `needed` level pixels per map pixel (0 if none has). """
+    level = 0
+    for i, resolution in enumerate(resolutions):
+        if resolution >= needed:
+            level = i
+    return level
+
+
+def whole_map(region, extent):
+    """ Whether region (x0, y0, x1, y1) is all of a map of extent (cols, rows), up to float rounding. """
+    return np.allclose(region, (0, 0) + tuple(extent))
+
+
+def render_region(read, level_shape, extent, region, size):
+    """ region (x0, y0, x1, y1, map pixels with y up) of a map, resampled from one pyramid level to size (width, height).
+
+    read(r0, r1, c0, c1) returns the level's pixels in those rows (top down)
+    and columns, level_shape is the level's (rows, cols) and extent the map's
+    (cols, rows). Only the pixels under region are read.
+    """
+    x0, y0, x1, y1 = region
+    width, height = int(size[0]), int(size[1])
+    fx = level_shape[1] / float(extent[0])
+    fy = level_shape[0] / float(extent[1])
+    # the region in level pixels (rows counted from the top), plus a pixel of margin for the interpolation
+    left, right = x0 * fx, x1 * fx
+    top, bottom = (extent[1] - y1) * fy, (extent[1] - y0) * fy
+    c0, c1 = max(0, int(math.floor(left)) - 1), min(level_shape[1], int(math.ceil(right)) + 1)
+    r0, r1 = max(0, int(math.floor(top)) - 1), min(level_shape[0], int(math.ceil(bottom)) + 1)
+    crop = np.ascontiguousarray(read(r0, r1, c0, c1))
+    # output pixel centre -> crop coordinates
+    sx = (right - left) / width
+    sy = (bottom - top) / height
+    transform = np.array([[sx, 0, left - c0 + 0.5 * sx - 0.5],
+                          [0, sy, top - r0 + 0.5 * sy - 0.5]])
+    return cv2.warpAffine(crop, transform, (width, height), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+
+def open_map(name, mtime=None):
+    """ The MapAsset of an image file, or the TiledMap of a pyramid directory. Raises IOError if it can't be read. """
+    path = os.path.abspath(name)
+    if mtime is None:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            raise IOError('map image not found: {}'.format(name))
+    if os.path.isdir(path):
+        from .tiles import TiledMap
+        return TiledMap(name, mtime, path)
+    image = cv2.imread(path, 1) # 1 = color, 0 = grayscale
+    if image is None:
+        raise IOError('could not read map image: {}'.format(name))
+    return MapAsset(name, mtime, image)
+
+
+class MapAsset(object):
+    """ One decoded map image and what is derived from it.
+
+    image   -- the background as read by cv2 (BGR, rows x cols x 3), don't modify it
+    shape   -- (rows, cols) of image, what the deploy pipeline renders at
+    extent  -- (cols, rows) of the map in map pixels, the coordinates strokes are recorded in
+    pyramid -- [image, image at 1/2, 1/4, ...] (cv2.pyrDown), built on first use
+    """
+    def __init__(self, name, mtime, image):
+        self.name = name
+        self.mtime = mtime
+        self.image = image
+        self.image.flags.writeable = False
+        self.shape = image.shape[:2]
+        self.extent = (self.shape[1], self.shape[0])
+        self._pyramid = None
+        self._scaled = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pyramid(self):
+        with self._lock:
+            if self._pyramid is None:
+                levels = [self.image]
+                while min(levels[-1].shape[:2]) // 2 >= MIN_LEVEL:
+                    levels.append(cv2.pyrDown(levels[-1]))
+                self._pyramid = levels
+            return self._pyramid
+
+    def scaled(self, size):
+        """ The map resized to size (width, height), BGR like image. """
+        size = (int(size[0]), int(size[1]))
+        with self._lock:
+            image = self._scaled.get(size)
+        if image is None:
+            # shrink from the smallest pyramid level that is still at least as big as size
+            source = self.image
+            for level in self.pyramid:
+                if level.shape[1] >= size[0] and level.shape[0] >= size[1]:
+                    source = level
+            image = cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+            image.flags.writeable = False
+            with self._lock:
+                self._scaled[size] = image
+        return image
+
+    def view(self, region, size):
+        """ The part region = (x0, y0, x1, y1) of the map (map pixels, y up) at size (width, height), BGR. """
+        if whole_map(region, self.extent):
+            return self.scaled(size)
+        levels = self.pyramid
+        level = levels[pick_level([lvl.shape[1] / float(self.extent[0]) for lvl in levels], size[0] / float(region[2] - region[0]))]
+        return render_region(lambda r0, r1, c0, c1: level[r0:r1, c0:c1], level.shape[:2], self.extent, region, size)
+
+    def prepare(self, map_size=None, display_size=None):
+        """ Builds everything a deploy or a switch to this map needs, ahead of time. """
+        self.pyramid
+        if map_size is not None:
+            resample_matrices(self.shape, map_size)
+        if display_size is not None:
+            self.scaled(display_size)
+        return self
+
+
+class MapCache(object):
+    """ Decoded maps by (file name, modification time), least recently used dropped first. Thread safe. """
+    def __init__(self, capacity=6):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._assets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """ The MapAsset (or TiledMap) of name, opening it if it isn't cached (or changed on disk). """
+        path = os.path.abspath(name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            raise IOError('map image not found: {}'.format(name))
+        key = (path, mtime)
+        with self._lock:
+            asset = self._assets.get(key)
+            if asset is not None:
+                self._assets.move_to_end(key)
+                self.hits += 1
+                return asset
+            self.misses += 1
+
+        asset = open_map(name, mtime)
+
+        with self._lock:
+            # drop older versions of the same file, then the least recently used maps
+            for stale in [k for k in self._assets if k[0] == path]:
+                del self._assets[stale]
+            self._assets[key] = asset
+            while len(self._assets) > self.capacity:
+                self._assets.popitem(last=False)
+        return asset
+
+    def prefetch(self, names, map_size=None, display_size=None):
+        """ Loads and prepares names on a background thread (unreadable files are skipped).
+
+        display_size is a (width, height), or a function giving the size of an
+        asset (maps of different proportions fit the screen at different sizes).
+        """
+        def run():
+            for name in names:
+                try:
+                    asset = self.get(name)
+                    asset.prepare(map_size, display_size(asset) if callable(display_size) else display_size)
+                except IOError:
+                    pass
+        thread = threading.Thread(target=run, name='map prefetch')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def clear(self):
+        with self._lock:
+            self._assets.clear()
+
+    def __len__(self):
+        return len(self._assets)
+
+    def __contains__(self, name):
+        path = os.path.abspath(name)
+        with self._lock:
+            return any(key[0] == path for key in self._assets)
@@ -0,0 +1,264 @@
+'''
+Headless batch conversion of saved sessions into target distributions, without the GUI: touch
+journals (--journal), coordinate logs (coord_output.bin/.txt), exported drawings (drawing.png,
+combined_output.png) and saved grids (.csv, like val.csv) go through the deploy pipeline in a
+process pool. The normalized grids are streamed into a directory of .npy chunks (CHUNK grids of one
+shape each) with an index.npz, instead of csv text, and the throughput is reported at the end.
+    python -m swarm_interface.batch sessions/ [more files or directories] --out study.grids [--workers 8]
+BatchReader opens the result memory-mapped, reading nothing but the index.
+'''
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from .lazy import cv2, preload
+from . import coord_log, journal
+
+INDEX = 'index.npz'
+CHUNK = 256 # grids per chunk file
+PATTERNS = ('*.jrn', '*journal*', 'coord_output*.bin', 'coord_output*.txt', 'drawing*.png', 'combined_output*.png', '*.csv') # what a directory scan picks up
+MAP_NAME = 'ros_game_env_50_by_50.png' # the background exported drawings were made on (the interface's default map)
+MAP_SIZE = (50, 50)
+COORD_WIDTH = 1.5 # coordinate logs record no stroke width, this one is used (in map cells)
+COORD_GAP = 4.0 # logged points further apart than this many widths start a new stroke
+ENGINES = ('rendered', 'incremental', 'analytic', 'layered')
+
+# kinds of input
+JOURNAL = 'journal'
+COORDS = 'coords'
+DRAWING = 'drawing'
+GRID = 'grid'
+
+
+def input_kind(path):
+    """ What kind of saved artifact path is, None if it is none we know. """
+    name = os.path.basename(path).lower()
+    if name.endswith('.png'):
+        return DRAWING
+    if name.endswith('.csv'):
+        return GRID
+    if name.endswith('.txt'):
+        return COORDS
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic == journal.MAGIC:
+        return JOURNAL
+    if magic == coord_log.MAGIC:
+        return COORDS
+    return None
+
+
+def find_inputs(paths, patterns=PATTERNS):
+    """ The files in paths, directories scanned (recursively, in sorted order) for names matching patterns. """
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(path)
+            continue
+        for folder, subfolders, names in os.walk(path):
+            subfolders.sort()
+            found.extend(os.path.join(folder, name) for name in sorted(names)
+                         if any(fnmatch.fnmatch(name, pattern) for pattern in patterns))
+    return found
+
+
+def read_coords(path):
+    """ (map_width, map_height, xs, ys) of a coordinate log, binary or in the coord_output.txt format. """
+    if not path.lower().endswith('.txt'):
+        return coord_log.read_coord_log(path)
+    with open(path) as f:
+        lines = f.read().split('\n')
+    if len(lines) < 4:
+        raise ValueError('{} is not in the coord_output.txt format'.format(path))
+    return int(lines[0]), int(lines[1]), json.loads(lines[2]), json.loads(lines[3])
+
+
+def coord_store(xs, ys, width, gap):
+    """ A StrokeStore of logged attract points, split into strokes wherever two points are more than gap apart. """
+    from .strokes import StrokeStore
+    store = StrokeStore()
+    points = np.stack((np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)), axis=1)
+    jumps = np.flatnonzero(np.hypot(*np.diff(points, axis=0).T) > gap) + 1
+    for part in np.split(points, jumps):
+        if len(part):
+            i = store.begin('attract', width, -1, part[0, 0], part[0, 1])
+            for x, y in part[1:]:
+                store.append(x, y, i)
+    return store
+
+
+@lru_cache(maxsize=8)
+def _map_shape(name):
+    from .assets import open_map
+    return open_map(name).shape
+
+
+def convert(task):
+    """ Runs one input through the pipeline (in a pool worker). task is (path, options), see main.
+
+    Returns (path, kind, grids, seconds, error): grids is a list of
+    (normalized grid, pipeline seconds), one per deploy for a journal and one
+    for anything else, error the reason it failed (grids is then empty).
+    """
+    path, options = task
+    start = time.perf_counter()
+    grids = []
+    kind = None
+    try:
+        from .distribution import MESSAGE_SCALE, draw_distribution, image_distribution, normalize_distribution
+        kind = input_kind(path)
+        engine = options['engine']
+        map_size = tuple(options['map_size'])
+        if kind == JOURNAL:
+            flags = (None, None, None) if engine is None else tuple(engine == name for name in ('incremental', 'analytic', 'layered'))
+            journal.replay(path, flags[0], analytic=flags[1], layered=flags[2], messages=False,
+                           on_deploy=lambda grid, seconds: grids.append((grid, seconds)))
+        elif kind == COORDS:
+            width, height, xs, ys = read_coords(path)
+            if width <= 0 or height <= 0:
+                raise ValueError('no map size in the log')
+            cell = width / float(map_size[0]) # map cells -> map pixels
+            stroke_width = options['coord_width'] * cell
+            store = coord_store(xs, ys, stroke_width, COORD_GAP * stroke_width)
+            rect, shape = (0, 0, width, height), (height, width)
+            if engine in ('analytic', 'layered'):
+                from .analytic import analytic_distribution, LayeredDistribution
+                if engine == 'analytic':
+                    up_sample = analytic_distribution(store, rect, shape, map_size)
+                else:
+                    up_sample = LayeredDistribution().update(store, rect, shape, map_size)
+            else: # incremental gives the rendered result, starting from nothing
+                up_sample = draw_distribution(store, rect, shape, map_size)
+            grids.append((normalize_distribution(up_sample), time.perf_counter() - start))
+        elif kind == DRAWING:
+            drawing = cv2.imread(path, 1)
+            if drawing is None:
+                raise IOError('could not read image: {}'.format(path))
+            up_sample = image_distribution(drawing, _map_shape(options['map']), map_size)
+            grids.append((normalize_distribution(up_sample), time.perf_counter() - start))
+        elif kind == GRID:
+            # a message's values in rows of map_height: distribution_message flipped the grid and scaled it, undo both
+            grid = np.flipud(np.loadtxt(path, delimiter=',', ndmin=2)) / MESSAGE_SCALE
+            grids.append((normalize_distribution(grid), time.perf_counter() - start))
+        else:
+            raise ValueError('not a journal, coordinate log, drawing or grid')
+    except (IOError, OSError, ValueError, KeyError) as e:
+        return path, kind, [], time.perf_counter() - start, str(e)
+    return path, kind, grids, time.perf_counter() - start, None
+
+
+class ChunkWriter(object):
+    """ Streams grids into directory as .npy chunks of at most chunk grids of one shape, close() writes the index. """
+    def __init__(self, directory, chunk=CHUNK):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.chunk = chunk
+        self.files = [] # chunk file names, in the order they were started
+        self.bytes = 0
+        self._pending = {} # shape -> (chunk number, grids waiting to be written)
+        self._index = dict(source = [], kind = [], item = [], chunk = [], row = [], seconds = [])
+
+    def add(self, grid, source, kind, item, seconds):
+        grid = np.asarray(grid, dtype=np.float32)
+        number, grids = self._pending.get(grid.shape, (None, None))
+        if number is None:
+            number, grids = len(self.files), []
+            self.files.append('grids_{}x{}_{:05d}.npy'.format(grid.shape[0], grid.shape[1], number))
+            self._pending[grid.shape] = (number, grids)
+        for name, value in zip(('source', 'kind', 'item', 'chunk', 'row', 'seconds'), (source, kind, item, number, len(grids), seconds)):
+            self._index[name].append(value)
+        grids.append(grid)
+        if len(grids) == self.chunk:
+            self._write(grid.shape)
+
+    def _write(self, shape):
+        number, grids = self._pending.pop(shape)
+        stack = np.stack(grids)
+        np.save(os.path.join(self.directory, self.files[number]), stack)
+        self.bytes += stack.nbytes
+
+    def __len__(self):
+        return len(self._index['row'])
+
+    def close(self):
+        for shape in list(self._pending):
+            self._write(shape)
+        index = {name: np.array(values) for name, values in self._index.items()}
+        index['source'] = index['source'].astype(str)
+        index['kind'] = index['kind'].astype(str)
+        np.savez(os.path.join(self.directory, INDEX), files = np.array(self.files, dtype=str), **index)
+
+
+class BatchReader(object):
+    """ The output of a batch, memory-mapped. reader[i] is the i-th grid.
+
+    index holds one array per field: source (input file), kind, item (deploy
+    number within the source), chunk, row and seconds (pipeline time).
+    """
+    def __init__(self, directory):
+        with np.load(os.path.join(directory, INDEX)) as index:
+            self.index = {name: index[name] for name in index.files}
+        self.files = list(self.index.pop('files'))
+        self.chunks = [np.load(os.path.join(directory, name), mmap_mode='r') for name in self.files]
+
+    def __len__(self):
+        return len(self.index['row'])
+
+    def __getitem__(self, i):
+        return self.chunks[self.index['chunk'][i]][self.index['row'][i]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Turn saved journals, coordinate logs, exported drawings and grids into distributions, in parallel')
+    parser.add_argument('inputs', nargs='+', help='files, or directories to scan for them')
+    parser.add_argument('--out', required=True, help='directory for the .npy chunks and index.npz')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes (1: no pool)')
+    parser.add_argument('--chunk', type=int, default=CHUNK, help='grids per chunk file')
+    parser.add_argument('--pattern', nargs='+', default=PATTERNS, help='file names picked up in directories')
+    parser.add_argument('--engine', choices=ENGINES, help='distribution engine (default: what each journal\'s session used, rendered for the rest)')
+    parser.add_argument('--map', default=MAP_NAME, help='the map exported drawings were made on (its size is what they are stretched to)')
+    parser.add_argument('--map-size', type=int, nargs=2, default=MAP_SIZE, metavar=('WIDTH', 'HEIGHT'), help='map grid of drawings and coordinate logs')
+    parser.add_argument('--coord-width', type=float, default=COORD_WIDTH, help='stroke width given to coordinate logs, in map cells')
+    args = parser.parse_args(argv)
+
+    paths = find_inputs(args.inputs, args.pattern)
+    options = dict(engine = args.engine, map = os.path.abspath(args.map), map_size = args.map_size, coord_width = args.coord_width)
+    tasks = [(path, options) for path in paths]
+    writer = ChunkWriter(args.out, args.chunk)
+    start = time.perf_counter()
+    worked = 0.0
+    failed = 0
+    pool = ProcessPoolExecutor(args.workers, initializer=preload) if args.workers > 1 else None # workers import cv2/scipy before they start timing
+    try:
+        # results come back in input order as they are done, and go straight to disk
+        results = pool.map(convert, tasks, chunksize=1) if pool else map(convert, tasks)
+        for path, kind, grids, seconds, error in results:
+            worked += seconds
+            if error is not None:
+                failed += 1
+                print('{}: skipped, {}'.format(path, error))
+                continue
+            for item, (grid, pipeline) in enumerate(grids):
+                writer.add(grid, path, kind, item, pipeline)
+    finally:
+        if pool:
+            pool.shutdown()
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    print('{} inputs ({} skipped) -> {} grids in {} chunks, {:.1f} MB in {}'.format(
+        len(paths), failed, len(writer), len(writer.files), writer.bytes / 1e6, args.out))
+    print('{:.2f} s with {} workers: {:.1f} inputs/s, {:.1f} grids/s ({:.1f} s of work, {:.1f}x parallel)'.format(
+        elapsed, args.workers, len(paths) / elapsed, len(writer) / elapsed, worked, worked / elapsed if elapsed > 0 else 0))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
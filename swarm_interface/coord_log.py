@@ -0,0 +1,98 @@
+'''
+Append-only log of the drawn (attract) coordinates.
+Points are buffered in memory and appended to a small binary file, nothing already written is rewritten.
+Run this file to rebuild the old coord_output.txt text format from a log:
+    python -m swarm_interface.coord_log coord_output.bin coord_output.txt
+'''
+import sys
+from array import array
+
+import numpy as np
+
+MAGIC = b'CRD1'
+# every record is three little endian int32s: tag, a, b
+MAP_SIZE = 0 # a, b = map width, map height
+POINT = 1    # a, b = x, y
+CLEAR = 2    # the map was cleared, points before this no longer count
+
+
+class CoordLog(object):
+    """ Buffers coordinate records and appends them to path (a new log is started on open). """
+    def __init__(self, path, flush_every=4096):
+        self.path = path
+        self.flush_every = flush_every # records buffered before we flush on our own
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._file.flush()
+        self._pending = array('i')
+        self._map_size = None
+
+    def _add(self, tag, a, b):
+        self._pending.extend((tag, int(a), int(b)))
+        if len(self._pending) >= 3*self.flush_every:
+            self.flush()
+
+    def set_map_size(self, width, height):
+        """ Records the map size, only if it changed. """
+        if (width, height) != self._map_size:
+            self._map_size = (width, height)
+            self._add(MAP_SIZE, width, height)
+
+    def add_point(self, x, y):
+        self._add(POINT, x, y)
+
+    def clear(self):
+        self._add(CLEAR, 0, 0)
+
+    def flush(self):
+        if len(self._pending) and self._file is not None:
+            if sys.byteorder == 'big':
+                self._pending.byteswap()
+            self._file.write(self._pending.tobytes())
+            self._file.flush()
+            self._pending = array('i')
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_coord_log(path):
+    """ Returns (map_width, map_height, xs, ys) as of the end of the log. """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError('{} is not a coordinate log'.format(path))
+    body = raw[len(MAGIC):]
+    body = body[:len(body) - len(body) % 12] # drop a record cut short by a crash
+    records = np.frombuffer(body, dtype='<i4').reshape(-1, 3)
+    tags = records[:, 0]
+
+    width = height = 0
+    sizes = np.flatnonzero(tags == MAP_SIZE)
+    if len(sizes):
+        width, height = records[sizes[-1], 1:]
+
+    clears = np.flatnonzero(tags == CLEAR)
+    start = clears[-1] + 1 if len(clears) else 0
+    points = records[start:][tags[start:] == POINT]
+    return int(width), int(height), points[:, 1].tolist(), points[:, 2].tolist()
+
+
+def coord_text(path):
+    """ The log in the coord_output.txt format (width, height, x list, y list, one per line). """
+    width, height, xs, ys = read_coord_log(path)
+    return '{}\n{}\n{}\n{}'.format(width, height, xs, ys)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit('usage: python -m swarm_interface.coord_log <coord_output.bin> [coord_output.txt]')
+    text = coord_text(sys.argv[1])
+    if len(sys.argv) == 3:
+        with open(sys.argv[2], 'w') as f:
+            f.write(text)
+    else:
+        print(text)
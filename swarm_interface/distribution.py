@@ -0,0 +1,353 @@
+'''
+Distribution math for the touchscreen interface.
+Nothing in here imports kivy, so it can be used without opening a window.
+'''
+from functools import lru_cache
+
+import numpy as np
+
+from .lazy import cv2, ndimage
+
+# Kivy's Line width is measured from the centre of the line, so the stroke on
+# screen is twice as thick as the width we hand it.
+KIVY_LINE_THICKNESS = 2
+
+# sub-pixel precision used when handing points to cv2 (coordinates are scaled by 2**SHIFT)
+SHIFT = 4
+
+# what distribution_message multiplies the normalized values by
+MESSAGE_SCALE = 10
+
+
+def rasterize_strokes(strokes, rect, shape, region=None):
+    """ Renders recorded strokes straight into attract/repel buffers.
+
+    strokes -- iterable of (mode, width, points) in drawing order, where mode is
+               'attract' or 'repel' and points is either a flat
+               [x0, y0, x1, y1, ...] list or an (n, 2) array in window coordinates
+    rect    -- (x, y, width, height) of the drawing widget in window coordinates
+    shape   -- (rows, cols) of the buffers to render into
+    region  -- optional (row0, row1, col0, col1) window of that image, only
+               this part is rendered and returned
+
+    Returns (attract, repel) uint8 arrays. These match what the old
+    export_to_png round trip produced: attract is the blue channel of the
+    drawing, repel is the inverted green channel (255 wherever nothing was
+    drawn in repel).
+    """
+    rows, cols = shape
+    rx, ry, rw, rh = rect
+    sx = cols / float(rw)
+    sy = rows / float(rh)
+    scale = np.sqrt(sx * sy)
+    if region is None:
+        region = (0, rows, 0, cols)
+    r0, r1, c0, c1 = region
+
+    blue = np.zeros((r1 - r0, c1 - c0), dtype=np.uint8)
+    green = np.zeros((r1 - r0, c1 - c0), dtype=np.uint8)
+    for mode, width, points in strokes:
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(pts) < 2: # a single point draws nothing in kivy either
+            continue
+        px = (pts[:, 0] - rx) * sx - c0
+        py = (ry + rh - pts[:, 1]) * sy - r0 # kivy's origin is bottom left, images are top left
+        pts = np.round(np.stack((px, py), axis=1) * (1 << SHIFT)).astype(np.int32)
+        thickness = max(1, int(round(KIVY_LINE_THICKNESS * width * scale)))
+
+        # later strokes paint over earlier ones, like they do on the canvas
+        if mode == 'attract':
+            paint, wipe = blue, green
+        elif mode == 'repel':
+            paint, wipe = green, blue
+        else:
+            continue
+        cv2.polylines(paint, [pts], False, 255, thickness, cv2.LINE_8, SHIFT)
+        cv2.polylines(wipe, [pts], False, 0, thickness, cv2.LINE_8, SHIFT)
+
+    return blue, cv2.bitwise_not(green)
+
+
+# The deploy pipeline: the drawing is blurred on a grid DOWN_SAMPLE times coarser
+# than the background, then resampled to the map grid sent to ros.
+DOWN_SAMPLE = 5
+SIGMA = 2
+TRUNCATE = 4.0 # gaussian_filter's default
+BLUR_RADIUS = int(TRUNCATE * SIGMA + 0.5) # how far the blur reaches, in down sampled cells
+
+
+def draw_distribution(store, rect, shape, map_size):
+    """ Runs the whole deploy pipeline and returns the unnormalized (map_height, map_width) grid.
+
+    store is a StrokeStore (or anything with strokes()), rect the drawing
+    widget's (x, y, width, height), shape the background image's (rows, cols)
+    and map_size the (width, height) of the map grid.
+    """
+    # render the strokes straight at the background's size (no png round trip through the canvas)
+    attract, repel = rasterize_strokes(store.strokes(), rect, shape)
+    update = cv2.addWeighted(attract,0.5,repel,0.5,0) # sum again
+    return smooth_distribution(update, map_size)
+
+
+def smooth_distribution(update, map_size):
+    """ The end of the deploy pipeline: down samples the summed attract/repel image (the background's size), blurs it and resamples it to the map grid. """
+    h, w = update.shape[:2]
+    down_sample = cv2.resize(update,(int(w/DOWN_SAMPLE),int(h/DOWN_SAMPLE)))
+    smooth = ndimage.gaussian_filter(down_sample,sigma=SIGMA)
+    return cv2.resize(smooth,tuple(map_size)) # manually updated to match shelby map
+
+
+def image_distribution(drawing, shape, map_size):
+    """ The deploy pipeline on an exported drawing (BGR, like drawing.png or combined_output.png), the way deploys read it before strokes were rasterized.
+
+    Only pixels of the pure stroke colors count (attract blue, repel green),
+    so the map showing through a combined export is left out. shape is the
+    background's (rows, cols), the drawing is stretched to it.
+    """
+    drawing = np.asarray(drawing)
+    blue, green, red = drawing[:, :, 0], drawing[:, :, 1], drawing[:, :, 2]
+    attract = np.where((blue == 255) & (green == 0) & (red == 0), 255, 0).astype(np.uint8)
+    repel = np.where((green == 255) & (blue == 0) & (red == 0), 0, 255).astype(np.uint8) # inverted, like rasterize_strokes
+    update = cv2.addWeighted(attract,0.5,repel,0.5,0)
+    h, w = shape
+    return smooth_distribution(cv2.resize(update,(w,h)), map_size)
+
+
+def normalize_distribution(grid):
+    """ Copy of grid as float32, normalized to sum to 1 (left alone if it is all zeros). """
+    val = np.array(grid,dtype = np.float32)
+    if np.sum(val) > 0: # error handling for empty page
+        val /= np.sum(val)
+    return val
+
+
+def overlay_distribution(background, val):
+    """ The distribution as a heatmap blended over the background image (BGR, background's size). """
+    h,w = background.shape[:2]
+
+    # scale back up for cv2 
+    target_dist = val.copy()
+    target_dist -= np.min(target_dist) # shift min to 0
+    if np.max(target_dist) > 0: # error handling for empty map
+        target_dist /= np.max(target_dist) # normalize max to 1
+    target_dist *= 255 # rescale to 255 (RGB range)
+    target_dist = np.array(target_dist,dtype=np.uint8) 
+
+    # colormap
+    up_sample_vis = cv2.resize(target_dist,(w,h))
+    heatmap = cv2.applyColorMap(up_sample_vis,9) # heatmaps are 0-12
+
+    # overlap
+    return cv2.addWeighted(background,0.5,heatmap,0.8,0)
+
+
+def distribution_message(val, team):
+    """ The /tablet_comm message for a normalized distribution, and the flattened values to send in it.
+
+    The distribution fields themselves (data, or a packed/delta form of the
+    values) are added by whoever sends the message.
+    """
+    val = np.flipud(val)
+    width,height = val.shape
+    val = val.ravel()
+
+    #val = val * 1000 #trying to make sure all info values are > 10^4 (does not work otherwise)
+    #val = val*100000  #val needs to be this big for the gridmap msg to visually appear in rviz
+    val = val*MESSAGE_SCALE
+
+    msg = dict(
+        name = 'attract data',
+        team = team,
+        map_width = width, 
+        map_height = height
+        )
+    return msg, val
+
+
+@lru_cache(maxsize=64)
+def linear_resample_matrix(n_src, n_dst):
+    """ (n_dst, n_src) matrix that resamples one axis the way cv2.resize's INTER_LINEAR does.
+
+    Also returns, for each output sample, the first and last input sample it reads.
+    Results are cached and shared, don't modify them.
+    """
+    src = (np.arange(n_dst) + 0.5) * (n_src / float(n_dst)) - 0.5
+    src = np.clip(src, 0, n_src - 1)
+    lo = np.floor(src).astype(np.int64)
+    hi = np.minimum(lo + 1, n_src - 1)
+    frac = (src - lo).astype(np.float32)
+    weights = np.zeros((n_dst, n_src), dtype=np.float32)
+    rows = np.arange(n_dst)
+    weights[rows, lo] += 1 - frac
+    weights[rows, hi] += frac
+    for a in (weights, lo, hi):
+        a.flags.writeable = False
+    return weights, lo, hi
+
+
+def resample_matrices(shape, map_size):
+    """ The four resample matrices (and their reach) of the pipeline for a background of shape (rows, cols).
+
+    Background -> down sampled grid along y and x, then down sampled grid -> map grid along y and x.
+    """
+    rows, cols = shape
+    map_w, map_h = map_size
+    down_rows, down_cols = int(rows/DOWN_SAMPLE), int(cols/DOWN_SAMPLE)
+    return (linear_resample_matrix(rows, down_rows), linear_resample_matrix(cols, down_cols),
+            linear_resample_matrix(down_rows, map_h), linear_resample_matrix(down_cols, map_w))
+
+
+def _touched(lo, hi, start, stop):
+    """ Range of output samples that read any input sample in [start, stop). """
+    hit = np.nonzero((lo < stop) & (hi >= start))[0]
+    if len(hit) == 0:
+        return 0, 0
+    return int(hit[0]), int(hit[-1]) + 1
+
+
+class IncrementalDistribution(object):
+    """ Keeps the deploy pipeline's intermediate grids between deploys.
+
+    Only the tiles touched by strokes drawn (or hidden, or shown again) since
+    the last update are re-rendered, down sampled and re-blurred (padded by the blur radius), and
+    only the map cells reading those tiles are resampled. The map grid it
+    returns is unnormalized, normalizing it is left to the caller.
+
+    Results match a full recompute up to cv2's rounding of thick lines cut
+    off at a tile edge (a stray pixel here and there, before the blur).
+    """
+    def __init__(self, tile=16):
+        self.tile = tile # tile size, in down sampled cells
+        self._key = None
+
+    def _rebuild(self, store, rect, shape, map_size):
+        ((self._down_y, self._down_y_lo, self._down_y_hi), (self._down_x, self._down_x_lo, self._down_x_hi),
+         (self._map_y, self._map_y_lo, self._map_y_hi), (self._map_x, self._map_x_lo, self._map_x_hi)) = resample_matrices(shape, map_size)
+
+        attract, repel = rasterize_strokes(store.strokes(), rect, shape)
+        self.total = cv2.addWeighted(attract, 0.5, repel, 0.5, 0)
+        self.down = self._down_y @ self.total.astype(np.float32) @ self._down_x.T
+        self.smooth = ndimage.gaussian_filter(self.down, sigma=SIGMA, truncate=TRUNCATE)
+        self.grid = self._map_y @ self.smooth @ self._map_x.T
+
+        self._key = (store.generation, tuple(rect), tuple(shape), tuple(map_size))
+        self._counts = store.counts().copy()
+        self._visible = store.visibility().copy()
+
+    def reset(self):
+        """ Forget the cached grids, the next update recomputes everything. """
+        self._key = None
+
+    def update(self, store, rect, shape, map_size):
+        """ Brings the cached grids up to date with the store and returns the map grid.
+
+        rect is the drawing widget's (x, y, width, height), shape the background
+        image's (rows, cols) and map_size the (width, height) of the map grid.
+        """
+        key = (store.generation, tuple(rect), tuple(shape), tuple(map_size))
+        if key != self._key or len(store) < len(self._counts):
+            self._rebuild(store, rect, shape, map_size)
+            return self.grid
+
+        dirty = self._dirty_boxes(store, rect, shape)
+        self._counts = store.counts().copy()
+        self._visible = store.visibility().copy()
+        if dirty:
+            self._refresh(store, rect, shape, dirty)
+        return self.grid
+
+    def _dirty_boxes(self, store, rect, shape):
+        """ Pixel boxes (row0, row1, col0, col1) of whatever was drawn, hidden or shown since the last update. """
+        rows, cols = shape
+        rx, ry, rw, rh = rect
+        sx, sy = cols / float(rw), rows / float(rh)
+        counts = store.counts()
+        visible = store.visibility()
+        seen = len(self._counts)
+        boxes = []
+        for i in range(len(store)):
+            flipped = i < seen and visible[i] != self._visible[i]
+            if i < seen and counts[i] == self._counts[i] and not flipped:
+                continue
+            if not flipped and not visible[i]: # hidden all along
+                continue
+            if i < seen and not flipped: # the stroke grew, only its new tail (and the segment joining it) is dirty
+                tail = store.points(i)[self._counts[i] - 1:]
+                xmin, ymin = tail.min(axis=0)
+                xmax, ymax = tail.max(axis=0)
+            else:
+                xmin, ymin, xmax, ymax = store.bbox(i)
+            pad = KIVY_LINE_THICKNESS * store.width(i) + 1
+            c0 = int(np.floor((xmin - pad - rx) * sx))
+            c1 = int(np.ceil((xmax + pad - rx) * sx)) + 1
+            r0 = int(np.floor((ry + rh - ymax - pad) * sy))
+            r1 = int(np.ceil((ry + rh - ymin + pad) * sy)) + 1
+            r0, r1 = max(r0, 0), min(r1, rows)
+            c0, c1 = max(c0, 0), min(c1, cols)
+            if r0 < r1 and c0 < c1:
+                boxes.append((r0, r1, c0, c1))
+        return boxes
+
+    def _refresh(self, store, rect, shape, dirty):
+        rows, cols = shape
+        rx, ry, rw, rh = rect
+        sx, sy = cols / float(rw), rows / float(rh)
+        tile = self.tile
+        down_rows, down_cols = self.down.shape
+        tiles = np.zeros(((down_rows + tile - 1) // tile, (down_cols + tile - 1) // tile), dtype=bool)
+
+        # stroke boxes in pixels, to pick which strokes need redrawing in each dirty box
+        boxes = store.bboxes()
+        pad = KIVY_LINE_THICKNESS * store.widths() + 1
+        box_c0 = (boxes[:, 0] - pad - rx) * sx
+        box_c1 = (boxes[:, 2] + pad - rx) * sx
+        box_r0 = (ry + rh - boxes[:, 3] - pad) * sy
+        box_r1 = (ry + rh - boxes[:, 1] + pad) * sy
+
+        for r0, r1, c0, c1 in dirty:
+            hit = np.nonzero((box_c0 < c1) & (box_c1 >= c0) & (box_r0 < r1) & (box_r1 >= r0) & store.visibility())[0]
+            strokes = ((store.mode(i), store.width(i), store.points(i)) for i in hit)
+            attract, repel = rasterize_strokes(strokes, rect, shape, (r0, r1, c0, c1))
+            self.total[r0:r1, c0:c1] = cv2.addWeighted(attract, 0.5, repel, 0.5, 0)
+
+            d_r0, d_r1 = _touched(self._down_y_lo, self._down_y_hi, r0, r1)
+            d_c0, d_c1 = _touched(self._down_x_lo, self._down_x_hi, c0, c1)
+            tiles[d_r0 // tile:(d_r1 - 1) // tile + 1, d_c0 // tile:(d_c1 - 1) // tile + 1] = True
+
+        # down sample the dirty tiles
+        for t_r, t_c in np.argwhere(tiles):
+            d_r0, d_r1 = t_r * tile, min((t_r + 1) * tile, down_rows)
+            d_c0, d_c1 = t_c * tile, min((t_c + 1) * tile, down_cols)
+            p_r0, p_r1 = self._down_y_lo[d_r0], self._down_y_hi[d_r1 - 1] + 1
+            p_c0, p_c1 = self._down_x_lo[d_c0], self._down_x_hi[d_c1 - 1] + 1
+            block = self.total[p_r0:p_r1, p_c0:p_c1].astype(np.float32)
+            self.down[d_r0:d_r1, d_c0:d_c1] = self._down_y[d_r0:d_r1, p_r0:p_r1] @ block @ self._down_x[d_c0:d_c1, p_c0:p_c1].T
+
+        # the blur spreads each dirty tile into its neighbours
+        reach = (BLUR_RADIUS + tile - 1) // tile
+        spread = np.zeros_like(tiles)
+        for t_r, t_c in np.argwhere(tiles):
+            spread[max(t_r - reach, 0):t_r + reach + 1, max(t_c - reach, 0):t_c + reach + 1] = True
+
+        for t_r, t_c in np.argwhere(spread):
+            d_r0, d_r1 = t_r * tile, min((t_r + 1) * tile, down_rows)
+            d_c0, d_c1 = t_c * tile, min((t_c + 1) * tile, down_cols)
+            # blur the tile padded by the blur radius, where the padding hits the map
+            # edge the reflection matches what blurring the whole grid would do
+            b_r0, b_r1 = max(d_r0 - BLUR_RADIUS, 0), min(d_r1 + BLUR_RADIUS, down_rows)
+            b_c0, b_c1 = max(d_c0 - BLUR_RADIUS, 0), min(d_c1 + BLUR_RADIUS, down_cols)
+            blurred = ndimage.gaussian_filter(self.down[b_r0:b_r1, b_c0:b_c1], sigma=SIGMA, truncate=TRUNCATE)
+            self.smooth[d_r0:d_r1, d_c0:d_c1] = blurred[d_r0 - b_r0:d_r1 - b_r0, d_c0 - b_c0:d_c1 - b_c0]
+
+        # resample the map cells that read any re-blurred tile
+        for t_r, t_c in np.argwhere(spread):
+            d_r0, d_r1 = t_r * tile, min((t_r + 1) * tile, down_rows)
+            d_c0, d_c1 = t_c * tile, min((t_c + 1) * tile, down_cols)
+            m_r0, m_r1 = _touched(self._map_y_lo, self._map_y_hi, d_r0, d_r1)
+            m_c0, m_c1 = _touched(self._map_x_lo, self._map_x_hi, d_c0, d_c1)
+            if m_r0 < m_r1 and m_c0 < m_c1:
+                s_r0, s_r1 = self._map_y_lo[m_r0], self._map_y_hi[m_r1 - 1] + 1
+                s_c0, s_c1 = self._map_x_lo[m_c0], self._map_x_hi[m_c1 - 1] + 1
+                self.grid[m_r0:m_r1, m_c0:m_c1] = (self._map_y[m_r0:m_r1, s_r0:s_r1]
+                                                   @ self.smooth[s_r0:s_r1, s_c0:s_c1]
+                                                   @ self._map_x[m_c0:m_c1, s_c0:s_c1].T)
@@ -0,0 +1,189 @@
+'''
+Compact encodings for the distribution sent on /tablet_comm.
+The plain message carries the grid as a JSON list of floats, these pack it into a base64 payload instead.
+decode_distribution is what the sim side should use to read either form back.
+'''
+import base64
+import zlib
+
+import numpy as np
+
+ENCODINGS = ('json', 'float32', 'uint16')
+UINT16_LEVELS = 65535
+# about how many characters a number takes in the message's json, with its ', ' (float32 values printed as doubles, cell indices)
+JSON_FLOAT_CHARS = 23
+JSON_INDEX_CHARS = 7
+
+
+def encode_distribution(val, encoding='float32', compress=False):
+    """ Packs a distribution into the message fields that replace 'data'.
+
+    encoding -- 'float32' sends the raw little endian floats, 'uint16'
+                quantizes to 65536 levels between the min and max of val
+                (value = offset + scale*level)
+    compress -- zlib compress the bytes before base64 encoding them
+
+    Returns a dict with encoding, payload, scale and offset.
+    """
+    val = np.asarray(val, dtype=np.float32).ravel()
+    scale, offset = 1.0, 0.0
+    if encoding == 'float32':
+        raw = val.astype('<f4').tobytes()
+    elif encoding == 'uint16':
+        if len(val) > 0:
+            offset = float(val.min())
+            spread = float(val.max()) - offset
+            if spread > 0:
+                scale = spread / UINT16_LEVELS
+        levels = np.round((val - offset) / scale)
+        raw = np.clip(levels, 0, UINT16_LEVELS).astype('<u2').tobytes()
+    else:
+        raise ValueError('unknown encoding {} (expected float32 or uint16)'.format(encoding))
+
+    if compress:
+        raw = zlib.compress(raw)
+        encoding += '+zlib'
+    return dict(
+        encoding = encoding,
+        payload = base64.b64encode(raw).decode('ascii'),
+        scale = scale,
+        offset = offset
+        )
+
+
+def decode_distribution(msg):
+    """ Reads the distribution back out of a /tablet_comm message (a dict).
+
+    Works for the plain 'data' list, the packed payload and Fourier coefficients
+    (reconstructed), and returns a float32 array shaped (map_width, map_height)
+    like the grid the tablet flattened.
+    """
+    encoding = msg.get('encoding') or 'json'
+    if encoding == 'fourier':
+        from .fourier import reconstruct
+        k = msg['fourier_k']
+        return reconstruct(np.reshape(msg['coefficients'], (k, k)), (msg['map_width'], msg['map_height']))
+    if encoding == 'json':
+        val = np.asarray(msg['data'], dtype=np.float32)
+    else:
+        raw = base64.b64decode(msg['payload'])
+        if encoding.endswith('+zlib'):
+            raw = zlib.decompress(raw)
+            encoding = encoding[:-len('+zlib')]
+        if encoding == 'float32':
+            val = np.frombuffer(raw, dtype='<f4').astype(np.float32)
+        elif encoding == 'uint16':
+            val = np.frombuffer(raw, dtype='<u2') * np.float32(msg['scale']) + np.float32(msg['offset'])
+        else:
+            raise ValueError('unknown encoding {}'.format(msg['encoding']))
+    return val.reshape(msg['map_width'], msg['map_height'])
+
+
+def distribution_fields(val, encoding='json', compress=False):
+    """ Message fields carrying a whole distribution: a plain 'data' list, or a packed payload. """
+    if encoding == 'json':
+        return dict(data = np.asarray(val, dtype=np.float32).ravel().tolist())
+    fields = encode_distribution(val, encoding, compress)
+    fields['data'] = []
+    return fields
+
+
+def payload_bytes(msg):
+    """ About how many bytes the distribution fields of msg take as json, without serializing it.
+
+    Exact for a packed payload, estimated from the number of values for the
+    lists (data, delta/sparse indices and values, Fourier coefficients).
+    """
+    size = len(msg.get('payload') or '')
+    size += JSON_FLOAT_CHARS * sum(len(msg.get(name) or ()) for name in ('data', 'values', 'coefficients'))
+    size += JSON_INDEX_CHARS * len(msg.get('indices') or ())
+    return size
+
+
+class DeltaEncoder(object):
+    """ Sends only what changed since the last distribution that went out.
+
+    Every message gets a sequence number and a frame type:
+    key    -- the whole distribution (data or payload, as distribution_fields)
+    delta  -- indices and new values of the cells that changed since base_seq
+    sparse -- indices and values of every non-zero cell, zero everywhere else
+    Every keyframe_every-th message, and the first one after reset() (call it
+    when the connection drops), is a keyframe. Otherwise whichever of the
+    three is smallest is sent. Changes are measured against what subscribers
+    decoded: after a uint16 keyframe a cell only counts as changed once it
+    is more than half a quantization step away from its decoded value.
+    """
+    def __init__(self, keyframe_every=20):
+        self.keyframe_every = keyframe_every
+        self.seq = 0
+        self._last = None # the grid as subscribers have it
+        self._tolerance = 0.0 # half the quantization step of the last keyframe
+        self._since_key = 0
+
+    def reset(self):
+        """ The next frame is a keyframe (subscribers may have missed what we sent). """
+        self._last = None
+
+    def encode(self, val, encoding='json', compress=False):
+        val = np.asarray(val, dtype=np.float32).ravel()
+        self.seq += 1
+        fields = dict(seq = self.seq, base_seq = 0, indices = [], values = [])
+
+        changed = nonzero = None
+        if (self._last is not None and len(self._last) == len(val)
+                and self._since_key < self.keyframe_every - 1):
+            changed = np.flatnonzero(np.abs(val - self._last) > self._tolerance)
+            nonzero = np.flatnonzero(val)
+
+        if changed is None or min(len(changed), len(nonzero)) * 2 >= len(val):
+            fields['frame'] = 'key'
+            fields.update(distribution_fields(val, encoding, compress))
+            self._since_key = 0
+            self._tolerance = 0.0
+            last = val
+            if encoding == 'uint16': # later deltas are against what subscribers decoded, not what we had
+                last = decode_distribution(dict(fields, map_width=len(val), map_height=1)).ravel()
+                self._tolerance = fields['scale'] / 2.0 if np.ptp(val) > 0 else 0.0 # a flat grid decodes exactly
+        else:
+            if len(changed) <= len(nonzero):
+                fields['frame'] = 'delta'
+                fields['base_seq'] = self.seq - 1
+                cells = changed
+            else:
+                fields['frame'] = 'sparse'
+                cells = nonzero
+            fields['indices'] = cells.tolist()
+            fields['values'] = val[cells].tolist()
+            fields['data'] = []
+            self._since_key += 1
+            last = self._last.copy() if fields['frame'] == 'delta' else np.zeros_like(val)
+            last[cells] = val[cells]
+
+        self._last = np.array(last, dtype=np.float32)
+        return fields
+
+
+class DeltaDecoder(object):
+    """ Rebuilds the distribution from the frames a DeltaEncoder sends. """
+    def __init__(self):
+        self.seq = None
+        self.grid = None
+
+    def apply(self, msg):
+        """ Applies one message and returns the current grid, or None while waiting for a keyframe. """
+        frame = msg.get('frame') or 'key'
+        shape = (msg['map_width'], msg['map_height'])
+        if frame == 'key':
+            self.grid = decode_distribution(msg).copy()
+        elif frame == 'sparse':
+            self.grid = np.zeros(shape, dtype=np.float32)
+            self.grid.ravel()[np.asarray(msg['indices'], dtype=np.int64)] = msg['values']
+        elif frame == 'delta':
+            if self.grid is None or self.seq != msg['base_seq'] or self.grid.shape != shape:
+                self.grid = None # missed something, wait for the next keyframe
+                return None
+            self.grid.ravel()[np.asarray(msg['indices'], dtype=np.int64)] = msg['values']
+        else:
+            raise ValueError('unknown frame type {}'.format(frame))
+        self.seq = msg.get('seq')
+        return self.grid
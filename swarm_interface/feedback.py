@@ -0,0 +1,171 @@
+'''
+What the agents do with the distribution, shown on the tablet instead of only in Rviz: the pose of
+every agent of both teams, subscribed from rosbridge over the client the tablet already publishes
+with, and each team's time averaged coverage of the map scored with the ergodic metric against the
+last distribution deployed. rosbridge throttles the pose topics to the overlay's rate, the roslibpy
+callbacks only keep the newest message, and a background thread decodes, decimates and accumulates
+them, so the drawing widget just picks up the latest snapshot once a frame.
+Agent positions are in map cells (x along the map width, y up), like the published grid.
+'''
+import collections
+import math
+import threading
+import time
+
+import numpy as np
+
+from .lazy import roslibpy
+from .fourier import ergodic_metric, ERGODIC_K
+
+AGENT_TOPICS = (('red', '/red_agents'), ('blue', '/blue_agents')) # (team, topic) of each team's poses
+POSE_TYPE = 'geometry_msgs/PoseArray'
+RATE = 15.0 # snapshots per second (and the rate rosbridge throttles the pose topics to)
+MAX_AGENTS = 1000 # per team, larger swarms are decimated to about this many
+HORIZON = 60.0 # seconds of the exponential time average of the coverage
+METRIC_PERIOD = 1.0 # seconds between ergodic metric updates
+
+# what the widget reads: agents is team -> (n, 3) float32 x, y, heading, metrics team -> ergodic metric (None before a target)
+FeedbackSnapshot = collections.namedtuple('FeedbackSnapshot', 'version agents metrics')
+
+
+def pose_array(msg, max_agents=MAX_AGENTS):
+    """ (n, 3) float32 x, y and heading of the poses of a PoseArray message, every k-th one if there are more than max_agents. """
+    poses = msg.get('poses') or []
+    step = -(-len(poses) // max_agents) if len(poses) > max_agents else 1
+    rows = []
+    for pose in poses[::step]:
+        position, orientation = pose['position'], pose.get('orientation') or {}
+        # yaw of a rotation about z (the agents move in the plane)
+        heading = 2.0 * math.atan2(orientation.get('z', 0.0), orientation.get('w', 1.0))
+        rows.append((position['x'], position['y'], heading))
+    return np.array(rows, dtype=np.float32).reshape(-1, 3)
+
+
+class AgentFeedback(object):
+    """ Agent poses and coverage of both teams, boiled down on a background thread. Thread safe.
+
+    With a roslibpy client it subscribes to topics, otherwise messages come in
+    through receive(team, msg). shape is the (rows, cols) map grid the
+    coverage is counted on, set_target gives the distribution (same
+    orientation, row 0 at the bottom) the ergodic metric is measured against.
+    latest() is the newest FeedbackSnapshot, its version only changes when
+    something new arrived.
+    """
+    def __init__(self, client=None, shape=(50, 50), topics=AGENT_TOPICS, rate=RATE, max_agents=MAX_AGENTS,
+                 horizon=HORIZON, k=ERGODIC_K, metrics=None):
+        self.rate = rate
+        self.max_agents = max_agents
+        self.horizon = horizon
+        self.k = k
+        self.metrics = metrics # a metrics.Metrics to time the ticks into
+        self.received = collections.Counter() # messages per team
+        self.teams = [team for team, _ in topics]
+        self._incoming = {} # team -> newest message not decoded yet
+        self._agents = {team: np.zeros((0, 3), dtype=np.float32) for team in self.teams}
+        self._metrics = dict.fromkeys(self.teams)
+        self._target = None
+        self._metric_due = 0.0
+        self._version = 0
+        self._snapshot = FeedbackSnapshot(0, dict(self._agents), dict(self._metrics))
+        self._lock = threading.Lock()
+        self.shape = None
+        self.set_shape(shape)
+
+        self._topics = []
+        if client is not None:
+            for team, topic in topics:
+                # rosbridge drops what we would not look at anyway, only the newest message waits
+                listener = roslibpy.Topic(client, topic, POSE_TYPE, throttle_rate=int(1000 / rate), queue_length=1)
+                listener.subscribe(lambda msg, team=team: self.receive(team, msg))
+                self._topics.append(listener)
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='agent feedback')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def receive(self, team, msg):
+        """ Keeps msg as the team's newest poses (called from roslibpy's thread, so it does nothing else). """
+        with self._lock:
+            self._incoming[team] = msg
+            self.received[team] += 1
+
+    def set_shape(self, shape):
+        """ Counts coverage on a (rows, cols) grid from now on (starting over if it changed). """
+        shape = tuple(int(n) for n in shape)
+        with self._lock:
+            if self.shape == shape:
+                return
+            self.shape = shape
+            self._coverage = {team: np.zeros(shape, dtype=np.float64) for team in self.teams}
+            self._target = None
+
+    def set_target(self, grid):
+        """ The distribution the agents were sent, (rows, cols) with row 0 at the bottom. """
+        grid = np.array(grid, dtype=np.float64)
+        self.set_shape(grid.shape)
+        with self._lock:
+            self._target = grid
+        self._metric_due = 0.0
+
+    def latest(self):
+        return self._snapshot
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stopped.wait(1.0 / self.rate):
+            now = time.perf_counter()
+            self.tick(now - last, now)
+            last = now
+
+    def tick(self, dt, now=None):
+        """ Decodes what arrived, adds dt seconds of every agent where it is to the coverage and updates the snapshot. """
+        start = time.perf_counter()
+        now = start if now is None else now
+        with self._lock:
+            incoming, self._incoming = self._incoming, {}
+        changed = False
+        for team, msg in incoming.items():
+            if team in self._agents:
+                self._agents[team] = pose_array(msg, self.max_agents)
+                changed = True
+
+        with self._lock:
+            rows, cols = self.shape
+            decay = math.exp(-dt / self.horizon)
+            for team, agents in self._agents.items():
+                coverage = self._coverage[team]
+                coverage *= decay
+                x, y = np.floor(agents[:, 0]).astype(np.int64), np.floor(agents[:, 1]).astype(np.int64)
+                inside = (x >= 0) & (x < cols) & (y >= 0) & (y < rows) # agents off the map cover nothing
+                coverage += dt * np.bincount(y[inside] * cols + x[inside], minlength=rows * cols).reshape(rows, cols)
+            if self._target is not None and now >= self._metric_due:
+                self._metric_due = now + METRIC_PERIOD
+                for team in self.teams:
+                    coverage = self._coverage[team]
+                    self._metrics[team] = ergodic_metric(coverage, self._target, self.k) if coverage.any() else None
+                changed = True
+
+        if changed:
+            self._version += 1
+            self._snapshot = FeedbackSnapshot(self._version, dict(self._agents), dict(self._metrics))
+        if self.metrics is not None:
+            self.metrics.since('feedback_tick_seconds', start)
+
+    def coverage(self, team):
+        """ Copy of a team's time averaged coverage, normalized to sum to 1 (zeros before any pose came in). """
+        with self._lock:
+            grid = self._coverage[team].copy()
+        total = grid.sum()
+        return grid / total if total > 0 else grid
+
+    def close(self):
+        """ Stops the thread and the subscriptions (the client stays up). """
+        self._stopped.set()
+        self._thread.join(1.0)
+        for listener in self._topics:
+            try:
+                listener.unsubscribe()
+            except Exception as e:
+                print('Unsubscribing from {} failed: {}'.format(listener.name, e))
+        self._topics = []
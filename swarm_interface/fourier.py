@@ -0,0 +1,128 @@
+'''
+Ergodic Fourier coefficients of the distribution: what an ergodic controller actually uses of it.
+With --fourier K the tablet sends the first K x K cosine coefficients instead of the dense grid, a
+few hundred numbers instead of tens of thousands, and the agents no longer redo the projection.
+The basis is the one of the ergodic metric on the unit square, F_k(x) = prod_i cos(k_i pi x_i) / h_k,
+sampled at the cell centres (on a grid that is the DCT-II, so K equal to the grid size is lossless).
+    python -m swarm_interface.fourier val.csv [--k 4 8 16 32]
+reports how well each K reproduces a saved grid. ergodic_metric compares what the agents covered
+with the distribution they were sent.
+'''
+import argparse
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+FOURIER_K = (4, 8, 16, 32) # what the error report tries by default
+ERGODIC_K = 16 # coefficients per axis of the ergodic metric
+
+
+@lru_cache(maxsize=32)
+def fourier_basis(n, k):
+    """ (k, n) table of the first k normalized cosines at the centres of n cells.
+
+    Cached and shared, don't modify it.
+    """
+    x = (np.arange(n) + 0.5) / n
+    order = np.arange(k)[:, None]
+    basis = np.cos(np.pi * order * x) * np.where(order == 0, 1.0, np.sqrt(2.0)) # 1 / h_k
+    basis = basis.astype(np.float64)
+    basis.flags.writeable = False
+    return basis
+
+
+def fourier_coefficients(grid, k):
+    """ (k, k) coefficients phi_k = sum over cells of grid * F_k, of a 2-D grid (axis 0 pairs with k[0]).
+
+    grid is taken as the mass in each cell (a normalized distribution gives
+    the ergodic coefficients, phi_0 is the total).
+    """
+    grid = np.asarray(grid, dtype=np.float64)
+    rows, cols = grid.shape
+    return fourier_basis(rows, k) @ grid @ fourier_basis(cols, k).T
+
+
+def reconstruct(coefficients, shape, clip=True):
+    """ The grid of the given shape that coefficients describe (mass per cell).
+
+    Truncated series ring a little below zero, clip sets those cells to 0
+    (and rescales so the total stays phi_0).
+    """
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    rows, cols = shape
+    # orders past the number of cells alias onto lower ones on the grid, they add nothing
+    k_rows, k_cols = min(coefficients.shape[0], rows), min(coefficients.shape[1], cols)
+    grid = fourier_basis(rows, k_rows).T @ coefficients[:k_rows, :k_cols] @ fourier_basis(cols, k_cols) / (rows * cols)
+    if clip:
+        total = grid.sum()
+        grid = np.maximum(grid, 0)
+        if grid.sum() > 0:
+            grid *= total / grid.sum()
+    return grid.astype(np.float32)
+
+
+def fourier_error(grid, k):
+    """ How far the K x K reconstruction of grid is from it.
+
+    Returns compare_distributions' total_variation, max_error and correlation,
+    plus 'l2' (relative L2 error, before clipping) and 'numbers' sent (K * K,
+    against 'cells' for the dense grid).
+    """
+    from .analytic import compare_distributions
+    grid = np.asarray(grid, dtype=np.float64)
+    k = min(k, max(grid.shape))
+    coefficients = fourier_coefficients(grid, k)
+    raw = reconstruct(coefficients, grid.shape, clip=False)
+    report = compare_distributions(reconstruct(coefficients, grid.shape), grid)
+    norm = np.linalg.norm(grid)
+    report.update(l2 = float(np.linalg.norm(raw - grid) / norm) if norm > 0 else 0.0,
+                  numbers = k * k, cells = grid.size)
+    return report
+
+
+def ergodic_metric(coverage, target, k=ERGODIC_K):
+    """ The ergodic metric sum_k Lambda_k (c_k - phi_k)^2 between two grids of the same shape.
+
+    Both are normalized to sum to 1 first (coverage is how long the agents
+    spent in each cell), Lambda_k = (1 + |k|^2)^-1.5 weighs the coarse
+    orders most. 0 means the agents covered the map exactly as asked.
+    """
+    coverage = np.asarray(coverage, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    k = min(k, max(target.shape))
+    order = np.arange(k)
+    weights = (1.0 + order[:, None] ** 2 + order[None, :] ** 2) ** -1.5
+    difference = 0.0
+    for grid, sign in ((coverage, 1.0), (target, -1.0)):
+        total = grid.sum()
+        if total > 0:
+            difference = difference + sign * fourier_coefficients(grid / total, k)
+    return float(np.sum(weights * np.square(difference)))
+
+
+def fourier_fields(val, shape, k):
+    """ Message fields carrying the distribution as coefficients (val flattened from a grid of shape, like 'data').
+
+    K is capped at the longest side of the grid, more would not say anything new.
+    """
+    k = min(k, max(shape))
+    coefficients = fourier_coefficients(np.asarray(val, dtype=np.float64).reshape(shape), k)
+    return dict(encoding = 'fourier', fourier_k = k, coefficients = coefficients.astype(np.float32).ravel().tolist(), data = [])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report how well K x K Fourier coefficients reproduce a distribution grid')
+    parser.add_argument('grid', help='comma separated grid, like val.csv')
+    parser.add_argument('--k', type=int, nargs='+', default=FOURIER_K, help='numbers of coefficients per axis to try')
+    args = parser.parse_args(argv)
+
+    grid = np.loadtxt(args.grid, delimiter=',', ndmin=2)
+    print('{}: {} x {} grid, {} cells'.format(args.grid, grid.shape[1], grid.shape[0], grid.size))
+    for k in args.k:
+        report = fourier_error(grid, k)
+        print('K={:<4d} {numbers:6d} numbers  total variation {total_variation:.4f}  max error {max_error:.3f}  correlation {correlation:.4f}  relative L2 {l2:.4f}'.format(k, **report))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
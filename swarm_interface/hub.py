@@ -0,0 +1,192 @@
+'''
+Aggregation hub for several tablets on one team: subscribes to what every tablet publishes, keeps
+the latest distribution of each, and republishes their weighted average (by the `weight` field)
+as the team's distribution at a fixed rate, whatever the number of tablets or how often they deploy.
+    python -m swarm_interface.hub --team red [--address localhost] [--input /tablet_comm_raw] [--output /tablet_comm] [--rate 5]
+Point the tablets at the input topic with --topic /tablet_comm_raw (and give each one a --tablet name).
+'''
+import argparse
+import math
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .encoding import DeltaDecoder, ENCODINGS
+from .transport import POLICIES
+
+MESSAGE_TYPE = 'ergodic_humanswarmcollab_sim/tablet'
+
+
+class TeamAggregator(object):
+    """ Latest distribution of every tablet of a team, merged on demand. Thread safe.
+
+    Each tablet (told apart by the 'tablet' field) gets a row of a (tablets,
+    cells) array, merging is one weighted sum over the rows. No weight counts
+    as 1 (messages from tablets that don't set it), a weight of 0 leaves the
+    tablet out of the merge, and messages with a negative or non-finite weight
+    are ignored. If a tablet sends a different map size the others are
+    dropped, the newest map wins.
+    """
+    def __init__(self, team):
+        self.team = team
+        self.shape = None # (map_width, map_height) of the rows
+        self.received = 0
+        self.ignored = 0
+        self.version = 0 # bumped by every update that changes the merge
+        self._decoders = {}
+        self._rows = {} # tablet -> row
+        self._grids = np.zeros((0, 0), dtype=np.float32)
+        self._weights = np.zeros(0, dtype=np.float64)
+        self._lock = threading.Lock()
+
+    def update(self, msg):
+        """ Takes one tablet message, returns True if the merged distribution changed. """
+        if msg.get('team') != self.team:
+            self.ignored += 1
+            return False
+        try:
+            weight = float(msg.get('weight', 1))
+        except (TypeError, ValueError):
+            weight = -1.0
+        if not math.isfinite(weight) or weight < 0:
+            self.ignored += 1
+            return False
+        tablet = msg.get('tablet') or ''
+        decoder = self._decoders.setdefault(tablet, DeltaDecoder())
+        grid = decoder.apply(msg) # plain, packed, keyframe or delta
+        if grid is None:
+            self.ignored += 1
+            return False
+        shape = (int(msg['map_width']), int(msg['map_height']))
+        with self._lock:
+            self.received += 1
+            if shape != self.shape:
+                self.shape = shape
+                self._rows = {}
+                self._grids = np.zeros((0, shape[0] * shape[1]), dtype=np.float32)
+                self._weights = np.zeros(0, dtype=np.float64)
+            row = self._rows.get(tablet)
+            if row is None:
+                row = self._rows[tablet] = len(self._rows)
+                if row >= len(self._weights): # grow by doubling, rows are reused in place after that
+                    grids = np.zeros((max(4, 2 * len(self._weights)), self._grids.shape[1]), dtype=np.float32)
+                    grids[:len(self._grids)] = self._grids
+                    weights = np.zeros(len(grids), dtype=np.float64)
+                    weights[:len(self._weights)] = self._weights
+                    self._grids, self._weights = grids, weights
+            self._grids[row] = grid.ravel()
+            self._weights[row] = weight
+            self.version += 1
+        return True
+
+    def forget(self, tablet):
+        """ Leaves a tablet out of the merge (until it sends again). """
+        with self._lock:
+            row = self._rows.get(tablet)
+            if row is not None:
+                self._weights[row] = 0
+                self.version += 1
+        self._decoders.pop(tablet, None)
+
+    @property
+    def tablets(self):
+        with self._lock:
+            return sorted(tablet for tablet, row in self._rows.items() if self._weights[row] > 0)
+
+    def merge(self):
+        """ (flattened weighted average, total weight), or (None, 0) before any tablet has sent. """
+        with self._lock:
+            total = self._weights.sum()
+            if total <= 0:
+                return None, 0
+            merged = (self._weights @ self._grids) / total
+        return merged.astype(np.float32), total
+
+
+class Hub(object):
+    """ Republishes an aggregator's merge at most rate times a second, and only when it changed.
+
+    publish(msg, val) sends it (ros_interface.publish_distribution).
+    """
+    def __init__(self, aggregator, publish, rate=5.0, name='hub'):
+        if not rate > 0:
+            raise ValueError('rate must be more than 0 merged messages a second, got {!r}'.format(rate))
+        self.aggregator = aggregator
+        self.publish = publish
+        self.period = 1.0 / rate
+        self.name = name
+        self.published = 0
+        self._sent_version = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='hub')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.period):
+            self.tick()
+
+    def tick(self):
+        """ Publishes the merge if anything arrived since the last one. Returns whether it did. """
+        version = self.aggregator.version
+        if version == self._sent_version:
+            return False
+        merged, total = self.aggregator.merge()
+        self._sent_version = version
+        if merged is None:
+            return False
+        width, height = self.aggregator.shape
+        msg = dict(name = 'attract data', team = self.aggregator.team, tablet = self.name,
+                   weight = int(round(total)), map_width = width, map_height = height)
+        self.publish(msg, merged)
+        self.published += 1
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(1.0)
+
+
+def main(argv=None):
+    from .lazy import roslibpy
+    from .transport import ros_interface
+
+    parser = argparse.ArgumentParser(description='Merge the distributions of all tablets on a team into one')
+    parser.add_argument('--team', required=True, choices=('red', 'blue'))
+    parser.add_argument('--address', default='localhost', help='rosbridge host')
+    parser.add_argument('--port', type=int, default=9090, help='rosbridge port')
+    parser.add_argument('--input', default='/tablet_comm_raw', help='topic the tablets publish on')
+    parser.add_argument('--output', default='/tablet_comm', help='topic for the merged distribution')
+    parser.add_argument('--rate', type=float, default=5.0, help='max merged messages per second')
+    parser.add_argument('--encoding', choices=ENCODINGS, default='json')
+    parser.add_argument('--compress', action='store_true')
+    parser.add_argument('--delta', action='store_true')
+    parser.add_argument('--fourier', type=int, default=0, metavar='K', help='send K x K Fourier coefficients of the merge')
+    parser.add_argument('--drop-policy', choices=POLICIES, default='coalesce')
+    args = parser.parse_args(argv)
+    if not args.rate > 0:
+        parser.error('--rate must be more than 0')
+
+    ros = ros_interface(args.team, 'no', args.address, args.port, delta=args.delta, encoding=args.encoding,
+                        compress=args.compress, policy=args.drop_policy, topic=args.output,
+                        fourier=args.fourier)
+    aggregator = TeamAggregator(args.team)
+    listener = roslibpy.Topic(ros.client, args.input, MESSAGE_TYPE)
+    listener.subscribe(aggregator.update)
+    hub = Hub(aggregator, ros.publish_distribution, args.rate)
+    print('merging the {} team tablets from {} into {}'.format(args.team, args.input, args.output))
+    try:
+        while True:
+            time.sleep(5)
+            print('tablets: {}  received: {}  published: {}'.format(', '.join(aggregator.tablets) or '-', aggregator.received, hub.published))
+    except KeyboardInterrupt:
+        pass
+    hub.stop()
+    listener.unsubscribe()
+    ros.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+'''
+Timestamped journal of the touch events and deploys on the touchscreen, with a headless replay.
+Record a session with --journal <file>, then replay it without a window to benchmark it:
+    python -m swarm_interface.journal session.jrn [--incremental | --analytic | --layered] [--json results.json]
+This reports the time spent handling each touch event and the touch -> publish latency of each
+deploy, both as recorded on the tablet and as replayed through StrokeRecorder and the deploy pipeline.
+'''
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .strokes import StrokeRecorder
+
+MAGIC = b'JRN1'
+# one record per event: event, time (s since the journal started), touch id, x, y, draw mode, brush width,
+# and how long the tablet took to handle the event (s)
+RECORD = struct.Struct('<BdqffBff')
+RECORD_DTYPE = np.dtype([('event', 'u1'), ('t', '<f8'), ('touch', '<i8'), ('x', '<f4'), ('y', '<f4'),
+                         ('mode', 'u1'), ('width', '<f4'), ('handler', '<f4')])
+
+# event types
+DOWN, MOVE, UP, DEPLOY, PUBLISHED, CLEAR, CONFIG, UNDO, REDO = range(9)
+# a CONFIG record is followed by its settings as JSON, padded to a whole number of records
+# (the count is kept in its touch field)
+
+DRAW_MODES = ('none', 'attract', 'repel', 'erase') # erase: the width is the eraser's radius
+
+
+class Journal(object):
+    """ Buffered binary journal writer. Safe to use from several threads (deploys finish on the publish worker). """
+    def __init__(self, path, flush_every=1024):
+        self.path = path
+        self.flush_every = flush_every
+        self.start = time.perf_counter() # journal times are relative to this
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._config = None
+
+    def record(self, event, start, touch_id=-1, x=0.0, y=0.0, mode='none', width=0.0, handler=0.0):
+        """ Adds an event that happened at start (a time.perf_counter() reading). """
+        code = DRAW_MODES.index(mode) if mode in DRAW_MODES else 0
+        packed = RECORD.pack(event, start - self.start, touch_id, x, y, code, width, handler)
+        with self._lock:
+            self._buffer += packed
+            if len(self._buffer) >= self.flush_every * RECORD.size:
+                self._flush()
+
+    def config(self, **settings):
+        """ Records the settings replay needs (only when they changed). """
+        if settings == self._config:
+            return
+        self._config = settings
+        payload = json.dumps(settings).encode('utf-8')
+        payload += b' ' * (-len(payload) % RECORD.size)
+        header = RECORD.pack(CONFIG, time.perf_counter() - self.start, len(payload) // RECORD.size, 0, 0, 0, 0, 0)
+        with self._lock:
+            self._buffer += header + payload
+
+    def _flush(self):
+        if self._buffer and self._file is not None:
+            self._file.write(self._buffer)
+            self._file.flush()
+            self._buffer = bytearray()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_journal(path):
+    """ Returns the events (a RECORD_DTYPE array, CONFIG records excluded) and
+    a list of (index, settings): settings apply from events[index] on. """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError('{} is not a touch journal'.format(path))
+    body = raw[len(MAGIC):]
+    body = body[:len(body) - len(body) % RECORD.size] # drop a record cut short by a crash
+    records = np.frombuffer(body, dtype=RECORD_DTYPE)
+
+    keep = np.ones(len(records), dtype=bool)
+    configs = []
+    # JSON is printable text, so a padding row never starts with the CONFIG byte
+    for c in np.flatnonzero(records['event'] == CONFIG):
+        n = int(records['touch'][c])
+        payload = body[(c + 1) * RECORD.size:(c + 1 + n) * RECORD.size]
+        keep[c:c + 1 + n] = False
+        configs.append((int(np.count_nonzero(keep[:c])), json.loads(payload.decode('utf-8'))))
+    return records[keep], configs
+
+
+def _load_background(settings, directory):
+    from .assets import open_map
+    for folder in (directory, os.getcwd()):
+        name = os.path.join(folder, settings['map_name'])
+        if os.path.exists(name):
+            return open_map(name).image # a pyramid directory gives the level the session rendered at
+    rows, cols = settings['background_shape']
+    return np.zeros((rows, cols, 3), dtype=np.uint8)
+
+
+def replay(path, incremental=None, encoding='json', analytic=None, layered=None, messages=True, on_deploy=None):
+    """ Feeds a journal through StrokeRecorder and the deploy pipeline, without a window.
+
+    incremental -- use IncrementalDistribution for deploys (None: whatever the session used)
+    analytic    -- use analytic_distribution for deploys (None: whatever the session used)
+    layered     -- use LayeredDistribution for deploys (None: whatever the session used)
+    messages    -- also build the overlay and the encoded message of each deploy, like the tablet
+    on_deploy   -- called with the normalized grid and the seconds it took, for every deploy
+
+    Returns a dict of timings in seconds: 'handler' (one per touch event)
+    and, per deploy, 'deploy' (pipeline time) and 'latency' (from the start
+    of the last touch event before the deploy to the message being ready).
+    """
+    from .distribution import (draw_distribution, normalize_distribution, overlay_distribution,
+                               distribution_message, IncrementalDistribution)
+    from .encoding import distribution_fields
+    from .analytic import analytic_distribution, LayeredDistribution
+
+    events, configs = read_journal(path)
+    directory = os.path.dirname(os.path.abspath(path))
+    recorder = StrokeRecorder()
+    engine = IncrementalDistribution()
+    layers = LayeredDistribution()
+    settings, background = {}, None
+    handler, deploy, latency = [], [], []
+    last_touch = None
+
+    configs = list(configs)
+    for i, event in enumerate(events):
+        while configs and configs[0][0] <= i:
+            settings = configs.pop(0)[1]
+            recorder.rect = tuple(settings['rect'])
+            recorder.simplifier.method = settings.get('simplify', 'none')
+            recorder.simplifier.tolerance = settings.get('tolerance', 0.0)
+            background = None
+
+        kind = event['event']
+        start = time.perf_counter()
+        if kind == DOWN:
+            recorder.down(int(event['touch']), float(event['x']), float(event['y']), DRAW_MODES[event['mode']], float(event['width']))
+        elif kind == MOVE:
+            recorder.move(int(event['touch']), float(event['x']), float(event['y']))
+        elif kind == UP:
+            recorder.up(int(event['touch']))
+        elif kind == CLEAR:
+            recorder.clear()
+            continue
+        elif kind == UNDO:
+            recorder.undo()
+            continue
+        elif kind == REDO:
+            recorder.redo()
+            continue
+        elif kind == DEPLOY:
+            if background is None:
+                background = _load_background(settings, directory)
+            shape = background.shape[:2]
+            store = recorder.store.snapshot()
+            # picking an engine on the command line overrides the session's
+            if incremental is None and analytic is None and layered is None:
+                use_engine, use_analytic, use_layered = (settings.get(name, False) for name in ('incremental', 'analytic', 'layered'))
+            else:
+                use_engine, use_analytic, use_layered = bool(incremental), bool(analytic), bool(layered)
+            if use_layered:
+                up_sample = layers.update(store, recorder.rect, shape, settings['map_size'])
+            elif use_analytic:
+                up_sample = analytic_distribution(store, recorder.rect, shape, settings['map_size'], settings.get('sigma'))
+            elif use_engine:
+                up_sample = engine.update(store, recorder.rect, shape, settings['map_size'])
+            else:
+                up_sample = draw_distribution(store, recorder.rect, shape, settings['map_size'])
+            grid = normalize_distribution(up_sample)
+            if messages:
+                overlay_distribution(background, grid)
+                msg, val = distribution_message(grid, settings.get('team'))
+                msg.update(distribution_fields(val, encoding))
+            done = time.perf_counter()
+            deploy.append(done - start)
+            if last_touch is not None:
+                latency.append(done - last_touch)
+            if on_deploy is not None:
+                on_deploy(grid, done - start)
+            continue
+        else:
+            continue
+        handler.append(time.perf_counter() - start)
+        last_touch = start
+
+    return dict(handler = np.array(handler), deploy = np.array(deploy), latency = np.array(latency))
+
+
+def recorded_timings(path):
+    """ The same timings as replay, as they were measured on the tablet.
+
+    latency runs from the last touch event before a deploy was asked for to
+    the end of the publish that came out of it (later deploys replace ones
+    still waiting, so several requests can end in one publish).
+    """
+    events, _ = read_journal(path)
+    kinds = events['event']
+    touches = np.isin(kinds, (DOWN, MOVE, UP))
+    latency = []
+    last_touch = requested = None
+    for kind, t in zip(kinds, events['t']):
+        if kind in (DOWN, MOVE, UP):
+            last_touch = t
+        elif kind == DEPLOY and last_touch is not None:
+            requested = last_touch if requested is None else requested
+        elif kind == PUBLISHED and requested is not None:
+            latency.append(t - requested)
+            requested = None
+    return dict(handler = events['handler'][touches].astype(np.float64), latency = np.array(latency))
+
+
+def summarize(samples):
+    """ count, mean, p50, p95, p99 and max of a timing array, in milliseconds. """
+    if len(samples) == 0:
+        return dict(count = 0)
+    ms = np.asarray(samples) * 1e3
+    return dict(
+        count = int(len(ms)),
+        mean = float(ms.mean()),
+        p50 = float(np.percentile(ms, 50)),
+        p95 = float(np.percentile(ms, 95)),
+        p99 = float(np.percentile(ms, 99)),
+        max = float(ms.max())
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a touch journal without a window and report handler and touch -> publish times')
+    parser.add_argument('journal', help='journal recorded with --journal')
+    parser.add_argument('--incremental', help='replay deploys with the incremental pipeline (default: what the session used)', action='store_true', default=None)
+    parser.add_argument('--analytic', help='replay deploys with the analytic engine (default: what the session used)', action='store_true', default=None)
+    parser.add_argument('--layered', help='replay deploys with the layered accumulation buffer (default: what the session used)', action='store_true', default=None)
+    parser.add_argument('--encoding', help='message encoding to time', choices=('json', 'float32', 'uint16'), default='json')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = dict(journal = args.journal)
+    results['recorded'] = {name: summarize(v) for name, v in recorded_timings(args.journal).items()}
+    results['replayed'] = {name: summarize(v) for name, v in replay(args.journal, args.incremental, args.encoding, args.analytic, args.layered).items()}
+
+    for source in ('recorded', 'replayed'):
+        for name, stats in sorted(results[source].items()):
+            if stats['count']:
+                print('{:9s} {:8s} n={count:<6d} mean={mean:8.3f}ms p50={p50:8.3f}ms p95={p95:8.3f}ms max={max:8.3f}ms'.format(source, name, **stats))
+            else:
+                print('{:9s} {:8s} n=0'.format(source, name))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
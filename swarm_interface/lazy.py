@@ -0,0 +1,43 @@
+'''
+Heavy dependencies, imported the first time they are used instead of at startup.
+    from swarm_interface.lazy import cv2
+    cv2.imread(...)  # cv2 is imported here
+'''
+import importlib
+import sys
+import threading
+
+
+class LazyModule(object):
+    """ Stands in for a module and imports it the first time one of its attributes is used. """
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        module = sys.modules.get(self._name)
+        if module is None:
+            module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def loaded(self):
+        return self._name in sys.modules
+
+
+cv2 = LazyModule('cv2')
+ndimage = LazyModule('scipy.ndimage')
+special = LazyModule('scipy.special')
+roslibpy = LazyModule('roslibpy')
+
+
+def preload(names=('cv2', 'scipy.ndimage')):
+    """ Imports the given heavy modules now (e.g. on a background thread once the window is up). """
+    for name in names:
+        importlib.import_module(name)
+
+
+def preload_in_background(names=('cv2', 'scipy.ndimage')):
+    """ Runs preload(names) on a daemon thread of its own (nothing can drop or delay it), returns the thread. """
+    thread = threading.Thread(target=preload, args=(names,), name='preload')
+    thread.daemon = True
+    thread.start()
+    return thread
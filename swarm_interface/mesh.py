@@ -0,0 +1,107 @@
+'''
+Triangle meshes of finished strokes, so the drawing widget draws them with a few kivy Mesh
+instructions per mode instead of a Color and a Line per stroke (no kivy in here, the widget hands
+the arrays to Mesh). A stroke is a quad per segment and a disc at every point, which gives the round
+joins and caps of kivy's Line. Vertices are (x, y, u, v), Mesh's default format, and a mesh holds at
+most MAX_VERTICES of them (its indices are 16 bit), so each mode's strokes fill as many chunks as
+they need and a finished stroke only rewrites the last one. instance_triangles does the same for the
+agent markers: one shape copied to every agent, all in one Mesh.
+'''
+import numpy as np
+
+MAX_VERTICES = 65535 # kivy Mesh indices are unsigned shorts
+JOIN_SIDES = 8 # sides of the disc at each point
+MARKER = np.array([[1.0, 0.0], [-0.7, 0.6], [-0.7, -0.6]]) # an arrow head pointing along +x, radius 1
+
+
+def stroke_triangles(points, half_width, sides=JOIN_SIDES):
+    """ (vertices, indices) of one stroke of (n, 2) points drawn half_width either side of its centre line.
+
+    vertices is (k, 4) float32 (x, y, 0, 0), indices a flat int64 array of triangles.
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(pts)
+
+    # a disc (centre and ring) at every point
+    angles = 2 * np.pi * np.arange(sides) / sides
+    ring = pts[:, None, :] + half_width * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+    discs = np.concatenate((pts[:, None, :], ring), axis=1).reshape(-1, 2)
+    base = (np.arange(n) * (sides + 1))[:, None]
+    k = np.arange(sides)
+    disc_indices = np.stack((np.broadcast_to(base, (n, sides)), base + 1 + k, base + 1 + (k + 1) % sides), axis=2).reshape(-1)
+
+    # a quad along every segment (zero length ones are covered by their discs)
+    a, b = pts[:-1], pts[1:]
+    d = b - a
+    length = np.hypot(d[:, 0], d[:, 1])
+    keep = length > 0
+    a, b, d, length = a[keep], b[keep], d[keep], length[keep]
+    normal = np.stack((-d[:, 1], d[:, 0]), axis=1) * (half_width / length)[:, None]
+    quads = np.stack((a + normal, a - normal, b + normal, b - normal), axis=1).reshape(-1, 2)
+    first = len(discs) + 4 * np.arange(len(a))[:, None]
+    quad_indices = (first + np.array([0, 1, 2, 1, 3, 2])).reshape(-1)
+
+    xy = np.concatenate((discs, quads))
+    vertices = np.zeros((len(xy), 4), dtype=np.float32)
+    vertices[:, :2] = xy
+    return vertices, np.concatenate((disc_indices, quad_indices)).astype(np.int64)
+
+
+def instance_triangles(positions, angles, size, u=0.0, template=MARKER):
+    """ vertices (n * m, 4) float32 of the m triangle corners of template, turned by angles and scaled by size, at each of the (n, 2) positions.
+
+    Every vertex gets texture coordinates (u, 0.5), u (one per instance or
+    one for all) picks a color from a texture strip. The triangles don't
+    share vertices, their indices are simply 0 .. n * m - 1.
+    """
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    angles = np.asarray(angles, dtype=np.float64).reshape(-1)
+    cos, sin = np.cos(angles)[:, None], np.sin(angles)[:, None]
+    tx, ty = template[:, 0] * size, template[:, 1] * size
+    vertices = np.empty((len(positions), len(template), 4), dtype=np.float32)
+    vertices[:, :, 0] = positions[:, :1] + cos * tx - sin * ty
+    vertices[:, :, 1] = positions[:, 1:] + sin * tx + cos * ty
+    vertices[:, :, 2] = np.reshape(u, (-1, 1))
+    vertices[:, :, 3] = 0.5
+    return vertices.reshape(-1, 4)
+
+
+class MeshChunks(object):
+    """ The triangles of many strokes, packed into chunks of at most max_vertices vertices.
+
+    chunks is a list of (vertices, indices) arrays, ready for Mesh(vertices=
+    vertices.ravel(), indices=indices) with mode='triangles'.
+    """
+    def __init__(self, max_vertices=MAX_VERTICES, sides=JOIN_SIDES):
+        self.max_vertices = max_vertices
+        self.sides = sides
+        self.chunks = []
+
+    def clear(self):
+        self.chunks = []
+
+    def add(self, points, half_width):
+        """ Adds a stroke, returns the indices of the chunks that changed.
+
+        A stroke of fewer than 2 points adds nothing, like kivy's Line and the
+        distribution pipeline, which don't draw a lone tap either.
+        """
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(pts) < 2:
+            return []
+        per_point = self.sides + 1 + 4
+        step = max(1, self.max_vertices // per_point - 1)
+        changed = set()
+        # strokes too long for one mesh go in pieces that share their end points
+        for start in range(0, max(len(pts) - 1, 1), step):
+            vertices, indices = stroke_triangles(pts[start:start + step + 1], half_width, self.sides)
+            if not self.chunks or len(self.chunks[-1][0]) + len(vertices) > self.max_vertices:
+                self.chunks.append((np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int64)))
+            old_vertices, old_indices = self.chunks[-1]
+            self.chunks[-1] = (np.concatenate((old_vertices, vertices)), np.concatenate((old_indices, indices + len(old_vertices))))
+            changed.add(len(self.chunks) - 1)
+        return sorted(changed)
+
+    @property
+    def vertices(self):
+        return sum(len(vertices) for vertices, _ in self.chunks)
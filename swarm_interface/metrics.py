@@ -0,0 +1,185 @@
+'''
+Opt-in performance metrics: histograms of hot path timings and payload sizes, readable as
+Prometheus text over HTTP, as a rotating JSON log, or as a few lines for an on-screen overlay.
+Observing a value is cheap (a bisect and a few additions), nothing is printed.
+'''
+import bisect
+import json
+import logging
+import logging.handlers
+import threading
+import time
+
+# bucket upper bounds, roughly x2.5 apart
+SECONDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+
+class Histogram(object):
+    """ Counts of observed values per bucket (bounds are upper limits, the last bucket is open). """
+    def __init__(self, bounds=SECONDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        """ Estimate of the q quantile (the upper bound of the bucket it falls in, or max for the last one). """
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for bound, n in zip(self.bounds, self.counts):
+                seen += n
+                if seen >= rank:
+                    return min(bound, self.max)
+            return self.max
+
+    def snapshot(self):
+        with self._lock:
+            return dict(count = self.count, sum = self.sum, max = self.max,
+                        buckets = list(zip(self.bounds + ('+Inf',), self.counts)))
+
+
+class Metrics(object):
+    """ Named histograms and counters, safe to update from any thread. """
+    def __init__(self, prefix='swarm'):
+        self.prefix = prefix
+        self.started = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, bounds=None):
+        """ The histogram called name (made on first use, in bytes if the name ends in _bytes, seconds otherwise). """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    if bounds is None:
+                        bounds = BYTES if name.endswith('_bytes') else SECONDS
+                    histogram = self.histograms[name] = Histogram(bounds)
+        return histogram
+
+    def observe(self, name, value):
+        self.histogram(name).observe(value)
+
+    def since(self, name, start):
+        """ Observes the seconds from start (a time.perf_counter()) to now. """
+        self.histogram(name).observe(time.perf_counter() - start)
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def inc(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+        return dict(time = time.time(), uptime = time.time() - self.started, counters = counters,
+                    histograms = {name: h.snapshot() for name, h in sorted(histograms.items())})
+
+    def prometheus(self):
+        """ Everything in the Prometheus text exposition format. """
+        lines = []
+        snapshot = self.snapshot()
+        for name, value in sorted(snapshot['counters'].items()):
+            full = '{}_{}_total'.format(self.prefix, name)
+            lines += ['# TYPE {} counter'.format(full), '{} {}'.format(full, value)]
+        for name, h in snapshot['histograms'].items():
+            full = '{}_{}'.format(self.prefix, name)
+            lines.append('# TYPE {} histogram'.format(full))
+            total = 0
+            for bound, n in h['buckets']:
+                total += n
+                lines.append('{}_bucket{{le="{}"}} {}'.format(full, bound, total))
+            lines += ['{}_sum {}'.format(full, h['sum']), '{}_count {}'.format(full, h['count'])]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """ One short line per histogram (count, p50, p95, max), for an on-screen overlay. """
+        lines = []
+        for name in sorted(self.histograms):
+            h = self.histograms[name]
+            if h.count == 0:
+                continue
+            if name.endswith('_bytes'):
+                fmt = '{:<22s} n={:<6d} p50={:6.0f}B p95={:6.0f}B max={:6.0f}B'
+                scale = 1
+            else:
+                fmt = '{:<22s} n={:<6d} p50={:6.1f}ms p95={:6.1f}ms max={:6.1f}ms'
+                scale = 1e3
+            lines.append(fmt.format(name, h.count, h.quantile(0.5) * scale, h.quantile(0.95) * scale, h.max * scale))
+        return '\n'.join(lines)
+
+
+class _Timer(object):
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.since(self.name, self.start)
+        return False
+
+
+def serve(metrics, port, host='127.0.0.1'):
+    """ Serves metrics.prometheus() at http://host:port/metrics from a background thread, returns the server. """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args): # no line on stderr per scrape
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics http')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class JsonLog(object):
+    """ Appends a metrics snapshot as one JSON line per write(), rotating the file at max_bytes. """
+    def __init__(self, metrics, path, max_bytes=1 << 20, backups=3):
+        self.metrics = metrics
+        self._logger = logging.Logger('metrics:' + path) # not registered, nothing propagates to the root logger
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self._logger.addHandler(handler)
+
+    def write(self):
+        self._logger.info(json.dumps(self.metrics.snapshot()))
+
+    def close(self):
+        for handler in self._logger.handlers:
+            handler.close()
@@ -0,0 +1,251 @@
+'''
+A stand-in rosbridge server (websocket, JSON ops) for trying the interface without ROS.
+It accepts advertise/publish/subscribe/unsubscribe/call_service, passes published messages on to
+subscribers of the topic and keeps a log of them. drop_clients() and refuse() fake a host that
+hiccups, for checking that the tablet reconnects and re-sends.
+    python -m swarm_interface.rosbridge_stub [--port 9090]
+'''
+import argparse
+import base64
+import hashlib
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11' # RFC 6455
+
+# websocket opcodes
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+
+def _mask(data, key):
+    """ data xor the 4 byte key repeated (masking and unmasking are the same). """
+    n = len(data)
+    if n == 0:
+        return data
+    stream = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(stream, 'big')).to_bytes(n, 'big')
+
+
+def _read_exactly(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        data += chunk
+    return data
+
+
+def read_frame(sock):
+    """ (opcode, payload) of the next whole message (fragments are joined). """
+    payload, first = b'', None
+    while True:
+        b0, b1 = _read_exactly(sock, 2)
+        opcode, fin = b0 & 0x0F, b0 & 0x80
+        n = b1 & 0x7F
+        if n == 126:
+            n = struct.unpack('>H', _read_exactly(sock, 2))[0]
+        elif n == 127:
+            n = struct.unpack('>Q', _read_exactly(sock, 8))[0]
+        mask = _read_exactly(sock, 4) if b1 & 0x80 else None
+        data = _read_exactly(sock, n)
+        if mask is not None:
+            data = _mask(data, mask)
+        if opcode >= CLOSE: # control frames can come between fragments
+            return opcode, data
+        first = opcode if first is None else first
+        payload += data
+        if fin:
+            return first, payload
+
+
+def frame(opcode, payload, mask=False):
+    """ One unfragmented websocket frame (servers send unmasked frames, clients masked ones). """
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('>BB', 0x80 | opcode, n | (0x80 if mask else 0))
+    elif n < 1 << 16:
+        header = struct.pack('>BBH', 0x80 | opcode, 126 | (0x80 if mask else 0), n)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 127 | (0x80 if mask else 0), n)
+    if not mask:
+        return header + payload
+    key = struct.pack('>I', int(time.perf_counter() * 1e6) & 0xFFFFFFFF)
+    return header + key + _mask(payload, key)
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key.encode() + GUID).digest()).decode()
+
+
+class StubRosbridge(object):
+    """ Serves rosbridge clients on (host, port) from a background thread (port 0 picks a free port).
+
+    published -- [(time, topic, msg)] of every publish received, in order
+    """
+    def __init__(self, host='127.0.0.1', port=9090):
+        self.published = []
+        self.ops = [] # every op received, for debugging
+        self._subscribers = {} # topic -> set of clients
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._refuse_until = 0.0
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(8)
+        self.address = self._server.getsockname()
+        self._running = True
+        self._thread = threading.Thread(target=self._accept, name='rosbridge stub')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self.address[1]
+
+    def messages(self, topic):
+        """ Messages published on topic so far. """
+        with self._lock:
+            return [msg for _, name, msg in self.published if name == topic]
+
+    def drop_clients(self):
+        """ Cuts every connection, like the host dropping off the network. """
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            self._close(client)
+
+    def refuse(self, seconds):
+        """ Drops the current clients and turns new ones away for a while. """
+        self._refuse_until = time.time() + seconds
+        self.drop_clients()
+
+    def stop(self):
+        self._running = False
+        self.drop_clients()
+        try:
+            self._server.close()
+        except OSError:
+            pass
+
+    def _accept(self):
+        while self._running:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                break
+            if time.time() < self._refuse_until:
+                sock.close()
+                continue
+            thread = threading.Thread(target=self._serve, args=(sock,), name='rosbridge stub client')
+            thread.daemon = True
+            thread.start()
+
+    def _handshake(self, sock):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionError('connection closed during the handshake')
+            request += chunk
+        headers = {}
+        for line in request.decode('latin-1').split('\r\n')[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        sock.sendall(('HTTP/1.1 101 Switching Protocols\r\n'
+                      'Upgrade: websocket\r\n'
+                      'Connection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: {}\r\n\r\n').format(accept_key(headers['sec-websocket-key'])).encode())
+
+    def _serve(self, sock):
+        try:
+            self._handshake(sock)
+            with self._lock:
+                self._clients.add(sock)
+            while self._running:
+                opcode, payload = read_frame(sock)
+                if opcode == CLOSE:
+                    sock.sendall(frame(CLOSE, payload[:2]))
+                    break
+                if opcode == PING:
+                    sock.sendall(frame(PONG, payload))
+                elif opcode in (TEXT, BINARY):
+                    self._handle(sock, json.loads(payload.decode('utf-8')))
+        except (ConnectionError, OSError, ValueError, KeyError):
+            pass
+        finally:
+            self._close(sock)
+
+    def _handle(self, sock, op):
+        kind = op.get('op')
+        with self._lock:
+            self.ops.append(op)
+        if kind == 'publish':
+            with self._lock:
+                self.published.append((time.time(), op['topic'], op.get('msg', {})))
+                targets = list(self._subscribers.get(op['topic'], ()))
+            out = json.dumps(dict(op = 'publish', topic = op['topic'], msg = op.get('msg', {}))).encode('utf-8')
+            for target in targets:
+                self._send(target, out)
+        elif kind == 'subscribe':
+            with self._lock:
+                self._subscribers.setdefault(op['topic'], set()).add(sock)
+        elif kind == 'unsubscribe':
+            with self._lock:
+                self._subscribers.get(op['topic'], set()).discard(sock)
+        elif kind == 'call_service':
+            reply = dict(op = 'service_response', service = op.get('service'), values = {}, result = True)
+            if 'id' in op:
+                reply['id'] = op['id']
+            self._send(sock, json.dumps(reply).encode('utf-8'))
+        # advertise/unadvertise and anything else need no answer
+
+    def _send(self, sock, payload):
+        try:
+            sock.sendall(frame(TEXT, payload))
+        except OSError:
+            self._close(sock)
+
+    def _close(self, sock):
+        with self._lock:
+            self._clients.discard(sock)
+            for subscribers in self._subscribers.values():
+                subscribers.discard(sock)
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in rosbridge server that logs what the tablet publishes')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9090)
+    args = parser.parse_args(argv)
+
+    server = StubRosbridge(args.host, args.port)
+    print('rosbridge stub listening on ws://{}:{}'.format(*server.address))
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            for _, topic, msg in server.published[seen:]:
+                print('{} {}'.format(topic, ', '.join('{}={}'.format(k, v) for k, v in sorted(msg.items()) if k not in ('data', 'payload', 'indices', 'values'))))
+            seen = len(server.published)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
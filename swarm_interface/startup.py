@@ -0,0 +1,52 @@
+'''
+Checks that the core stays cheap to import: times importing the modules ergodic_interface_v12.py
+loads from swarm_interface in a fresh interpreter, and fails if that takes longer than the budget or
+pulls in kivy, cv2, scipy or roslibpy.
+    python -m swarm_interface.startup [--budget 0.5] [--repeat 5]
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+FORBIDDEN = ('kivy', 'cv2', 'scipy', 'roslibpy')
+# what ergodic_interface_v12.py imports from the package at startup
+MODULES = ('lazy', 'transport', 'distribution', 'analytic', 'strokes', 'encoding', 'fourier', 'worker', 'coord_log',
+           'journal', 'assets', 'view', 'mesh', 'feedback', 'metrics')
+
+PROBE = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    importlib.import_module('swarm_interface.' + name)
+elapsed = time.perf_counter() - start
+print(json.dumps(dict(seconds = elapsed, loaded = [m for m in {forbidden!r} if m in sys.modules])))
+'''
+
+
+def import_time(python=sys.executable):
+    """ Seconds to import the core modules in a fresh interpreter, and which of the heavy modules they loaded. """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # so this package is the one imported, from any directory
+    out = subprocess.check_output([python, '-c', PROBE.format(modules=MODULES, forbidden=FORBIDDEN)], cwd=root)
+    result = json.loads(out.decode().strip().splitlines()[-1])
+    return result['seconds'], result['loaded']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the import time of the swarm_interface core')
+    parser.add_argument('--budget', type=float, default=0.5, help='seconds allowed for the import')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters to time, the best one counts')
+    args = parser.parse_args(argv)
+
+    runs = [import_time() for _ in range(args.repeat)]
+    best = min(seconds for seconds, _ in runs)
+    loaded = sorted(set(m for _, modules in runs for m in modules))
+    print('import of {} swarm_interface modules: {:.1f} ms (budget {:.1f} ms)'.format(len(MODULES), best * 1e3, args.budget * 1e3))
+    if loaded:
+        print('heavy modules imported at startup: {}'.format(', '.join(loaded)))
+    return 1 if loaded or best > args.budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,481 @@
+'''
+Storage for the strokes drawn on the touchscreen.
+Points live in one growable float32 buffer so appending to a stroke is amortized O(1), also when
+several touches draw at once (a stroke that is not at the end of the buffer moves there, with room
+to double).
+Touch samples can be simplified as they come in (see Simplifier), so fast touch panels
+don't fill the store, the canvas and the logs with redundant points.
+Strokes are never removed one by one: erasing or undoing one hides it, so stroke indices stay
+valid and redo is a flag flip. A SegmentGrid finds the strokes under the eraser.
+'''
+import math
+
+import numpy as np
+
+from .distribution import KIVY_LINE_THICKNESS
+
+MODES = ('attract', 'repel')
+ERASE = 'erase' # StrokeRecorder's mode for the eraser brush
+INDEX_CELL = 32.0 # SegmentGrid cell side, in the units of the points (map pixels)
+SIMPLIFY = ('none', 'distance', 'dp') # Simplifier methods
+SIMPLIFY_WINDOW = 64 # most samples dp holds back at once, bounds the work per sample
+MIN_ROOM = 16 # points reserved for a stroke that moves to the end of the buffer
+
+
+class StrokeStore(object):
+    """ Every stroke drawn on the tablet (mode, width, touch id and points), in drawing order.
+
+    Hidden strokes (erased or undone) keep their index and points, but
+    strokes() and mode_points() leave them out.
+    """
+    def __init__(self, capacity=4096, stroke_capacity=256):
+        self._points = np.empty((capacity, 2), dtype=np.float32)
+        self._n_points = 0
+
+        # one entry per stroke, its points are _points[start:start+count] (with room for room - count more)
+        self._start = np.empty(stroke_capacity, dtype=np.int64)
+        self._count = np.empty(stroke_capacity, dtype=np.int64)
+        self._room = np.empty(stroke_capacity, dtype=np.int64)
+        self._mode = np.empty(stroke_capacity, dtype=np.int8)
+        self._width = np.empty(stroke_capacity, dtype=np.float32)
+        self._touch = np.empty(stroke_capacity, dtype=np.int64)
+        self._bbox = np.empty((stroke_capacity, 4), dtype=np.float32) # xmin, ymin, xmax, ymax
+        self._visible = np.empty(stroke_capacity, dtype=bool)
+        self._n_strokes = 0
+
+        # bumped on clear() so anything caching results from the store knows to start over
+        self.generation = 0
+
+    def __len__(self):
+        return self._n_strokes
+
+    @property
+    def n_points(self):
+        """ Number of points in all strokes. """
+        return int(self.counts().sum())
+
+    def _grow_points(self, needed):
+        if needed > len(self._points):
+            grown = np.empty((max(needed, 2*len(self._points)), 2), dtype=np.float32)
+            grown[:self._n_points] = self._points[:self._n_points]
+            self._points = grown
+
+    def _grow_strokes(self):
+        if self._n_strokes == len(self._start):
+            size = 2*len(self._start)
+            for name in ('_start', '_count', '_room', '_mode', '_width', '_touch', '_bbox', '_visible'):
+                old = getattr(self, name)
+                grown = np.empty((size,) + old.shape[1:], dtype=old.dtype)
+                grown[:self._n_strokes] = old[:self._n_strokes]
+                setattr(self, name, grown)
+
+    def begin(self, mode, width, touch_id, x, y):
+        """ Starts a new stroke at (x, y) and returns its index. """
+        self._grow_strokes()
+        self._grow_points(self._n_points + 1)
+        i = self._n_strokes
+        self._start[i] = self._n_points
+        self._count[i] = 1
+        self._room[i] = 1
+        self._mode[i] = MODES.index(mode)
+        self._width[i] = width
+        self._touch[i] = touch_id
+        self._bbox[i] = (x, y, x, y)
+        self._visible[i] = True
+        self._points[self._n_points] = (x, y)
+        self._n_points += 1
+        self._n_strokes += 1
+        return i
+
+    def append(self, x, y, i=None):
+        """ Adds a point to stroke i (default: the last one started). """
+        if self._n_strokes == 0:
+            raise IndexError('no stroke to append to, call begin() first')
+        if i is None:
+            i = self._n_strokes - 1
+        start, count = self._start[i], self._count[i]
+        if count == self._room[i]:
+            if start + count == self._n_points: # at the end of the buffer, grow in place
+                self._grow_points(self._n_points + 1)
+                self._n_points += 1
+                self._room[i] += 1
+            else: # another stroke grew after this one: move it to the end, with room to double
+                room = max(2 * count, MIN_ROOM)
+                self._grow_points(self._n_points + room)
+                self._points[self._n_points:self._n_points + count] = self._points[start:start + count]
+                start = self._start[i] = self._n_points
+                self._n_points += room
+                self._room[i] = room
+        self._points[start + count] = (x, y)
+        self._count[i] += 1
+        box = self._bbox[i]
+        box[0] = min(box[0], x)
+        box[1] = min(box[1], y)
+        box[2] = max(box[2], x)
+        box[3] = max(box[3], y)
+
+    def snapshot(self):
+        """ Copy of the store (only the used part), safe to hand to another thread. """
+        copy = StrokeStore.__new__(StrokeStore)
+        copy._points = self._points[:self._n_points].copy()
+        copy._n_points = self._n_points
+        for name in ('_start', '_count', '_room', '_mode', '_width', '_touch', '_bbox', '_visible'):
+            setattr(copy, name, getattr(self, name)[:self._n_strokes].copy())
+        copy._n_strokes = self._n_strokes
+        copy.generation = self.generation
+        return copy
+
+    def clear(self):
+        self._n_points = 0
+        self._n_strokes = 0
+        self.generation += 1
+
+    def mode(self, i):
+        return MODES[self._mode[i]]
+
+    def width(self, i):
+        return float(self._width[i])
+
+    def touch_id(self, i):
+        return int(self._touch[i])
+
+    def visible(self, i):
+        return bool(self._visible[i])
+
+    def set_visible(self, i, visible=True):
+        """ Shows or hides stroke i (the eraser and undo hide, redo shows). """
+        self._visible[i] = visible
+
+    def visibility(self):
+        """ Which strokes are shown (a view, copy it if you keep it). """
+        return self._visible[:self._n_strokes]
+
+    def bbox(self, i):
+        """ (xmin, ymin, xmax, ymax) of the points of stroke i. """
+        return tuple(float(v) for v in self._bbox[i])
+
+    def counts(self):
+        """ Number of points in each stroke (a view, copy it if you keep it). """
+        return self._count[:self._n_strokes]
+
+    def bboxes(self):
+        """ (n_strokes, 4) view of every stroke's bounding box. """
+        return self._bbox[:self._n_strokes]
+
+    def widths(self):
+        return self._width[:self._n_strokes]
+
+    def points(self, i):
+        """ (n, 2) view of the points of stroke i. """
+        start = self._start[i]
+        return self._points[start:start + self._count[i]]
+
+    def strokes(self):
+        """ Yields (mode, width, points) for every shown stroke, in drawing order. """
+        for i in range(self._n_strokes):
+            if self._visible[i]:
+                yield self.mode(i), self.width(i), self.points(i)
+
+    def mode_points(self, mode):
+        """ (n, 2) array with the points of every stroke drawn in the given mode. """
+        code = MODES.index(mode)
+        keep = [self.points(i) for i in range(self._n_strokes) if self._mode[i] == code and self._visible[i]]
+        if not keep:
+            return np.empty((0, 2), dtype=np.float32)
+        return np.concatenate(keep)
+
+
+class SegmentGrid(object):
+    """ Uniform grid over the segments of a StrokeStore's strokes, for hit tests that only look near the point.
+
+    Each cell lists the segments (stroke << 32 | index of their first point in
+    the stroke) passing through it, sampled every half cell along them. A
+    query reads the cells around the point and measures the distance to those
+    segments only, so it costs the same however many strokes there are.
+    """
+    def __init__(self, cell=INDEX_CELL):
+        self.cell = cell
+        self._cells = {} # (column, row) -> segments in that cell
+        self._reach = 0.0 # widest half line width added so far
+
+    def clear(self):
+        self._cells = {}
+        self._reach = 0.0
+
+    def add(self, store, i):
+        """ Indexes the newest point of stroke i (call it after every begin or append). """
+        points = store.points(i)
+        first = max(len(points) - 2, 0) # the segment the point ends (or the point itself)
+        (x0, y0), (x1, y1) = points[first], points[-1]
+        steps = max(1, int(math.ceil(2 * math.hypot(x1 - x0, y1 - y0) / self.cell)))
+        cells = set()
+        for k in range(steps + 1):
+            t = k / float(steps)
+            cells.add((int(math.floor((x0 + t * (x1 - x0)) / self.cell)), int(math.floor((y0 + t * (y1 - y0)) / self.cell))))
+        segment = (i << 32) | first
+        for key in cells:
+            self._cells.setdefault(key, []).append(segment)
+        self._reach = max(self._reach, KIVY_LINE_THICKNESS * store.width(i) / 2.0)
+
+    def query(self, store, x, y, radius):
+        """ Sorted indices of the shown strokes whose line passes within radius of (x, y). """
+        # a segment point is at most a quarter cell from one of its samples
+        r = radius + self._reach + self.cell / 4.0
+        c0, c1 = int(math.floor((x - r) / self.cell)), int(math.floor((x + r) / self.cell))
+        r0, r1 = int(math.floor((y - r) / self.cell)), int(math.floor((y + r) / self.cell))
+        found = [self._cells[key] for key in ((c, row) for c in range(c0, c1 + 1) for row in range(r0, r1 + 1)) if key in self._cells]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        segments = np.unique(np.concatenate(found))
+        stroke, first = segments >> 32, segments & 0xffffffff
+        start = store._start[stroke]
+        a = store._points[start + first].astype(np.float64)
+        d = store._points[start + np.minimum(first + 1, store._count[stroke] - 1)] - a
+        px, py = x - a[:, 0], y - a[:, 1]
+        t = np.clip((px * d[:, 0] + py * d[:, 1]) / np.maximum((d * d).sum(axis=1), 1e-12), 0, 1)
+        ex, ey = px - t * d[:, 0], py - t * d[:, 1]
+        reach = radius + KIVY_LINE_THICKNESS * store._width[stroke] / 2.0
+        hit = (ex * ex + ey * ey <= reach * reach) & store._visible[stroke]
+        return np.unique(stroke[hit])
+
+
+class Simplifier(object):
+    """ Online simplification of one stroke's touch samples, within tolerance (in the units of the points).
+
+    'none' keeps every sample. 'distance' keeps a sample once it is tolerance
+    away from the last one kept. 'dp' (a streaming Douglas-Peucker) holds
+    samples back while the segment from the last kept point to the newest
+    sample passes within tolerance of all of them, and keeps the previous
+    sample once it doesn't. Either way every sample ends up within tolerance
+    of the kept polyline, and the first and last samples are kept.
+    """
+    def __init__(self, method='none', tolerance=0.0, window=SIMPLIFY_WINDOW):
+        if method not in SIMPLIFY:
+            raise ValueError('unknown simplification {!r}, expected one of {}'.format(method, ', '.join(SIMPLIFY)))
+        self.method = method
+        self.tolerance = tolerance
+        self.window = window
+        self._anchor = None
+        self._held = [] # samples since the anchor, not kept (yet)
+
+    def start(self, x, y):
+        """ A new stroke starts at (x, y) (which is kept). """
+        self._anchor = (x, y)
+        self._held = []
+
+    def add(self, x, y):
+        """ Takes the next sample, returns the points to keep now ([], or one point). """
+        if self.method == 'none' or self.tolerance <= 0:
+            return [(x, y)]
+        ax, ay = self._anchor
+        if self.method == 'distance':
+            if (x - ax) ** 2 + (y - ay) ** 2 >= self.tolerance ** 2:
+                return self._keep(x, y)
+            self._held = [(x, y)]
+            return []
+        if self._held and (len(self._held) >= self.window or not self._covers(x, y)):
+            kept = self._keep(*self._held[-1])
+            self._held = [(x, y)]
+            return kept
+        self._held.append((x, y))
+        return []
+
+    def finish(self):
+        """ The stroke ended, returns the points still to keep (the last sample, if it was held back). """
+        kept = [self._held[-1]] if self._held else []
+        self._held = []
+        return kept
+
+    @property
+    def tip(self):
+        """ The newest sample if it is held back (to draw the stroke up to the finger), else None. """
+        return self._held[-1] if self._held else None
+
+    def _keep(self, x, y):
+        self._anchor = (x, y)
+        self._held = []
+        return [(x, y)]
+
+    def _covers(self, x, y):
+        """ Whether every held sample is within tolerance of the segment anchor -> (x, y). """
+        held = np.asarray(self._held)
+        ax, ay = self._anchor
+        dx, dy = x - ax, y - ay
+        px, py = held[:, 0] - ax, held[:, 1] - ay
+        t = np.clip((px * dx + py * dy) / max(dx * dx + dy * dy, 1e-12), 0, 1)
+        ex, ey = px - t * dx, py - t * dy
+        return bool((ex * ex + ey * ey).max() <= self.tolerance ** 2)
+
+
+class TouchStroke(object):
+    """ What one touch is doing: drawing stroke in mode with width (through its own simplifier), or erasing with radius width. """
+    __slots__ = ('mode', 'width', 'stroke', 'simplifier', 'erased')
+
+    def __init__(self, mode, width, stroke=None, simplifier=None):
+        self.mode = mode
+        self.width = width
+        self.stroke = stroke # index in the store, None for the eraser
+        self.simplifier = simplifier
+        self.erased = [] # strokes this eraser drag hid
+
+
+class StrokeRecorder(object):
+    """ Turns touch events into strokes in a StrokeStore (the drawing widget's logic, without kivy).
+
+    A stroke starts when a touch goes down inside rect while drawing in a
+    mode, grows while that touch moves inside rect and ends when it goes up.
+    Every touch keeps the mode and width it went down with, so several
+    fingers (or people) can draw at once without mixing up their strokes.
+    Samples go through a simplifier (one per touch, set up like simplifier)
+    before they reach the store; committed holds the points the last call
+    added and stroke the stroke it added them to, samples/kept count what came
+    in and what was stored.
+
+    In the ERASE mode the touch is an eraser brush of radius width instead:
+    every shown stroke it passes over is hidden, erased holds the ones the last
+    call hid. Finished strokes and eraser drags can be undone and redone.
+    """
+    def __init__(self, store=None, simplifier=None, index=None):
+        self.store = store if store is not None else StrokeStore()
+        self.simplifier = simplifier if simplifier is not None else Simplifier()
+        self.index = index if index is not None else SegmentGrid()
+        self.rect = (0, 0, 0, 0) # (x, y, width, height) of the drawing area
+        self.touches = {} # touch id -> TouchStroke, for the touches down now
+        self.committed = []
+        self.erased = []
+        self.stroke = None
+        self.samples = 0
+        self.kept = 0
+        self.history = [] # ('draw' or 'erase', stroke indices), undo() takes the last one
+        self.undone = [] # what redo() puts back
+        self._last = None # TouchStroke of the last call
+
+    @property
+    def drawing(self):
+        """ Whether any stroke is in progress. """
+        return any(touch.stroke is not None for touch in self.touches.values())
+
+    @property
+    def erasing(self):
+        """ Whether any eraser drag is in progress. """
+        return any(touch.mode == ERASE for touch in self.touches.values())
+
+    def mode_of(self, touch_id):
+        """ The mode touch_id went down with ('attract', 'repel' or ERASE), None if it isn't drawing or erasing. """
+        touch = self.touches.get(touch_id)
+        return touch.mode if touch is not None else None
+
+    def collide(self, x, y):
+        rx, ry, rw, rh = self.rect
+        return rx <= x <= rx + rw and ry <= y <= ry + rh
+
+    def down(self, touch_id, x, y, mode, width):
+        """ Returns True if this touch started a stroke (or an eraser drag). """
+        self.committed, self.erased, self.stroke = [], [], None
+        if (mode != ERASE and mode not in MODES) or not self.collide(x, y):
+            return False
+        if touch_id in self.touches: # never saw it go up
+            self.up(touch_id)
+        if mode == ERASE:
+            touch = self._last = self.touches[touch_id] = TouchStroke(mode, width)
+            self._erase(touch, x, y)
+            return True
+        i = self.stroke = self.store.begin(mode, width, touch_id, x, y)
+        self.index.add(self.store, i)
+        simplifier = Simplifier(self.simplifier.method, self.simplifier.tolerance, self.simplifier.window)
+        simplifier.start(x, y)
+        self._last = self.touches[touch_id] = TouchStroke(mode, width, i, simplifier)
+        self.committed = [(x, y)]
+        self.samples += 1
+        self.kept += 1
+        return True
+
+    def move(self, touch_id, x, y):
+        """ Returns True if the point belongs to a stroke in progress (it may be held back, see committed) or an eraser drag. """
+        self.committed, self.erased = [], []
+        touch = self._last = self.touches.get(touch_id)
+        self.stroke = touch.stroke if touch is not None else None
+        if touch is None or not self.collide(x, y):
+            return touch is not None and touch.mode == ERASE
+        if touch.mode == ERASE:
+            self._erase(touch, x, y)
+            return True
+        self.samples += 1
+        self._commit(touch, touch.simplifier.add(x, y))
+        return True
+
+    def up(self, touch_id):
+        """ Returns True if this ended a stroke (or an eraser drag). """
+        self.committed, self.erased = [], []
+        touch = self._last = self.touches.pop(touch_id, None)
+        self.stroke = touch.stroke if touch is not None else None
+        if touch is None:
+            return False
+        if touch.mode == ERASE:
+            if touch.erased:
+                self._done(('erase', touch.erased))
+        else:
+            self._commit(touch, touch.simplifier.finish())
+            self._done(('draw', [touch.stroke]))
+        return True
+
+    def undo(self):
+        """ Takes back the last finished stroke or eraser drag. Returns (stroke indices, now shown), or None if there is nothing to undo. """
+        if not self.history:
+            return None
+        action, strokes = self.history.pop()
+        self.undone.append((action, strokes))
+        return self._show(strokes, action == 'erase')
+
+    def redo(self):
+        """ Puts back what undo took back last, returns the same as undo. """
+        if not self.undone:
+            return None
+        action, strokes = self.undone.pop()
+        self.history.append((action, strokes))
+        return self._show(strokes, action == 'draw')
+
+    @property
+    def tip(self):
+        """ The newest sample of the last call's stroke if its simplifier holds it back, else None. """
+        touch = self._last
+        if touch is None or touch.simplifier is None or touch not in self.touches.values():
+            return None
+        return touch.simplifier.tip
+
+    def reduction(self):
+        """ Fraction of the touch samples the simplifiers dropped so far. """
+        return 1.0 - self.kept / float(self.samples) if self.samples else 0.0
+
+    def _show(self, strokes, visible):
+        for i in strokes:
+            self.store.set_visible(i, visible)
+        return strokes, visible
+
+    def _done(self, action):
+        self.history.append(action)
+        self.undone = [] # a new edit ends the redo chain
+
+    def _erase(self, touch, x, y):
+        self.erased = self.index.query(self.store, x, y, touch.width).tolist()
+        for i in self.erased:
+            self.store.set_visible(i, False)
+        touch.erased.extend(self.erased)
+
+    def _commit(self, touch, points):
+        for x, y in points:
+            self.store.append(x, y, touch.stroke)
+            self.index.add(self.store, touch.stroke)
+        self.committed = points
+        self.kept += len(points)
+
+    def clear(self):
+        self.store.clear()
+        self.index.clear()
+        self.touches = {} # strokes in progress end here, their touches are ignored from now on
+        self.committed = []
+        self.erased = []
+        self.stroke = None
+        self.history = []
+        self.undone = []
+        self._last = None
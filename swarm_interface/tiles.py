@@ -0,0 +1,152 @@
+'''
+Tiled map pyramids for backgrounds too big to decode whole: a directory with one .npy file per
+pyramid level, stored tile by tile (tiles_y, tiles_x, tile, tile, 3) so a viewport only touches the
+tiles under it, and an index.json. Levels are memory-mapped, so opening a map reads nothing but
+the index, and memory and load time stay flat however large the map is.
+    python -m swarm_interface.tiles raw.png [raw.tiles] [--tile 256]
+The directory can then be loaded like any map (Load Map, or MAP_FILES).
+'''
+import argparse
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+from .lazy import cv2
+from .assets import MapAsset, MIN_LEVEL, pick_level, render_region, whole_map
+from .distribution import resample_matrices
+
+INDEX = 'index.json'
+TILE = 256 # tile side in pixels
+WORK_SIZE = 2048 # longest side of the level the deploy pipeline renders at
+
+
+def build_pyramid(source, directory=None, tile=TILE):
+    """ Writes the tiled pyramid of the image file source to directory (default: source without extension + .tiles). """
+    if directory is None:
+        directory = os.path.splitext(source)[0] + '.tiles'
+    image = cv2.imread(source, 1)
+    if image is None:
+        raise IOError('could not read map image: {}'.format(source))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    levels = []
+    while True:
+        rows, cols = image.shape[:2]
+        ny, nx = -(-rows // tile), -(-cols // tile)
+        name = 'level{}.npy'.format(len(levels))
+        tiles = np.lib.format.open_memmap(os.path.join(directory, name), mode='w+', dtype=np.uint8, shape=(ny, nx, tile, tile, 3))
+        for ty in range(ny):
+            band = image[ty * tile:(ty + 1) * tile]
+            for tx in range(nx):
+                block = band[:, tx * tile:(tx + 1) * tile]
+                tiles[ty, tx, :block.shape[0], :block.shape[1]] = block
+        tiles.flush()
+        del tiles
+        levels.append(dict(file = name, shape = [rows, cols]))
+        if min(rows, cols) // 2 < MIN_LEVEL:
+            break
+        image = cv2.pyrDown(image)
+
+    with open(os.path.join(directory, INDEX), 'w') as f:
+        json.dump(dict(tile = tile, levels = levels), f, indent=1)
+    return directory
+
+
+class TiledMap(MapAsset):
+    """ A map pyramid directory, memory-mapped. Works wherever a MapAsset does.
+
+    image   -- the largest level no bigger than WORK_SIZE (read on first use), what deploys render at
+    shape   -- (rows, cols) of image
+    extent  -- (cols, rows) of the full resolution level, the map coordinates
+    """
+    def __init__(self, name, mtime, path):
+        try:
+            with open(os.path.join(path, INDEX)) as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            raise IOError('not a map pyramid: {} ({})'.format(name, e))
+        self.name = name
+        self.mtime = mtime
+        self.tile = index['tile']
+        self.levels = [np.load(os.path.join(path, level['file']), mmap_mode='r') for level in index['levels']]
+        self.level_shapes = [tuple(level['shape']) for level in index['levels']]
+        self.extent = (self.level_shapes[0][1], self.level_shapes[0][0])
+        self.resolutions = [shape[1] / float(self.extent[0]) for shape in self.level_shapes]
+        self.work_level = next((i for i, shape in enumerate(self.level_shapes) if max(shape) <= WORK_SIZE), len(self.levels) - 1)
+        self.shape = self.level_shapes[self.work_level]
+        self._image = None
+        self._scaled = {}
+        self._lock = threading.Lock()
+
+    def read(self, level, r0, r1, c0, c1):
+        """ Pixels [r0:r1, c0:c1] of a level (rows top down), reading only the tiles they are in. """
+        t = self.tile
+        ty0, tx0 = r0 // t, c0 // t
+        block = self.levels[level][ty0:-(-r1 // t), tx0:-(-c1 // t)]
+        ny, nx = block.shape[:2]
+        block = block.transpose(0, 2, 1, 3, 4).reshape(ny * t, nx * t, 3)
+        return block[r0 - ty0 * t:r1 - ty0 * t, c0 - tx0 * t:c1 - tx0 * t]
+
+    def level(self, i):
+        """ A whole level as one image. """
+        rows, cols = self.level_shapes[i]
+        return self.read(i, 0, rows, 0, cols)
+
+    @property
+    def image(self):
+        with self._lock:
+            if self._image is None:
+                self._image = self.level(self.work_level)
+                self._image.flags.writeable = False
+            return self._image
+
+    def scaled(self, size):
+        """ The map resized to size (width, height), BGR. """
+        size = (int(size[0]), int(size[1]))
+        with self._lock:
+            image = self._scaled.get(size)
+        if image is None:
+            level = pick_level(self.resolutions, size[0] / float(self.extent[0]))
+            image = cv2.resize(self.level(level), size, interpolation=cv2.INTER_AREA)
+            image.flags.writeable = False
+            with self._lock:
+                self._scaled[size] = image
+        return image
+
+    def view(self, region, size):
+        """ The part region = (x0, y0, x1, y1) of the map (map pixels, y up) at size (width, height), BGR. """
+        if whole_map(region, self.extent):
+            return self.scaled(size)
+        level = pick_level(self.resolutions, size[0] / float(region[2] - region[0]))
+        return render_region(lambda r0, r1, c0, c1: self.read(level, r0, r1, c0, c1), self.level_shapes[level], self.extent, region, size)
+
+    def prepare(self, map_size=None, display_size=None):
+        """ Builds everything a deploy or a switch to this map needs, ahead of time. """
+        self.image
+        if map_size is not None:
+            resample_matrices(self.shape, map_size)
+        if display_size is not None:
+            self.scaled(display_size)
+        return self
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Turn a map image into a tiled, memory-mapped pyramid')
+    parser.add_argument('source', help='map image')
+    parser.add_argument('directory', nargs='?', help='where to write it (default: the image name with .tiles)')
+    parser.add_argument('--tile', type=int, default=TILE, help='tile side in pixels')
+    args = parser.parse_args(argv)
+
+    directory = build_pyramid(args.source, args.directory, args.tile)
+    tiled = TiledMap(args.source, 0, directory)
+    print('{}: {} levels, {} x {} down to {} x {}, deploys render at {} x {}'.format(
+        directory, len(tiled.levels), tiled.extent[0], tiled.extent[1],
+        tiled.level_shapes[-1][1], tiled.level_shapes[-1][0], tiled.shape[1], tiled.shape[0]))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+'''
+The ros side of the interface: publishes the drawn distribution on /tablet_comm (or another topic) through rosbridge.
+Messages wait in a bounded queue for a sender thread, which keeps the connection up (reconnecting
+with backoff), re-sends the latest distribution after a reconnect and times every message.
+roslibpy is only imported when a connection is made.
+'''
+import collections
+import sys
+import threading
+import time
+
+from .lazy import roslibpy
+from .encoding import distribution_fields, payload_bytes, DeltaEncoder
+from .fourier import fourier_fields
+from .journal import summarize
+
+# what SendQueue does with a new message when it is full
+POLICIES = ('coalesce', 'drop-oldest', 'drop-newest')
+
+# kinds of outgoing message
+DISTRIBUTION = 'distribution'
+CONNECT = 'connect'
+
+TIMING_SAMPLES = 1000 # per stage, older timings are forgotten
+
+
+class SendQueue(object):
+    """ Bounded queue of outgoing (kind, item) messages, safe to share between threads.
+
+    When it is full, 'drop-oldest' drops the message that has waited longest
+    and 'drop-newest' drops the one being added. 'coalesce' replaces a waiting
+    message of the same kind even when there is room (an older distribution is
+    pointless once a newer one is waiting), and otherwise drops the oldest.
+    """
+    def __init__(self, maxsize=8, policy='coalesce'):
+        if policy not in POLICIES:
+            raise ValueError('unknown drop policy {!r}, expected one of {}'.format(policy, ', '.join(POLICIES)))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, kind, item):
+        """ Adds item, returns False if it was dropped instead. """
+        with self._cond:
+            if self.policy == 'coalesce':
+                for i, (waiting, _) in enumerate(self._items):
+                    if waiting == kind:
+                        del self._items[i]
+                        self.dropped += 1
+                        break
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                if self.policy == 'drop-newest':
+                    return False
+                self._items.popleft()
+            self._items.append((kind, item))
+            self._cond.notify()
+            return True
+
+    def put_front(self, kind, item):
+        """ Puts back a message that couldn't be sent, it goes out first (or is dropped if the queue filled up meanwhile). """
+        with self._cond:
+            if len(self._items) >= self.maxsize or (self.policy == 'coalesce' and self.has(kind)):
+                self.dropped += 1
+                return False
+            self._items.appendleft((kind, item))
+            self._cond.notify()
+            return True
+
+    def get(self, timeout=None):
+        """ The oldest (kind, item), or None if nothing came within timeout (or the queue was closed). """
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def has(self, kind):
+        with self._cond:
+            return any(waiting == kind for waiting, _ in self._items)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ros_interface(object):
+    """ Sets up the ros interface.
+
+    publish, publish_distribution and call_connection_service only queue the
+    message, a sender thread sends it once the connection is up. While the
+    connection is down messages wait (up to queue_size of them, see SendQueue
+    for the drop policies) and the sender reconnects, backing off from
+    backoff[0] to backoff[1] seconds between attempts. After a reconnect the
+    last distribution is sent again, subscribers that came back (or just
+    started) get the current one without waiting for the next deploy. With
+    fourier=K distributions go out as K x K Fourier coefficients instead of
+    the grid (see fourier.py), delta then has no effect. verbose prints a line
+    for every message sent.
+    """
+    def __init__(self, team, host='yes', address=None, port=9090, delta=False, keyframe_every=20,
+                 encoding='json', compress=False, queue_size=8, policy='coalesce', backoff=(0.5, 10.0),
+                 connect_timeout=10.0, metrics=None, topic='/tablet_comm', fourier=0, verbose=False):
+        # self.client = roslibpy.Ros(host='192.168.1.217',port=9090) # manually change this if you have a different setup (wifi)
+        # self.client = roslibpy.Ros(host='192.168.137.2',port=9090) # manually change this if you have a different setup (hardwired)
+        # self.client = roslibpy.Ros(host='10.0.1.84',port=9090) # manually change this if you have a different setup (rover)
+        self.encoding = encoding
+        self.compress = compress
+        self.fourier = fourier # send the first fourier x fourier coefficients instead of the grid (0: the grid)
+        self.backoff = backoff
+        self.connect_timeout = connect_timeout
+        self.metrics = metrics # a metrics.Metrics to also report timings and payload sizes to
+        self.verbose = verbose
+        self.queue = SendQueue(queue_size, policy)
+
+        # initiate the connection service (will be different for red/blue players)
+        if (team == 'red'):
+            service = 'red_connection_service'
+        elif (team == 'blue'):
+            service = 'blue_connection_service'
+        else:
+            print('TEAM value not valid, did you enter red/blue?')
+            sys.exit("TEAM needs to be red/blue")
+
+        if (host == 'yes' or not host): #(not host means if the HOST variable has not been set from the command line)
+            self.client = roslibpy.Ros(host='localhost', port=port)
+        elif (host == 'no'):
+            if (not address): #we may not need to enter an ADDRESS if both the red and blue player are on the same network
+                sys.exit("Address should not be set to None if you are not host=no (you are not hosting the game, and therefore need to specify an ip address to connect to")
+            else:
+                self.client = roslibpy.Ros(host=address, port=port)
+        else:
+            print('HOST value is not valid, did you enter yes/no for HOST?')
+
+        # roslibpy's twisted client reconnects on its own too, make it back off the same way
+        factory = getattr(self.client, 'factory', None)
+        if hasattr(factory, 'set_initial_delay'):
+            factory.set_initial_delay(backoff[0])
+            factory.set_max_delay(backoff[1])
+
+        self.publisher = roslibpy.Topic(self.client,topic,'ergodic_humanswarmcollab_sim/tablet')
+        self.connection_service_pub = roslibpy.Topic(self.client, service, 'std_msgs/Empty')
+        self.request = roslibpy.ServiceRequest()
+
+        # subscribers that (re)connect need a keyframe before deltas mean anything
+        self.delta = DeltaEncoder(keyframe_every) if delta else None
+
+        self.latest = None # (msg, val) of the last distribution, sent again after a reconnect
+        self.counters = collections.Counter()
+        self.timings = {stage: collections.deque(maxlen=TIMING_SAMPLES) for stage in ('serialize', 'queued', 'send')}
+        self._online = False
+        self._stopped = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ros sender')
+        self._thread.daemon = True
+        self._thread.start()
+
+    # call the connection service
+    def call_connection_service(self):
+        print('Publishing an empty message to the connection service for your team ... ')
+        self._queue(CONNECT, {})
+
+    def publish(self,msg):
+        self._queue(None, msg)
+
+    # queue a distribution, the fields (whole, or as a delta/sparse frame) are filled in when it is sent
+    def publish_distribution(self,msg,val):
+        self.latest = (msg, val)
+        self._queue(DISTRIBUTION, (msg, val))
+
+    def _queue(self, kind, payload):
+        self.counters['queued'] += 1
+        self.queue.put(kind, (time.perf_counter(), payload))
+
+    @property
+    def is_connected(self):
+        return bool(self.client.is_connected)
+
+    def stats(self):
+        """ Message counters, connection state and per stage timings (in ms, see journal.summarize). """
+        result = dict(self.counters, connected = self.is_connected, waiting = len(self.queue), dropped = self.queue.dropped)
+        result.update({stage: summarize(list(samples)) for stage, samples in self.timings.items()})
+        return result
+
+    # the sender thread: connection upkeep and sending, one message at a time
+    def _run(self):
+        try:
+            self.client.run(timeout=self.connect_timeout)
+        except Exception as e: # roslibpy.core.RosTimeoutError, roslibpy keeps trying in the background
+            print('Could not connect to rosbridge ({}), retrying'.format(e))
+        delay = self.backoff[0]
+        while not self._stopped:
+            if not self._check_connection():
+                # nudge the client, then wait longer each time it still isn't up
+                self.counters['connect_attempts'] += 1
+                try:
+                    self.client.connect()
+                except Exception as e:
+                    print('Reconnecting to rosbridge failed: {}'.format(e))
+                self._wake.wait(delay)
+                self._wake.clear()
+                delay = min(delay * 2, self.backoff[1])
+                continue
+            delay = self.backoff[0]
+
+            entry = self.queue.get(timeout=0.25)
+            if entry is None:
+                continue
+            kind, (queued_at, payload) = entry
+            if not self._check_connection():
+                self.queue.put_front(kind, (queued_at, payload))
+                continue
+            self._send(kind, queued_at, payload)
+
+    def _check_connection(self):
+        """ Notices the connection going down or coming back, returns whether it is up. """
+        online = self.is_connected
+        if online != self._online:
+            self._online = online
+            if online:
+                self.counters['connects'] += 1
+                if self.counters['connects'] > 1:
+                    print('Reconnected to rosbridge')
+                    if self.latest is not None and not self.queue.has(DISTRIBUTION):
+                        self.counters['resent'] += 1
+                        self.queue.put_front(DISTRIBUTION, (time.perf_counter(), self.latest))
+            else:
+                self.counters['disconnects'] += 1
+                print('Lost the connection to rosbridge, reconnecting')
+            if self.delta is not None:
+                self.delta.reset() # the next distribution goes out as a keyframe
+        return online
+
+    def _time(self, stage, seconds):
+        self.timings[stage].append(seconds)
+        if self.metrics is not None:
+            self.metrics.observe('ros_{}_seconds'.format(stage), seconds)
+
+    def _send(self, kind, queued_at, payload):
+        start = time.perf_counter()
+        self._time('queued', start - queued_at)
+        try:
+            if kind == CONNECT:
+                self.connection_service_pub.publish(roslibpy.Message())
+            else:
+                if kind == DISTRIBUTION:
+                    msg, val = payload
+                    msg = dict(msg)
+                    if self.fourier:
+                        msg.update(fourier_fields(val, (msg['map_width'], msg['map_height']), self.fourier))
+                    elif self.delta is not None:
+                        msg.update(self.delta.encode(val, self.encoding, self.compress))
+                    else:
+                        msg.update(distribution_fields(val, self.encoding, self.compress))
+                    encoded = time.perf_counter()
+                    self._time('serialize', encoded - start)
+                    start = encoded
+                else:
+                    msg = payload
+                if self.metrics is not None:
+                    self.metrics.observe('publish_bytes', payload_bytes(msg)) # counted from the fields, roslibpy does the only json.dumps
+                if self.verbose:
+                    print('Publishing data')
+                self.publisher.publish(msg) # roslibpy turns it into json and writes it to the socket
+            self._time('send', time.perf_counter() - start)
+            self.counters['sent'] += 1
+        except Exception as e:
+            self.counters['failed'] += 1
+            print('Publishing failed: {}'.format(e))
+            if self.delta is not None:
+                self.delta.reset()
+
+    def close(self, terminate=True):
+        """ Stops the sender and disconnects. terminate also stops roslibpy's event loop, which can't be started again in this process. """
+        if getattr(self, '_stopped', True): # already closed, or __init__ never got that far
+            return
+        self._stopped = True
+        self.queue.close()
+        self._wake.set()
+        self._thread.join(1.0)
+        if terminate:
+            self.client.terminate()
+        else:
+            self.client.close()
+
+    def __del__(self):
+        self.close()
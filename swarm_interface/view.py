@@ -0,0 +1,140 @@
+'''
+Zoom and pan of the map in the drawing widget, without any kivy: which part of the map is on screen,
+widget <-> map coordinate conversion, and one/two finger drags turned into pans and pinch zooms.
+Map coordinates are map pixels with y up (the origin is the bottom left corner of the map).
+'''
+import math
+
+MAX_SCALE = 4.0 # zoom in until a map pixel is this many screen pixels (or to fit, if that is more)
+
+
+class Viewport(object):
+    """ The part of a map of extent (cols, rows) shown in the widget rect (x, y, width, height).
+
+    At zoom 1 the whole map fits the widget, centred. zoom_at and pan keep
+    the view on the map.
+    """
+    def __init__(self, extent, rect=(0, 0, 1, 1), max_scale=MAX_SCALE):
+        self.max_scale = max_scale
+        self.rect = tuple(rect)
+        self.extent = tuple(extent)
+        self.fit()
+
+    def fit(self):
+        """ Back to the whole map. """
+        self.zoom = 1.0
+        self.center = (self.extent[0] / 2.0, self.extent[1] / 2.0)
+
+    def set_extent(self, extent):
+        self.extent = tuple(extent)
+        self.fit()
+
+    def set_rect(self, rect):
+        self.rect = tuple(rect)
+        self._clamp()
+
+    @property
+    def fit_scale(self):
+        return min(self.rect[2] / float(self.extent[0]), self.rect[3] / float(self.extent[1]))
+
+    @property
+    def scale(self):
+        """ Widget pixels per map pixel. """
+        return self.fit_scale * self.zoom
+
+    @property
+    def offset(self):
+        """ (tx, ty) with widget = map * scale + (tx, ty). """
+        rx, ry, rw, rh = self.rect
+        s = self.scale
+        return rx + rw / 2.0 - self.center[0] * s, ry + rh / 2.0 - self.center[1] * s
+
+    def to_map(self, x, y):
+        tx, ty = self.offset
+        s = self.scale
+        return (x - tx) / s, (y - ty) / s
+
+    def to_widget(self, x, y):
+        tx, ty = self.offset
+        s = self.scale
+        return x * s + tx, y * s + ty
+
+    def visible(self):
+        """ (x0, y0, x1, y1) of the part of the map inside the widget, in map coordinates. """
+        rx, ry, rw, rh = self.rect
+        x0, y0 = self.to_map(rx, ry)
+        x1, y1 = self.to_map(rx + rw, ry + rh)
+        return max(0.0, x0), max(0.0, y0), min(float(self.extent[0]), x1), min(float(self.extent[1]), y1)
+
+    def pixels(self):
+        """ (width, height) of the visible part of the map on screen, in widget pixels (at least 1). """
+        x0, y0, x1, y1 = self.visible()
+        s = self.scale
+        return (max(1, min(int(self.rect[2]), int(round((x1 - x0) * s)))),
+                max(1, min(int(self.rect[3]), int(round((y1 - y0) * s)))))
+
+    def zoom_at(self, factor, x, y):
+        """ Zooms by factor, keeping the map point under widget point (x, y) where it is (as far as the limits allow). """
+        mx, my = self.to_map(x, y)
+        max_zoom = max(1.0, self.max_scale / self.fit_scale)
+        self.zoom = min(max(self.zoom * factor, 1.0), max_zoom)
+        # put (mx, my) back under (x, y)
+        rx, ry, rw, rh = self.rect
+        s = self.scale
+        self.center = (mx - (x - rx - rw / 2.0) / s, my - (y - ry - rh / 2.0) / s)
+        self._clamp()
+
+    def pan(self, dx, dy):
+        """ Moves the map by (dx, dy) widget pixels. """
+        s = self.scale
+        self.center = (self.center[0] - dx / s, self.center[1] - dy / s)
+        self._clamp()
+
+    def _clamp(self):
+        s = self.scale
+        center = []
+        for c, size, length in zip(self.center, self.rect[2:], self.extent):
+            half = size / 2.0 / s
+            center.append(length / 2.0 if 2 * half >= length else min(max(c, half), length - half))
+        self.center = tuple(center)
+
+
+class Gesture(object):
+    """ Pans a Viewport with one finger and pinch zooms it with two (further fingers are ignored). """
+    def __init__(self, view):
+        self.view = view
+        self.touches = {} # touch id -> last widget position
+
+    def down(self, touch_id, x, y):
+        """ Returns True if the touch is part of the gesture. """
+        if len(self.touches) >= 2:
+            return False
+        self.touches[touch_id] = (x, y)
+        return True
+
+    def move(self, touch_id, x, y):
+        """ Returns True if the view changed. """
+        if touch_id not in self.touches:
+            return False
+        before = dict(self.touches)
+        self.touches[touch_id] = (x, y)
+        if len(self.touches) == 1:
+            bx, by = before[touch_id]
+            self.view.pan(x - bx, y - by)
+            return True
+        (ax, ay), (bx, by) = before.values()
+        (nax, nay), (nbx, nby) = self.touches.values()
+        old = math.hypot(bx - ax, by - ay)
+        new = math.hypot(nbx - nax, nby - nay)
+        cx, cy = (ax + bx) / 2.0, (ay + by) / 2.0
+        if old > 0 and new > 0:
+            self.view.zoom_at(new / old, cx, cy)
+        self.view.pan((nax + nbx) / 2.0 - cx, (nay + nby) / 2.0 - cy)
+        return True
+
+    def up(self, touch_id):
+        """ Returns True if the touch was part of the gesture. """
+        return self.touches.pop(touch_id, None) is not None
+
+    def __len__(self):
+        return len(self.touches)
@@ -0,0 +1,113 @@
+'''
+Background worker for jobs that shouldn't run on the kivy main thread.
+'''
+import threading
+import time
+import traceback
+
+
+class LatestWorker(object):
+    """ Runs jobs one at a time on a background thread, newest job wins.
+
+    At most one job waits while another runs: submitting again replaces the
+    waiting job instead of queueing behind it, so repeated requests never pile
+    up. post(callback, result) hands results back, pass something like
+    Clock.schedule_once so callbacks run on the main thread.
+    """
+    def __init__(self, post=None, name='worker'):
+        self.post = post if post is not None else (lambda callback, result: callback(result))
+        self.submitted = 0
+        self.dropped = 0 # jobs replaced by a newer one before they ran
+        self.completed = 0
+        self._cond = threading.Condition()
+        self._pending = None
+        self._busy = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """ Queues fn(*args) and returns True if that replaced a job still waiting to run.
+
+        Pass on_done=callback to get the result back (through post).
+        """
+        on_done = kwargs.pop('on_done', None)
+        with self._cond:
+            replaced = self._pending is not None
+            if replaced:
+                self.dropped += 1
+            self._pending = (fn, args, on_done)
+            self.submitted += 1
+            self._cond.notify()
+        return replaced
+
+    def busy(self):
+        """ True while a job is running or waiting. """
+        with self._cond:
+            return self._busy or self._pending is not None
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopped = True
+            self._pending = None
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                fn, args, on_done = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                result = fn(*args)
+            except Exception:
+                traceback.print_exc()
+            else:
+                if on_done is not None:
+                    self.post(on_done, result)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self.completed += 1
+
+
+class Throttle(object):
+    """ Calls fn at most rate times a second (every time with a rate of 0).
+
+    Calls that come in too soon are folded into a single trailing call, so
+    the last one always goes through. schedule(callback, delay) must run
+    callback after delay seconds (a wrapper around Clock.schedule_once on kivy).
+    """
+    def __init__(self, fn, rate, schedule, clock=time.monotonic):
+        if not rate >= 0:
+            raise ValueError('rate must be 0 (no limit) or more, got {!r}'.format(rate))
+        self.fn = fn
+        self.period = 1.0 / rate if rate else 0.0
+        self.schedule = schedule
+        self.clock = clock
+        self._last = None
+        self._scheduled = False
+
+    def __call__(self):
+        if self._scheduled:
+            return # already folded into the trailing call
+        now = self.clock()
+        if self._last is None or now - self._last >= self.period:
+            self._fire()
+        else:
+            self._scheduled = True
+            self.schedule(self._trailing, self._last + self.period - now)
+
+    def _trailing(self):
+        self._scheduled = False
+        self._fire()
+
+    def _fire(self):
+        self._last = self.clock()
+        self.fn()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import swarm_interface from the repo, without installing it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
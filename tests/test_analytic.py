@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from benchmark_pipeline import MAPS, RECT, synthetic_strokes
+from swarm_interface.analytic import analytic_distribution, compare_distributions
+from swarm_interface.distribution import draw_distribution
+
+AGREEMENT = 0.02 # total variation we accept against draw_distribution (about 0.012 at worst, on the 10x10 map)
+MAX_ERROR = 0.15 # worst single cell, relative to the rendered grid's peak
+
+
+@pytest.mark.parametrize('name', ['10x10', '50x50', 'shelby', 'large'])
+def test_agrees_with_the_pipeline(name):
+    shape, map_size = MAPS[name]
+    store = synthetic_strokes()
+    analytic = analytic_distribution(store, RECT, shape, map_size)
+    rendered = draw_distribution(store, RECT, shape, map_size)
+    assert analytic.shape == rendered.shape == (map_size[1], map_size[0])
+    agreement = compare_distributions(analytic, rendered)
+    assert agreement['total_variation'] <= AGREEMENT
+    assert agreement['max_error'] <= MAX_ERROR
+
+
+def test_sigma_is_in_background_pixels():
+    shape, map_size = MAPS['50x50']
+    store = synthetic_strokes()
+    default = analytic_distribution(store, RECT, shape, map_size)
+    # the pipeline's blur, given explicitly in background pixels
+    same = analytic_distribution(store, RECT, shape, map_size, sigma=2 * shape[1] / float(int(shape[1] / 5)))
+    wider = analytic_distribution(store, RECT, shape, map_size, sigma=40)
+    assert np.allclose(default, same, atol=1)
+    assert wider.std() < default.std()
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from swarm_interface import assets
+from swarm_interface.assets import MapCache
+from swarm_interface.distribution import linear_resample_matrix, resample_matrices
+from swarm_interface.view import Viewport
+
+RECT = (10, 10, 585, 579)
+MAP_SIZE = (50, 25)
+
+
+@pytest.fixture
+def map_file(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (378, 692, 3), dtype=np.uint8)
+    path = str(tmp_path / 'map.png')
+    assert assets.cv2.imwrite(path, image)
+    return path
+
+
+def fitted(asset):
+    return Viewport(asset.extent, RECT).pixels()
+
+
+def test_prefetched_switch_skips_the_expensive_work(map_file, monkeypatch):
+    cache = MapCache()
+    linear_resample_matrix.cache_clear()
+    cache.prefetch([map_file], map_size=MAP_SIZE, display_size=fitted).join()
+
+    # switching to the map now neither decodes, resizes nor builds matrices
+    def expensive(*args, **kwargs):
+        raise AssertionError('not prefetched')
+    for name in ('imread', 'resize', 'pyrDown'):
+        monkeypatch.setattr(assets.cv2, name, expensive)
+    built = linear_resample_matrix.cache_info().misses
+
+    asset = cache.get(map_file)
+    assert (cache.hits, cache.misses) == (1, 1)
+    view = Viewport(asset.extent, RECT)
+    image = asset.view(view.visible(), view.pixels())
+    assert image.shape[:2] == (view.pixels()[1], view.pixels()[0])
+    resample_matrices(asset.shape, MAP_SIZE)
+    assert linear_resample_matrix.cache_info().misses == built
+
+
+def test_whole_map_despite_rounding():
+    for size in ((585, 579), (405, 300)): # the second misses the edges by a rounding error
+        view = Viewport((692, 378), (10, 10) + size)
+        assert assets.whole_map(view.visible(), (692, 378))
+    view.zoom_at(2.0, 300, 300)
+    assert not assets.whole_map(view.visible(), (692, 378))
@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+
+from swarm_interface import batch
+from swarm_interface.distribution import distribution_message, normalize_distribution
+
+VAL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'val.csv')
+OPTIONS = dict(engine = None, map = batch.MAP_NAME, map_size = batch.MAP_SIZE, coord_width = batch.COORD_WIDTH)
+
+
+def convert_grid(path):
+    _, kind, grids, _, error = batch.convert((path, OPTIONS))
+    assert error is None and kind == batch.GRID and len(grids) == 1
+    return grids[0][0]
+
+
+def save_message(path, grid):
+    """ Writes the values distribution_message sends for grid the way val.csv holds them. """
+    msg, val = distribution_message(grid, 'red')
+    np.savetxt(path, np.reshape(val, (msg['map_width'], msg['map_height'])), delimiter=',')
+
+
+def test_val_csv_round_trip(tmp_path):
+    grid = convert_grid(VAL)
+    assert grid.shape == (225, 450) and np.isclose(grid.sum(), 1)
+    path = str(tmp_path / 'again.csv')
+    save_message(path, grid)
+    assert np.allclose(convert_grid(path), grid, rtol=1e-6, atol=1e-12)
+
+
+def test_grids_come_back_upright(tmp_path):
+    grid = np.zeros((20, 30), dtype=np.float32)
+    grid[2:5, 3:10] = 1 # near the top left, as drawn
+    path = str(tmp_path / 'top_left.csv')
+    save_message(path, normalize_distribution(grid))
+    converted = convert_grid(path)
+    assert np.allclose(converted, normalize_distribution(grid))
+    assert np.isclose(converted[:10].sum(), 1) # not the bottom half
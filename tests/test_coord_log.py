@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+
+from swarm_interface import batch, coord_log
+from swarm_interface.coord_log import CoordLog, coord_text, read_coord_log
+
+OLD_TEXT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'coord_output.txt')
+
+
+def write_log(path, flush_every=4096):
+    log = CoordLog(path, flush_every)
+    log.set_map_size(570, 564)
+    for x in range(10):
+        log.add_point(x, 2 * x)
+    log.clear()
+    log.set_map_size(570, 564) # unchanged, not recorded again
+    log.set_map_size(692, 378)
+    for x in range(5):
+        log.add_point(100 + x, 300 - x)
+    log.close()
+
+
+def test_binary_round_trip(tmp_path):
+    for flush_every in (4096, 2): # buffered until close, and flushed on the way
+        path = str(tmp_path / 'coord_output_{}.bin'.format(flush_every))
+        write_log(path, flush_every)
+        width, height, xs, ys = read_coord_log(path)
+        assert (width, height) == (692, 378) # the last size, points before the clear dropped
+        assert xs == [100, 101, 102, 103, 104] and ys == [300, 299, 298, 297, 296]
+
+
+def test_text_round_trip(tmp_path):
+    path = str(tmp_path / 'coord_output.bin')
+    write_log(path)
+    text_path = str(tmp_path / 'coord_output.txt')
+    with open(text_path, 'w') as f:
+        f.write(coord_text(path))
+    assert batch.read_coords(text_path) == read_coord_log(path)
+
+
+def test_empty_log_matches_the_old_text_file(tmp_path):
+    path = str(tmp_path / 'coord_output.bin')
+    log = CoordLog(path)
+    log.set_map_size(570, 564)
+    log.close()
+    with open(OLD_TEXT) as f:
+        assert coord_text(path) == f.read()
+
+
+def test_a_record_cut_short_is_dropped(tmp_path):
+    path = str(tmp_path / 'coord_output.bin')
+    write_log(path)
+    with open(path, 'ab') as f:
+        f.write(np.array([coord_log.POINT, 7], dtype='<i4').tobytes()) # a crash mid record
+    assert read_coord_log(path)[2] == [100, 101, 102, 103, 104]
@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+import pytest
+
+from swarm_interface.encoding import DeltaDecoder, DeltaEncoder, ENCODINGS, decode_distribution, distribution_fields, payload_bytes
+
+SHAPE = (50, 40)
+
+
+def frames(n=6, seed=0):
+    """ A smooth distribution, then a few cells changing per frame. """
+    rng = np.random.default_rng(seed)
+    val = rng.random(SHAPE).astype(np.float32) + 0.1
+    val /= val.sum()
+    yield val.copy()
+    for _ in range(n - 1):
+        cells = rng.integers(0, val.size, 20)
+        val.ravel()[cells] *= rng.uniform(0.5, 1.5, len(cells)).astype(np.float32)
+        yield val.copy()
+
+
+def message(fields):
+    return dict(fields, map_width=SHAPE[0], map_height=SHAPE[1])
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_round_trip(encoding):
+    val = next(frames())
+    decoded = decode_distribution(message(distribution_fields(val, encoding)))
+    tolerance = (val.max() - val.min()) / 65535 if encoding == 'uint16' else 0
+    assert decoded.shape == SHAPE
+    assert np.abs(decoded - val).max() <= tolerance
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_delta_stream(encoding):
+    encoder, decoder = DeltaEncoder(keyframe_every=20), DeltaDecoder()
+    kinds = []
+    for val in frames():
+        msg = message(encoder.encode(val, encoding))
+        kinds.append(msg['frame'])
+        grid = decoder.apply(msg)
+        # uint16 cells may be off by half a quantization step of the last keyframe (plus float32 rounding of the decode)
+        tolerance = encoder._tolerance * 1.1 if encoding == 'uint16' else 0
+        assert np.abs(grid - val).max() <= tolerance
+    assert kinds == ['key'] + ['delta'] * 5
+
+
+def test_keyframe_every():
+    encoder = DeltaEncoder(keyframe_every=3)
+    kinds = [encoder.encode(val, 'uint16')['frame'] for val in frames(7)]
+    assert kinds == ['key', 'delta', 'delta'] * 2 + ['key']
+
+
+def test_reset_sends_a_keyframe():
+    encoder = DeltaEncoder()
+    vals = list(frames(3))
+    encoder.encode(vals[0], 'uint16')
+    encoder.reset()
+    assert encoder.encode(vals[1], 'uint16')['frame'] == 'key'
+    assert encoder.encode(vals[2], 'uint16')['frame'] == 'delta'
+
+
+def test_flat_keyframe_then_changes():
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    flat = np.zeros(SHAPE, dtype=np.float32)
+    decoder.apply(message(encoder.encode(flat, 'uint16')))
+    changed = flat.copy()
+    changed[3, 4] = 1e-3
+    msg = message(encoder.encode(changed, 'uint16'))
+    assert msg['frame'] in ('delta', 'sparse')
+    np.testing.assert_array_equal(decoder.apply(msg), changed)
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_payload_bytes_close_to_the_json(encoding):
+    encoder = DeltaEncoder()
+    for val in frames(3):
+        fields = encoder.encode(val, encoding)
+        lists = {name: value for name, value in fields.items() if name in ('data', 'payload', 'indices', 'values')}
+        actual = len(json.dumps(lists))
+        assert 0.8 * actual <= payload_bytes(fields) <= 1.25 * actual
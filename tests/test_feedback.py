@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+import pytest
+
+from swarm_interface.feedback import AgentFeedback, pose_array
+
+SHAPE = (20, 30) # map grid (rows, cols)
+
+
+def poses(*agents):
+    """ A PoseArray message of (x, y, heading) agents. """
+    return dict(poses = [dict(position = dict(x = x, y = y, z = 0.0),
+                              orientation = dict(x = 0.0, y = 0.0, z = math.sin(heading / 2), w = math.cos(heading / 2)))
+                         for x, y, heading in agents])
+
+
+@pytest.fixture
+def feedback():
+    fb = AgentFeedback(shape=SHAPE, rate=0.001) # the test ticks it
+    yield fb
+    fb.close()
+
+
+def test_pose_array_headings_and_decimation():
+    agents = pose_array(poses((1.5, 2.0, 0.0), (3.0, 4.0, math.pi / 2), (5.0, 6.0, -2.0)))
+    assert agents.dtype == np.float32 and agents.shape == (3, 3)
+    assert np.allclose(agents, [(1.5, 2.0, 0.0), (3.0, 4.0, math.pi / 2), (5.0, 6.0, -2.0)], atol=1e-6)
+    assert pose_array(dict(poses = [])).shape == (0, 3)
+    many = pose_array(poses(*[(i, 0.0, 0.0) for i in range(2500)]), max_agents=1000)
+    assert len(many) <= 1000 and many[1, 0] - many[0, 0] == 3 # every third agent
+
+
+def test_coverage_counts_time_in_each_cell(feedback):
+    feedback.receive('red', poses((2.5, 3.5, 0.0), (10.2, 0.1, 0.0), (-1.0, 5.0, 0.0), (31.0, 5.0, 0.0)))
+    feedback.tick(1.0)
+    coverage = feedback.coverage('red')
+    assert coverage.shape == SHAPE
+    assert coverage[3, 2] == coverage[0, 10] == 0.5 # row is y, off map agents count for nothing
+    assert not feedback.coverage('blue').any()
+    snapshot = feedback.latest()
+    assert snapshot.version == 1 and len(snapshot.agents['red']) == 4
+    feedback.tick(1.0)
+    assert feedback.latest().version == 1 # nothing new arrived
+
+
+def test_metric_is_lower_for_agents_on_the_target(feedback):
+    target = np.zeros(SHAPE)
+    target[14:18, 4:8] = 1
+    feedback.set_target(target / target.sum())
+    feedback.receive('red', poses(*[(x + 0.5, y + 0.5, 0.0) for x in range(4, 8) for y in range(14, 18)]))
+    feedback.receive('blue', poses(*[(x + 0.5, y + 0.5, 0.0) for x in range(20, 24) for y in range(2, 6)]))
+    feedback.tick(1.0)
+    metrics = feedback.latest().metrics
+    assert metrics['red'] < metrics['blue']
+
+
+def test_a_new_shape_starts_over(feedback):
+    feedback.receive('red', poses((1.0, 1.0, 0.0)))
+    feedback.tick(1.0)
+    feedback.set_shape((10, 10))
+    assert feedback.coverage('red').shape == (10, 10) and not feedback.coverage('red').any()
@@ -0,0 +1,33 @@
+import numpy as np
+
+import benchmark_pipeline
+from benchmark_pipeline import RECT, synthetic_strokes
+from swarm_interface.distribution import distribution_message, draw_distribution, normalize_distribution
+from swarm_interface.encoding import decode_distribution
+from swarm_interface.fourier import fourier_error, fourier_fields
+
+SHAPE = (150, 240) # background (rows, cols)
+MAP_SIZE = (48, 20) # map grid (width, height), not square
+
+
+def message():
+    val = normalize_distribution(draw_distribution(synthetic_strokes(6, 60), RECT, SHAPE, MAP_SIZE))
+    msg, flat = distribution_message(val, 'red')
+    return val, msg, flat
+
+
+def test_fourier_fields_on_a_non_square_grid():
+    val, msg, flat = message()
+    shape = (msg['map_width'], msg['map_height'])
+    assert shape == val.shape == (MAP_SIZE[1], MAP_SIZE[0])
+    # K as large as the grid is lossless
+    msg.update(fourier_fields(flat, shape, max(shape)))
+    assert np.allclose(decode_distribution(msg), np.reshape(flat, shape), atol=1e-4 * flat.max())
+
+
+def test_benchmark_reports_the_error_of_the_real_grid():
+    val, msg, flat = message()
+    expected = fourier_error(np.reshape(flat, val.shape), benchmark_pipeline.FOURIER_K)
+    result = benchmark_pipeline.benchmark_map(SHAPE, MAP_SIZE, synthetic_strokes(6, 60), 1)
+    assert np.isclose(result['fourier']['total_variation'], expected['total_variation'])
+    assert np.isclose(result['fourier']['max_error'], expected['max_error'])
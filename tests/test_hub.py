@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from swarm_interface.hub import Hub, TeamAggregator
+from swarm_interface.encoding import distribution_fields
+
+SIZE = (4, 3) # map_width, map_height
+
+
+def message(tablet, value, **fields):
+    grid = np.full(SIZE[0] * SIZE[1], value, dtype=np.float32)
+    msg = dict(team = 'red', tablet = tablet, map_width = SIZE[0], map_height = SIZE[1])
+    msg.update(distribution_fields(grid))
+    msg.update(fields)
+    return msg
+
+
+def test_weights_0_1_and_2():
+    aggregator = TeamAggregator('red')
+    for tablet, value, weight in (('a', 1.0, 0), ('b', 2.0, 1), ('c', 5.0, 2)):
+        assert aggregator.update(message(tablet, value, weight = weight))
+    merged, total = aggregator.merge()
+    assert total == 3
+    assert np.allclose(merged, (2.0 * 1 + 5.0 * 2) / 3) # a counts for nothing
+    assert aggregator.tablets == ['b', 'c']
+
+
+def test_missing_weight_counts_as_1():
+    aggregator = TeamAggregator('red')
+    aggregator.update(message('a', 1.0))
+    aggregator.update(message('b', 3.0, weight = 1))
+    merged, total = aggregator.merge()
+    assert total == 2 and np.allclose(merged, 2.0)
+
+
+def test_only_zero_weights_merge_to_nothing():
+    aggregator = TeamAggregator('red')
+    assert aggregator.update(message('a', 1.0, weight = 0))
+    assert aggregator.merge() == (None, 0)
+    assert aggregator.tablets == []
+
+
+@pytest.mark.parametrize('weight', [-1, float('nan'), float('inf'), 'heavy', None])
+def test_invalid_weights_are_ignored(weight):
+    aggregator = TeamAggregator('red')
+    aggregator.update(message('a', 1.0, weight = 1))
+    assert not aggregator.update(message('b', 9.0, weight = weight))
+    assert aggregator.ignored == 1
+    merged, total = aggregator.merge()
+    assert total == 1 and np.allclose(merged, 1.0)
+
+
+def test_other_teams_are_ignored():
+    aggregator = TeamAggregator('blue')
+    assert not aggregator.update(message('a', 1.0))
+    assert aggregator.ignored == 1 and aggregator.merge() == (None, 0)
+
+
+def test_hub_publishes_changes_only():
+    aggregator = TeamAggregator('red')
+    sent = []
+    hub = Hub(aggregator, lambda msg, val: sent.append((msg, val)), rate=0.001) # the test ticks it
+    try:
+        assert not hub.tick()
+        aggregator.update(message('a', 1.0, weight = 2))
+        assert hub.tick()
+        assert not hub.tick()
+        msg, val = sent[0]
+        assert (msg['weight'], msg['map_width'], msg['map_height']) == (2, SIZE[0], SIZE[1])
+        assert np.allclose(val, 1.0)
+    finally:
+        hub.stop()
+
+
+@pytest.mark.parametrize('rate', [0, -1.0, float('nan')])
+def test_hub_needs_a_positive_rate(rate):
+    with pytest.raises(ValueError):
+        Hub(TeamAggregator('red'), lambda msg, val: None, rate=rate)
+
+
+def test_main_rejects_a_zero_rate():
+    from swarm_interface import hub
+    with pytest.raises(SystemExit):
+        hub.main(['--team', 'red', '--rate', '0'])
@@ -0,0 +1,76 @@
+import numpy as np
+
+from swarm_interface.analytic import compare_distributions
+from swarm_interface.distribution import IncrementalDistribution, draw_distribution
+from swarm_interface.strokes import StrokeRecorder, ERASE
+
+SHAPE = (400, 600) # background (rows, cols)
+RECT = (0, 0, 600, 400) # strokes in background pixels
+MAP_SIZE = (60, 40)
+AGREEMENT = 0.003 # total variation between a dirty-tile update and the full pipeline (about 0.0015 at worst here)
+MAX_ERROR = 0.02 # worst cell, relative to the peak (stray pixels of thick lines cut at a tile edge)
+
+
+def walk(rng, n):
+    x, y = rng.uniform(50, 550), rng.uniform(50, 350)
+    points = []
+    for _ in range(n):
+        x, y = np.clip(x + rng.normal(0, 8), 0, 600), np.clip(y + rng.normal(0, 8), 0, 400)
+        points.append((x, y))
+    return points
+
+
+class Session(object):
+    """ A recorder and an IncrementalDistribution, checked against draw_distribution after every change. """
+    def __init__(self):
+        self.recorder = StrokeRecorder()
+        self.recorder.rect = RECT
+        self.engine = IncrementalDistribution()
+        self.worst = 0.0
+
+    def check(self):
+        store = self.recorder.store
+        grid = self.engine.update(store, RECT, SHAPE, MAP_SIZE)
+        agreement = compare_distributions(grid, draw_distribution(store, RECT, SHAPE, MAP_SIZE))
+        assert agreement['total_variation'] <= AGREEMENT
+        assert agreement['max_error'] <= MAX_ERROR
+        self.worst = max(self.worst, agreement['total_variation'])
+
+    def drag(self, touch, mode, width, points, check_every=10):
+        (x, y), rest = points[0], points[1:]
+        self.recorder.down(touch, x, y, mode, width)
+        for n, (x, y) in enumerate(rest, 1):
+            self.recorder.move(touch, x, y)
+            if n % check_every == 0: # the stroke grows between updates
+                self.check()
+        self.recorder.up(touch)
+        self.check()
+
+
+def test_matches_the_pipeline_while_drawing_erasing_and_undoing():
+    rng = np.random.default_rng(3)
+    session = Session()
+    for i in range(8):
+        session.drag(i, ('attract', 'repel')[i % 2], rng.uniform(3, 15), walk(rng, 60))
+    # an eraser drag across the map hides whatever it passes over
+    session.drag(100, ERASE, 20, [(x, 200) for x in range(0, 600, 10)])
+    assert session.recorder.history[-1][0] == 'erase'
+    session.recorder.undo()
+    session.check()
+    session.recorder.undo() # the last stroke drawn
+    session.check()
+    session.recorder.redo()
+    session.check()
+    session.recorder.clear()
+    session.check()
+    session.drag(200, 'attract', 10, walk(rng, 40))
+    assert 0 < session.worst <= AGREEMENT
+
+
+def test_a_new_map_size_starts_over():
+    rng = np.random.default_rng(4)
+    session = Session()
+    session.drag(0, 'attract', 8, walk(rng, 40))
+    grid = session.engine.update(session.recorder.store, RECT, SHAPE, (30, 20))
+    assert grid.shape == (20, 30)
+    assert compare_distributions(grid, draw_distribution(session.recorder.store, RECT, SHAPE, (30, 20)))['total_variation'] <= AGREEMENT
@@ -0,0 +1,37 @@
+import time
+
+from swarm_interface import journal
+
+SHAPE = (200, 300) # background (rows, cols), no map file: replay draws on a blank one
+
+
+def settings(map_size, **changes):
+    config = dict(rect = [0, 0, SHAPE[1], SHAPE[0]], map_name = 'missing.png', map_size = list(map_size),
+                  background_shape = list(SHAPE), team = 'red')
+    config.update(changes)
+    return config
+
+
+def stroke(jrn, touch, mode='attract'):
+    jrn.record(journal.DOWN, time.perf_counter(), touch, 50, 50, mode, 10)
+    for x in range(60, 200, 10):
+        jrn.record(journal.MOVE, time.perf_counter(), touch, x, 100)
+    jrn.record(journal.UP, time.perf_counter(), touch)
+
+
+def test_config_before_a_deploy_applies_to_it(tmp_path):
+    path = str(tmp_path / 'session.jrn')
+    jrn = journal.Journal(path)
+    jrn.config(**settings((30, 20)))
+    stroke(jrn, 1)
+    jrn.config(**settings((30, 20))) # unchanged, not written again
+    jrn.record(journal.DEPLOY, time.perf_counter())
+    jrn.config(**settings((15, 10))) # Choose Map with another grid, then deploy without touching
+    jrn.record(journal.DEPLOY, time.perf_counter())
+    jrn.close()
+
+    events, configs = journal.read_journal(path)
+    assert [index for index, _ in configs] == [0, len(events) - 1]
+    shapes = []
+    journal.replay(path, messages=False, on_deploy=lambda grid, seconds: shapes.append(grid.shape))
+    assert shapes == [(20, 30), (10, 15)]
@@ -0,0 +1,81 @@
+import numpy as np
+
+from swarm_interface.analytic import BASELINE, GROWING, LayeredDistribution
+from swarm_interface.strokes import StrokeRecorder, ERASE
+
+SHAPE = (300, 450) # background (rows, cols)
+RECT = (0, 0, 450, 300) # strokes in background pixels
+MAP_SIZE = (45, 30)
+
+
+def line(x0, y0, x1, y1, n=25):
+    return list(zip(np.linspace(x0, x1, n), np.linspace(y0, y1, n)))
+
+
+def rebuilt(recorder):
+    """ What a fresh LayeredDistribution makes of the strokes in one go. """
+    return LayeredDistribution().update(recorder.store, RECT, SHAPE, MAP_SIZE)
+
+
+def test_updates_equal_a_rebuild_through_erase_and_undo():
+    recorder = StrokeRecorder()
+    recorder.rect = RECT
+    layered = LayeredDistribution()
+
+    def same():
+        grid = layered.update(recorder.store, RECT, SHAPE, MAP_SIZE)
+        assert np.array_equal(grid, rebuilt(recorder)) # the same bits, not just close
+
+    # two fingers drawing at once, updated after every point
+    a, b = line(40, 40, 400, 250), line(60, 260, 380, 30)
+    recorder.down(1, *a[0], mode='attract', width=6)
+    recorder.down(2, *b[0], mode='repel', width=10)
+    for pa, pb in zip(a[1:], b[1:]):
+        recorder.move(1, *pa)
+        recorder.move(2, *pb)
+        same()
+    recorder.up(1)
+    recorder.up(2)
+
+    # more strokes than it keeps growing coverage for, updated only now and then
+    for k in range(GROWING + 2):
+        points = line(30 + 35 * k, 20, 50 + 35 * k, 280, 12)
+        recorder.down(10 + k, *points[0], mode=('attract', 'repel')[k % 3 == 0], width=4)
+        for p in points[1:]:
+            recorder.move(10 + k, *p)
+            if k % 2:
+                same()
+        recorder.up(10 + k)
+    same()
+
+    # the eraser across the middle, undone and redone, then a stroke undone
+    recorder.down(99, 0, 150, ERASE, 15)
+    for x in range(0, 450, 15):
+        recorder.move(99, x, 150)
+        same()
+    recorder.up(99)
+    assert recorder.history[-1][0] == 'erase'
+    for step in (recorder.undo, recorder.redo, recorder.undo, recorder.undo, recorder.redo):
+        step()
+        same()
+    recorder.clear()
+    same()
+    assert np.allclose(layered.update(recorder.store, RECT, SHAPE, MAP_SIZE), BASELINE)
+
+
+def test_layers_stack_and_repel_cancels():
+    recorder = StrokeRecorder()
+    recorder.rect = RECT
+    points = line(100, 150, 350, 150)
+
+    def draw(touch, mode):
+        recorder.down(touch, *points[0], mode=mode, width=8)
+        for p in points[1:]:
+            recorder.move(touch, *p)
+        recorder.up(touch)
+        return rebuilt(recorder)
+
+    once = draw(1, 'attract')
+    twice = draw(2, 'attract')
+    assert np.allclose(twice - BASELINE, 2 * (once - BASELINE), atol=1e-4) # two layers pull twice as hard
+    assert np.allclose(draw(3, 'repel'), once, atol=1e-4) # repel over the same line takes one away
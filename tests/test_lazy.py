@@ -0,0 +1,19 @@
+import sys
+
+from swarm_interface.lazy import LazyModule, preload_in_background
+
+
+def test_imported_on_first_use():
+    sys.modules.pop('colorsys', None)
+    colorsys = LazyModule('colorsys')
+    assert not colorsys.loaded()
+    assert colorsys.rgb_to_hsv(1, 0, 0) == (0, 1, 1)
+    assert colorsys.loaded()
+
+
+def test_preload_runs_on_its_own_thread():
+    sys.modules.pop('colorsys', None)
+    thread = preload_in_background(('colorsys',))
+    assert thread.daemon
+    thread.join(5)
+    assert 'colorsys' in sys.modules
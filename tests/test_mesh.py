@@ -0,0 +1,29 @@
+import numpy as np
+
+from swarm_interface.mesh import JOIN_SIDES, MeshChunks, stroke_triangles
+
+
+def test_a_lone_point_is_not_drawn():
+    chunks = MeshChunks()
+    assert chunks.add([[10, 10]], 5) == []
+    assert chunks.add(np.zeros((0, 2)), 5) == []
+    assert chunks.chunks == [] and chunks.vertices == 0
+    assert chunks.add([[10, 10], [20, 10]], 5) == [0]
+
+
+def test_long_strokes_fill_several_chunks():
+    chunks = MeshChunks(max_vertices=200)
+    points = np.stack((np.arange(100.0), np.zeros(100)), axis=1)
+    changed = chunks.add(points, 2)
+    assert changed == list(range(len(chunks.chunks))) and len(changed) > 1
+    for vertices, indices in chunks.chunks:
+        assert len(vertices) <= 200
+        assert indices.min() >= 0 and indices.max() < len(vertices)
+    # every point gets its disc, the pieces share their end points
+    assert chunks.vertices >= len(points) * (JOIN_SIDES + 1)
+
+
+def test_stroke_triangles_skip_zero_length_segments():
+    vertices, indices = stroke_triangles([[0, 0], [0, 0], [3, 4]], 1.0)
+    assert len(vertices) == 3 * (JOIN_SIDES + 1) + 4
+    assert len(indices) == 3 * 3 * JOIN_SIDES + 6
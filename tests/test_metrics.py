@@ -0,0 +1,89 @@
+import json
+import re
+from urllib.request import urlopen
+
+import pytest
+
+from swarm_interface.metrics import BYTES, SECONDS, Histogram, JsonLog, Metrics, serve
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{le="[^"]+"\})? \S+$') # a sample line of the text format
+
+
+def test_quantile_is_the_bucket_bound():
+    histogram = Histogram((1, 2, 5, 10))
+    assert histogram.quantile(0.5) == 0.0 # nothing observed yet
+    for value in [0.5] * 50 + [1.5] * 40 + [3] * 9 + [7]:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.9) == 2
+    assert histogram.quantile(0.95) == 5
+    assert histogram.quantile(1.0) == 7 # the bound of its bucket is 10, but nothing went past 7
+
+
+def test_quantile_past_the_last_bound_is_the_max():
+    histogram = Histogram((1, 2))
+    for value in (0.5, 30, 40):
+        histogram.observe(value)
+    assert histogram.quantile(0.9) == 40
+    assert histogram.snapshot()['buckets'] == [(1, 1), (2, 0), ('+Inf', 2)]
+
+
+def test_bounds_follow_the_name():
+    metrics = Metrics()
+    assert metrics.histogram('publish_bytes').bounds == BYTES
+    assert metrics.histogram('deploy').bounds == SECONDS
+
+
+def test_prometheus_text():
+    metrics = Metrics(prefix='swarm')
+    metrics.inc('deploys')
+    metrics.inc('deploys', 2)
+    for value in (0.0002, 0.003, 0.003, 7.0):
+        metrics.observe('deploy', value)
+    text = metrics.prometheus()
+    assert text.endswith('\n')
+    lines = text.splitlines()
+    assert lines[:2] == ['# TYPE swarm_deploys_total counter', 'swarm_deploys_total 3']
+    assert '# TYPE swarm_deploy histogram' in lines
+    for line in lines:
+        assert line.startswith('# TYPE ') or SAMPLE.match(line), line
+
+    # cumulative buckets, ending in +Inf with the count
+    buckets = [(re.search(r'le="([^"]+)"', line).group(1), int(line.split()[-1])) for line in lines if '_bucket' in line]
+    assert [bound for bound, _ in buckets] == [str(bound) for bound in SECONDS] + ['+Inf']
+    counts = [n for _, n in buckets]
+    assert counts == sorted(counts) and counts[-1] == 4
+    assert dict(buckets)['0.00025'] == 1 and dict(buckets)['0.005'] == 3
+    assert 'swarm_deploy_count 4' in lines
+    assert float([line for line in lines if line.startswith('swarm_deploy_sum ')][0].split()[1]) == pytest.approx(7.0062)
+
+
+def test_served_over_http():
+    metrics = Metrics()
+    metrics.observe('deploy', 0.01)
+    server = serve(metrics, 0)
+    try:
+        with urlopen('http://127.0.0.1:{}/metrics'.format(server.server_address[1]), timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert response.read().decode('utf-8') == metrics.prometheus()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_json_log_and_summary(tmp_path):
+    metrics = Metrics()
+    with metrics.timer('deploy'):
+        pass
+    metrics.observe('publish_bytes', 1200)
+    log = JsonLog(metrics, str(tmp_path / 'metrics.jsonl'))
+    log.write()
+    log.write()
+    log.close()
+    with open(str(tmp_path / 'metrics.jsonl')) as f:
+        snapshots = [json.loads(line) for line in f]
+    assert len(snapshots) == 2
+    assert snapshots[0]['histograms']['publish_bytes']['sum'] == 1200
+    summary = metrics.summary().splitlines()
+    assert [line.split()[0] for line in summary] == ['deploy', 'publish_bytes']
+    assert 'p50=  1200B' in summary[1] # the bucket's bound, 2500, is past the max
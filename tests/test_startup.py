@@ -0,0 +1,25 @@
+import ast
+import os
+
+from swarm_interface import startup
+
+INTERFACE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ergodic_interface_v12.py')
+
+
+def test_probe_imports_what_the_interface_imports():
+    with open(INTERFACE, 'rb') as f:
+        tree = ast.parse(f.read())
+    imported = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module and node.module.startswith('swarm_interface'):
+            if node.module == 'swarm_interface':
+                imported.update(alias.name for alias in node.names)
+            else:
+                imported.add(node.module.split('.', 1)[1])
+    assert imported <= set(startup.MODULES)
+
+
+def test_core_imports_no_heavy_modules():
+    seconds, loaded = startup.import_time()
+    assert loaded == []
+    assert seconds > 0
@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+
+from swarm_interface.distribution import KIVY_LINE_THICKNESS
+from swarm_interface.strokes import ERASE, Simplifier, StrokeRecorder
+
+
+def samples(seed=0, n=300):
+    """ A wobbly finger path, sampled densely like touch events. """
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 3 * np.pi, n)
+    return np.stack((40 * t + rng.normal(0, 0.3, n), 100 + 60 * np.sin(t) + rng.normal(0, 0.3, n)), axis=1)
+
+
+def simplify(points, method, tolerance, window=64):
+    simplifier = Simplifier(method, tolerance, window)
+    simplifier.start(*points[0])
+    kept = [tuple(points[0])]
+    for x, y in points[1:]:
+        kept += simplifier.add(x, y)
+    return np.array(kept + simplifier.finish())
+
+
+def distance_to_polyline(points, polyline):
+    a, d = polyline[:-1], np.diff(polyline, axis=0)
+    p = points[:, None, :] - a[None]
+    t = np.clip((p * d).sum(axis=2) / np.maximum((d * d).sum(axis=1), 1e-12), 0, 1)
+    return np.hypot(*(p - t[..., None] * d).transpose(2, 0, 1)).min(axis=1)
+
+
+@pytest.mark.parametrize('method', ['distance', 'dp'])
+def test_every_sample_stays_within_tolerance(method):
+    points = samples()
+    kept = simplify(points, method, 2.0)
+    assert np.array_equal(kept[0], points[0]) and np.array_equal(kept[-1], points[-1])
+    assert len(kept) < len(points) / 1.5
+    assert distance_to_polyline(points, kept).max() <= 2.0 + 1e-9
+
+
+def test_distance_keeps_samples_tolerance_apart():
+    kept = simplify(samples(), 'distance', 5.0)
+    assert np.hypot(*np.diff(kept[:-1], axis=0).T).min() >= 5.0
+
+
+def test_dp_holds_back_at_most_window_samples():
+    line = np.stack((np.arange(200.0), np.zeros(200)), axis=1) # straight, dp would hold back all of it
+    kept = simplify(line, 'dp', 1.0, window=16)
+    assert np.diff(np.flatnonzero(np.isin(line[:, 0], kept[:, 0]))).max() <= 16
+
+
+def test_none_keeps_everything():
+    points = samples(n=50)
+    assert np.array_equal(simplify(points, 'none', 5.0), points)
+    assert np.array_equal(simplify(points, 'dp', 0.0), points)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        Simplifier('visvalingam', 1.0)
+
+
+def test_recorder_counts_what_it_kept():
+    recorder = StrokeRecorder(simplifier=Simplifier('dp', 2.0))
+    recorder.rect = (0, 0, 1000, 1000)
+    points = samples()
+    recorder.down(1, *points[0], mode='attract', width=5)
+    for x, y in points[1:]:
+        recorder.move(1, x, y)
+        if recorder.tip is not None: # drawn up to the finger although held back
+            assert recorder.tip == (x, y)
+    recorder.up(1)
+    assert recorder.samples == len(points)
+    assert recorder.kept == recorder.store.counts()[0] < len(points)
+    assert recorder.reduction() == pytest.approx(1 - recorder.kept / float(len(points)))
+
+
+def near(store, x, y, radius):
+    """ The shown strokes within radius of (x, y), measured against every segment (what the index must find). """
+    hits = []
+    for i in range(len(store)):
+        pts = store.points(i).astype(np.float64)
+        if len(pts) == 1:
+            pts = np.concatenate((pts, pts))
+        reach = radius + KIVY_LINE_THICKNESS * store.width(i) / 2.0
+        if store.visible(i) and distance_to_polyline(np.array([[x, y]]), pts)[0] <= reach:
+            hits.append(i)
+    return hits
+
+
+def test_index_finds_what_a_full_search_finds():
+    rng = np.random.default_rng(1)
+    recorder = StrokeRecorder()
+    recorder.rect = (0, 0, 800, 600)
+    for k in range(0, 40, 2): # two fingers at a time, their points interleaved in the store
+        a, b = rng.uniform((0, 0), (800, 600), (2, 2))
+        recorder.down(k, *a, mode='attract', width=rng.uniform(1, 8))
+        recorder.down(k + 1, *b, mode='repel', width=rng.uniform(1, 8))
+        for _ in range(int(rng.integers(0, 30))):
+            a = np.clip(a + rng.normal(0, 15, 2), 0, (800, 600))
+            b = np.clip(b + rng.normal(0, 15, 2), 0, (800, 600))
+            recorder.move(k, *a)
+            recorder.move(k + 1, *b)
+        recorder.up(k)
+        recorder.up(k + 1)
+    for i in range(0, len(recorder.store), 7):
+        recorder.store.set_visible(i, False) # hidden strokes are never hit
+    for x, y, radius in zip(rng.uniform(0, 800, 300), rng.uniform(0, 600, 300), rng.uniform(0, 40, 300)):
+        assert recorder.index.query(recorder.store, x, y, radius).tolist() == near(recorder.store, x, y, radius)
+
+
+def test_erase_only_what_the_brush_touches_and_undo_it():
+    recorder = StrokeRecorder()
+    recorder.rect = (0, 0, 800, 600)
+    for k, y in enumerate((100, 200, 300)): # three horizontal lines
+        recorder.down(k, 50, y, 'attract', 2)
+        recorder.move(k, 750, y)
+        recorder.up(k)
+    recorder.down(9, 400, 180, ERASE, 5) # touches the middle line only
+    for y in (195, 210, 225):
+        recorder.move(9, 400, y)
+    recorder.up(9)
+    assert recorder.history[-1] == ('erase', [1])
+    assert recorder.store.visibility().tolist() == [True, False, True]
+    assert recorder.undo() == ([1], True)
+    assert recorder.store.visibility().tolist() == [True, True, True]
+    assert recorder.undo() == ([2], False) # the last line drawn
+    assert recorder.redo() == ([2], True)
+    recorder.down(10, 100, 100, 'attract', 2) # a new edit ends the redo chain
+    recorder.up(10)
+    assert recorder.redo() is None
@@ -0,0 +1,135 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from swarm_interface.metrics import Metrics
+from swarm_interface.rosbridge_stub import StubRosbridge
+from swarm_interface.transport import SendQueue, ros_interface, DISTRIBUTION
+
+TOPIC = '/tablet_comm'
+BACKOFF = (0.05, 0.2) # seconds, short so the tests don't wait on reconnects
+
+
+def wait_for(condition, timeout=5.0):
+    """ Polls condition until it holds, returns whether it did within timeout. """
+    end = time.time() + timeout
+    while time.time() < end:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def distribution(seed=0):
+    val = np.random.default_rng(seed).random((4, 5)).astype(np.float32)
+    return dict(team = 'red', map_width = 5, map_height = 4), val / val.sum()
+
+
+@pytest.fixture
+def stub():
+    server = StubRosbridge(port=0)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def ros(stub):
+    pytest.importorskip('roslibpy')
+    interface = ros_interface('red', 'yes', port=stub.port, backoff=BACKOFF, connect_timeout=2.0)
+    yield interface
+    interface.close(terminate=False)
+
+
+def test_publishes_distributions(stub, ros):
+    ros.publish_distribution(*distribution())
+    assert wait_for(lambda: len(stub.messages(TOPIC)) == 1)
+    msg = stub.messages(TOPIC)[0]
+    assert (msg['map_width'], msg['map_height']) == (5, 4)
+    assert len(msg['data']) == 20
+    assert wait_for(lambda: ros.counters['sent'] == 1)
+
+
+def test_reconnects_and_resends_the_latest(stub, ros):
+    ros.publish_distribution(*distribution())
+    assert wait_for(lambda: len(stub.messages(TOPIC)) == 1)
+    stub.drop_clients()
+    # the last distribution goes out again on its own once the connection is back
+    assert wait_for(lambda: len(stub.messages(TOPIC)) == 2)
+    assert ros.counters['disconnects'] == 1
+    assert ros.counters['connects'] == 2
+    assert ros.counters['resent'] == 1
+    assert stub.messages(TOPIC)[1]['data'] == stub.messages(TOPIC)[0]['data']
+
+
+def test_waits_out_a_refusing_host(stub, ros):
+    assert wait_for(lambda: ros.is_connected)
+    stub.refuse(0.5)
+    assert wait_for(lambda: not ros.is_connected)
+    ros.publish_distribution(*distribution(1))
+    time.sleep(0.3)
+    assert stub.messages(TOPIC) == [] # nothing gets through while refused
+    assert wait_for(lambda: len(stub.messages(TOPIC)) == 1)
+    assert ros.counters['connect_attempts'] >= 2
+    assert ros.stats()['connected']
+
+
+@pytest.mark.parametrize('encoding, delta, fourier', [('json', False, 0), ('uint16', False, 0), ('json', True, 0), ('json', False, 3)])
+def test_payload_bytes_and_quiet_sends(stub, encoding, delta, fourier, capsys):
+    pytest.importorskip('roslibpy')
+    metrics = Metrics()
+    ros = ros_interface('red', 'yes', port=stub.port, backoff=BACKOFF, connect_timeout=2.0, encoding=encoding,
+                        delta=delta, fourier=fourier, metrics=metrics)
+    try:
+        ros.publish_distribution(*distribution())
+        assert wait_for(lambda: ros.counters['sent'] == 1 and len(stub.messages(TOPIC)) == 1)
+    finally:
+        ros.close(terminate=False)
+    sizes = metrics.snapshot()['histograms']['publish_bytes']
+    sent = stub.messages(TOPIC)[0]
+    fields = {name: sent[name] for name in ('data', 'payload', 'indices', 'values', 'coefficients') if name in sent}
+    # every kind of message gets a size, within a factor of two of its json
+    assert sizes['count'] == 1
+    assert 0.5 * len(json.dumps(fields)) <= sizes['sum'] <= 2 * len(json.dumps(fields))
+    assert 'Publishing data' not in capsys.readouterr().out
+
+
+def test_coalesce_keeps_the_newest_of_a_kind():
+    queue = SendQueue(4, 'coalesce')
+    for i in range(3):
+        assert queue.put(DISTRIBUTION, i)
+    queue.put('connect', 'c')
+    assert len(queue) == 2 and queue.dropped == 2
+    assert queue.get(0) == (DISTRIBUTION, 2)
+    assert queue.get(0) == ('connect', 'c')
+    assert queue.get(0) is None
+
+
+def test_drop_oldest():
+    queue = SendQueue(2, 'drop-oldest')
+    for i in range(4):
+        assert queue.put(None, i)
+    assert queue.dropped == 2
+    assert [queue.get(0), queue.get(0)] == [(None, 2), (None, 3)]
+
+
+def test_drop_newest():
+    queue = SendQueue(2, 'drop-newest')
+    results = [queue.put(None, i) for i in range(4)]
+    assert results == [True, True, False, False]
+    assert queue.dropped == 2
+    assert [queue.get(0), queue.get(0)] == [(None, 0), (None, 1)]
+
+
+def test_put_front_goes_out_first_unless_full():
+    queue = SendQueue(2, 'drop-oldest')
+    queue.put(None, 'later')
+    assert queue.put_front(None, 'retry')
+    assert not queue.put_front(None, 'no room')
+    assert [queue.get(0), queue.get(0)] == [(None, 'retry'), (None, 'later')]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        SendQueue(2, 'drop-random')
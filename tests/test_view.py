@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from swarm_interface.view import Gesture, Viewport
+
+EXTENT = (692, 378) # shelby's map, wider than the widget
+RECT = (10, 20, 585, 579)
+
+
+def inside(view, x0, y0, x1, y1):
+    """ Whether the view's visible part of the map lies within (x0, y0, x1, y1), to rounding. """
+    vx0, vy0, vx1, vy1 = view.visible()
+    return vx0 >= x0 - 1e-9 and vy0 >= y0 - 1e-9 and vx1 <= x1 + 1e-9 and vy1 <= y1 + 1e-9
+
+
+@pytest.mark.parametrize('zoom', [1.0, 1.7, 3.0])
+def test_to_map_and_to_widget_are_inverses(zoom):
+    view = Viewport(EXTENT, RECT)
+    view.zoom_at(zoom, 200, 300)
+    view.pan(-35, 12)
+    points = np.random.default_rng(0).uniform((0, 0), EXTENT, (20, 2))
+    for x, y in points:
+        assert np.allclose(view.to_map(*view.to_widget(x, y)), (x, y))
+        assert np.allclose(view.to_widget(*view.to_map(x, y)), (x, y))
+
+
+def test_whole_map_fits_centred():
+    view = Viewport(EXTENT, RECT)
+    assert view.scale == pytest.approx(585 / 692.0)
+    assert np.allclose(view.to_widget(0, 0), (10, 20 + (579 - 378 * view.scale) / 2))
+    assert np.allclose(view.visible(), (0, 0) + EXTENT)
+
+
+def test_zoom_keeps_the_point_under_the_finger():
+    view = Viewport(EXTENT, RECT)
+    before = view.to_map(300, 310)
+    view.zoom_at(2.0, 300, 310)
+    assert view.zoom == 2.0
+    assert np.allclose(view.to_map(300, 310), before)
+
+
+def test_zoom_is_clamped():
+    view = Viewport(EXTENT, RECT, max_scale=4.0)
+    view.zoom_at(0.5, 300, 300)
+    assert view.zoom == 1.0
+    view.zoom_at(100.0, 300, 300)
+    assert view.scale == pytest.approx(4.0)
+
+
+def test_pan_stays_on_the_map():
+    view = Viewport(EXTENT, RECT)
+    view.pan(500, 500) # zoomed out, nothing to pan to
+    assert view.center == (EXTENT[0] / 2.0, EXTENT[1] / 2.0)
+    view.zoom_at(3.0, 300, 300)
+    for dx, dy in ((10000, 0), (-10000, 0), (0, 10000), (0, -10000)):
+        view.pan(dx, dy)
+        assert inside(view, 0, 0, *EXTENT)
+    view.pan(-10000, -10000) # the top right corner
+    x0, y0, x1, y1 = view.visible()
+    assert (x1, y1) == pytest.approx(EXTENT)
+
+
+def test_set_rect_clamps_again():
+    view = Viewport(EXTENT, RECT)
+    view.zoom_at(2.0, 20, 30)
+    view.set_rect((0, 0, 1200, 900)) # the window grew
+    assert inside(view, 0, 0, *EXTENT)
+
+
+def test_one_finger_pans_two_pinch():
+    view = Viewport(EXTENT, RECT)
+    view.zoom_at(2.0, 300, 300)
+    gesture = Gesture(view)
+    assert gesture.down(1, 300, 300)
+    under = view.to_map(300, 300)
+    assert gesture.move(1, 320, 290)
+    assert np.allclose(view.to_map(320, 290), under) # the map moves with the finger
+
+    assert gesture.down(2, 400, 290)
+    assert not gesture.down(3, 100, 100) # a third finger is not part of it
+    assert len(gesture) == 2
+    zoom = view.zoom
+    assert gesture.move(2, 480, 290) # fingers 160 apart instead of 80
+    assert view.zoom == pytest.approx(2 * zoom)
+
+    assert not gesture.move(3, 0, 0)
+    assert gesture.up(1) and gesture.up(2) and not gesture.up(3)
+    assert len(gesture) == 0
@@ -0,0 +1,49 @@
+import pytest
+
+from swarm_interface.worker import Throttle
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.due = [] # (time, callback)
+
+    def __call__(self):
+        return self.now
+
+    def schedule(self, callback, delay):
+        self.due.append((self.now + delay, callback))
+
+    def advance(self, seconds):
+        self.now += seconds
+        for entry in [e for e in self.due if e[0] <= self.now]:
+            self.due.remove(entry)
+            entry[1]()
+
+
+def throttled(rate):
+    clock, calls = FakeClock(), []
+    throttle = Throttle(lambda: calls.append(clock.now), rate, clock.schedule, clock)
+    return clock, calls, throttle
+
+
+def test_folds_calls_into_a_trailing_one():
+    clock, calls, throttle = throttled(5.0)
+    for _ in range(4):
+        throttle()
+        clock.advance(0.05)
+    clock.advance(0.2)
+    assert calls == [0.0, pytest.approx(0.2)]
+
+
+def test_zero_rate_is_unthrottled():
+    clock, calls, throttle = throttled(0)
+    for _ in range(3):
+        throttle()
+    assert calls == [0.0] * 3 and clock.due == []
+
+
+@pytest.mark.parametrize('rate', [-1.0, float('nan')])
+def test_invalid_rates(rate):
+    with pytest.raises(ValueError):
+        throttled(rate)